@@ -3,7 +3,8 @@
 # See LICENSE file in the repository root for full license text.
 
 import os
-from flask import Flask, render_template
+from flask import Flask, Response, render_template
+from utils.metrics import read_metrics
 
 app = Flask(__name__)
 
@@ -12,6 +13,14 @@ def welcome():
     # Render the welcome page with animated "Team VIJAY KUMAR" text
     return render_template("welcome.html")
 
+@app.route("/metrics")
+def metrics():
+    # The bot runs in a separate process and exports its registry to a shared file
+    text = read_metrics()
+    if text is None:
+        return Response("# bot has not published metrics yet\n", status=503, mimetype="text/plain")
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     # Default to port 8000 if PORT is not set in the environment
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,112 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import copy
+import os
+
+# shared_client builds real client objects at import time; they never connect here
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "0" * 32)
+os.environ.setdefault("BOT_TOKEN", "1:benchmark")
+os.environ.setdefault("MONGO_DB", "mongodb://127.0.0.1:1")
+
+
+class FakeCollection:
+    """Just enough of a motor collection for the user-settings helpers."""
+
+    def __init__(self, docs=()):
+        self.docs = {d["user_id"]: copy.deepcopy(d) for d in docs}
+
+    async def find_one(self, query, *args, **kwargs):
+        return self.docs.get(query.get("user_id"))
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query.get("user_id"))
+        if doc is None and upsert:
+            doc = self.docs[query["user_id"]] = dict(query)
+        if doc is not None:
+            doc.update(update.get("$set", {}))
+            for key in update.get("$unset", {}):
+                doc.pop(key, None)
+
+
+class FakeMessage:
+    def __init__(self):
+        self.edits = 0
+
+    async def edit(self, *args, **kwargs):
+        self.edits += 1
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class FakeUpdate:
+    """A private text message as the Pyrogram handlers see it."""
+
+    def __init__(self, user_id, text):
+        self.from_user = FakeUser(user_id)
+        self.text = text
+        self.caption = None
+        self.photo = None
+        self.replies = 0
+
+    async def reply(self, *args, **kwargs):
+        self.replies += 1
+
+
+class FakeClient:
+    """Stands in for both the Pyrogram and Telethon clients; records calls only."""
+
+    def __init__(self):
+        self.calls = 0
+        self.me = FakeUser(0)
+        self.me.username = "benchmark_bot"
+
+    async def edit_message_text(self, *args, **kwargs):
+        self.calls += 1
+
+    async def send_message(self, *args, **kwargs):
+        self.calls += 1
+        return FakeMessage()
+
+
+class FakeTransport:
+    """Upload transport that accepts every part immediately; isolates the uploader's own overhead."""
+
+    label = "fake"
+
+    def __init__(self, workers):
+        from utils.uploader import MAX_PARTS
+        self.workers = workers
+        self.bytes = 0
+        self.max_parts = MAX_PARTS
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def send_part(self, worker, file_id, index, total, data, is_big):
+        self.bytes += len(data)
+
+
+def rule_set(size: int) -> dict:
+    """A user document with `size` replacement rules and delete words."""
+    return {
+        "user_id": 1,
+        "replacement_words": {f"word{i}": f"repl{i}" for i in range(size)},
+        "delete_words": [f"drop{i}" for i in range(size)],
+        "rename_tag": "@team_spy_pro",
+    }
+
+
+def install_fake_db(docs):
+    """Point the Mongo helpers in utils.func at an in-memory collection."""
+    import utils.func as func
+    func.users_collection = FakeCollection(docs)
+    return func.users_collection
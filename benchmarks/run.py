@@ -0,0 +1,343 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""Micro-benchmarks for the per-file hot paths.
+
+Usage (from the repository root):
+    python -m benchmarks.run                 # run and compare against baseline.json
+    python -m benchmarks.run --save          # run and store the results as the new baseline
+    python -m benchmarks.run -k progress     # only benchmarks whose name contains "progress"
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+
+from benchmarks import fakes
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+BENCHMARKS = []
+
+
+def bench(name):
+    """Register a benchmark; the decorated function returns the callable to time."""
+    def decorator(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return decorator
+
+
+LINKS = [
+    "https://t.me/c/1234567890/42",
+    "https://t.me/some_public_channel/1337",
+    "https://t.me/c/987654321/7",
+    "https://example.com/not/a/telegram/link",
+]
+CAPTION = " ".join(f"word{i} drop{i} keep{i}" for i in range(60))
+
+
+@bench("process_text_with_rules[rules=200]")
+def _process_text(ctx):
+    from utils.func import process_text_with_rules
+    fakes.install_fake_db([fakes.rule_set(200)])
+    return lambda: process_text_with_rules(1, CAPTION)
+
+
+@bench("rename_file[rules=200]")
+def _rename(ctx):
+    from plugins.settings import rename_file
+    fakes.install_fake_db([fakes.rule_set(200)])
+    src = os.path.join(ctx["tmp"], "word1 drop2 sample video.mkv")
+    open(src, "wb").close()
+
+    async def run():
+        renamed = await rename_file(src, 1, None)
+        os.rename(renamed, src)
+    return run
+
+
+@bench("E[link parsing]")
+def _link_parse(ctx):
+    from plugins.batch import E
+
+    def run():
+        for link in LINKS:
+            E(link)
+    return run
+
+
+@bench("PRIVATE_LINK_PATTERN.match")
+def _private_pattern(ctx):
+    from utils.func import PRIVATE_LINK_PATTERN
+
+    def run():
+        for link in LINKS:
+            PRIVATE_LINK_PATTERN.match(link)
+    return run
+
+
+@bench("K[progress render]")
+def _pyro_progress(ctx):
+    from plugins.batch import K, PROGRESS
+    client = fakes.FakeClient()
+    total = 500 * 1024 * 1024
+    start = time.time() - 5
+    state = {"n": 0}
+
+    async def run():
+        state["n"] = (state["n"] + 1) % 100
+        PROGRESS.clear()
+        await K(total * state["n"] // 100, total, client, 1, 2, start)
+    return run
+
+
+@bench("text update[legacy: 3 handlers]")
+def _legacy_text_routing(ctx):
+    # The per-update filtering every plain message went through before the router:
+    # batch's and login's Pyrogram filters, then the Telethon settings catch-all
+    try:
+        from pyrogram import filters
+    except ImportError:
+        return None
+    steps, conversations, batch = {}, {}, {1: {"step": "count"}}
+    in_login = filters.create(lambda _, __, m: m.from_user.id in steps)
+    batch_filter = filters.text & ~in_login & ~filters.command(
+        ['start', 'batch', 'cancel', 'login', 'logout', 'stop', 'set', 'pay', 'redeem', 'gencode', 'single'])
+    login_filter = in_login & filters.text & ~filters.command(
+        ['start', 'batch', 'cancel', 'login', 'logout', 'stop', 'set', 'pay', 'redeem', 'gencode'])
+    client, update = fakes.FakeClient(), fakes.FakeUpdate(1, "25")
+    client.loop, client.executor = asyncio.get_running_loop(), None
+
+    async def run():
+        if await batch_filter(client, update) and update.from_user.id in batch:
+            await update.reply("ok")
+        await login_filter(client, update)
+        if update.from_user.id not in conversations or update.text.startswith('/'):
+            return
+    return run
+
+
+@bench("text update[router]")
+def _router_text_routing(ctx):
+    from utils import router
+
+    @router.flow("benchmark")
+    async def handler(client, message, conversation):
+        await message.reply("ok")
+
+    router.start(1, "benchmark", step="count")
+    client, update = fakes.FakeClient(), fakes.FakeUpdate(1, "25")
+
+    async def run():
+        if router.wants(update):
+            await router.dispatch(client, update)
+    return run
+
+
+@bench("progress_callback")
+def _ytdl_progress(ctx):
+    from plugins.ytdl import progress_callback
+    total = 700 * 1024 * 1024
+    state = {"done": 0}
+
+    def run():
+        state["done"] = (state["done"] + 4 * 1024 * 1024) % total
+        progress_callback(state["done"], total, 1)
+    return run
+
+
+@bench("DownloadProgress[yt-dlp hook]")
+def _ytdl_hook(ctx):
+    from plugins.ytdl import DownloadProgress
+    tracker = DownloadProgress(fakes.FakeMessage(), interval=0)
+    total = 700 * 1024 * 1024
+    state = {"done": 0}
+
+    async def run():
+        state["done"] = (state["done"] + 4 * 1024 * 1024) % total
+        tracker({
+            "status": "downloading", "downloaded_bytes": state["done"], "total_bytes": total,
+            "speed": 8 * 1024 * 1024, "eta": 42, "fragment_index": 3, "fragment_count": 120,
+        })
+        await tracker.pending
+    return run
+
+
+@bench("progress_bar")
+def _progress_bar(ctx):
+    from plugins.ytdl import progress_bar
+    message = fakes.FakeMessage()
+    total = 900 * 1024 * 1024
+    start = time.time() - 10
+
+    return lambda: progress_bar(total // 3, total, "Uploading", message, start)
+
+
+@bench("humanbytes")
+def _humanbytes(ctx):
+    from plugins.ytdl import humanbytes
+    sizes = [0, 512, 10 * 1024, 5 * 1024 ** 2, 3 * 1024 ** 3, 2 * 1024 ** 4]
+
+    def run():
+        for size in sizes:
+            humanbytes(size)
+    return run
+
+
+@bench("upload_parts[64MB]")
+def _upload_parts(ctx):
+    from utils.uploader import upload_parts
+    path = os.path.join(ctx["tmp"], "upload.bin")
+    with open(path, "wb") as f:
+        f.write(os.urandom(64 * 1024 * 1024))
+
+    async def run():
+        await upload_parts(fakes.FakeTransport, path)
+    return run
+
+
+@bench("get_video_metadata[sample.mp4]")
+def _video_metadata(ctx):
+    from utils.func import get_video_metadata
+    sample = ctx.get("sample")
+    if not sample:
+        return None
+    return lambda: get_video_metadata(sample)
+
+
+def make_sample(tmp):
+    """Generate a short H.264 clip with ffmpeg; None if ffmpeg is unavailable."""
+    if not shutil.which("ffmpeg"):
+        return None
+    path = os.path.join(tmp, "sample.mp4")
+    cmd = [
+        "ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=duration=5:size=640x360:rate=25",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", path, "-y"
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    return path if result.returncode == 0 and os.path.exists(path) else None
+
+
+async def _call(fn):
+    result = fn()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def measure(fn, min_time):
+    """Return (ops/sec, peak bytes allocated per op)."""
+    for _ in range(3):
+        await _call(fn)
+
+    iterations, batch = 0, 1
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for _ in range(batch):
+            await _call(fn)
+        iterations += batch
+        batch = min(batch * 2, 4096)
+        elapsed = time.perf_counter() - start
+    ops = iterations / elapsed
+
+    samples = 20
+    tracemalloc.start()
+    peaks = []
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        await _call(fn)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    tracemalloc.stop()
+    peaks.sort()
+    return ops, peaks[len(peaks) // 2]
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE) as f:
+        return json.load(f)
+
+
+async def run(args):
+    """Run the selected benchmarks; returns (results, names of the benchmarks that raised)."""
+    results, failed = {}, []
+    with tempfile.TemporaryDirectory() as tmp:
+        ctx = {"tmp": tmp, "sample": make_sample(tmp)}
+        for name, setup in BENCHMARKS:
+            if args.k and args.k not in name:
+                continue
+            # One broken benchmark is reported and skipped instead of ending the run
+            try:
+                fn = setup(ctx)
+                if fn is None:
+                    print(f"{name:<40} skipped")
+                    continue
+                ops, alloc = await measure(fn, args.time)
+            except Exception as e:
+                print(f"{name:<40} FAILED: {type(e).__name__}: {e}")
+                traceback.print_exc()
+                failed.append(name)
+                continue
+            results[name] = {"ops_per_sec": round(ops, 2), "alloc_bytes": alloc}
+    return results, failed
+
+
+def report(results, baseline, tolerance):
+    regressions = []
+    print(f"{'benchmark':<40} {'ops/sec':>14} {'alloc/op':>10} {'vs baseline':>12}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        delta = ""
+        if base and base.get("ops_per_sec"):
+            change = r["ops_per_sec"] / base["ops_per_sec"] - 1
+            delta = f"{change:+.1%}"
+            if change < -tolerance:
+                regressions.append(name)
+                delta += " !"
+        print(f"{name:<40} {r['ops_per_sec']:>14,.1f} {r['alloc_bytes']:>9}B {delta:>12}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--time", type=float, default=1.0, help="seconds to spend per benchmark")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed ops/sec drop before failing")
+    parser.add_argument("--save", action="store_true", help="write results to baseline.json")
+    args = parser.parse_args()
+
+    results, failed = asyncio.run(run(args))
+    baseline = load_baseline()
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_FILE}")
+    elif not baseline:
+        print("No baseline yet; run with --save to record one.")
+
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+    if regressions and not args.save:
+        print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+    if failed or (regressions and not args.save):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
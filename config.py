@@ -37,3 +37,89 @@ FORCE_SUB = int(os.getenv("FORCE_SUB", "-1002558537382")) # optional with -100
 
 YT_COOKIES = os.getenv("YT_COOKIES", YTUB_COOKIES)
 INSTA_COOKIES = os.getenv("INSTA_COOKIES", INST_COOKIES)
+
+# Metrics are written by the bot process and served by the Flask app
+METRICS_FILE = os.getenv("METRICS_FILE", "/tmp/spybot_metrics.prom")
+METRICS_INTERVAL = int(os.getenv("METRICS_INTERVAL", "15"))
+
+# Per-stage tracing of deliveries (structured log + percentiles)
+TRACE_STAGES = os.getenv("TRACE_STAGES", "false").lower() in ("1", "true", "yes")
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE", "")
+TRACE_SAMPLES = int(os.getenv("TRACE_SAMPLES", "512"))
+
+# Shared HTTP client for thumbnails and other auxiliary fetches
+HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+# How /dl splits files over 2GB: "video" (playable keyframe cuts) or "bytes" (raw parts)
+SPLIT_MODE = os.getenv("SPLIT_MODE", "video").lower()
+
+# /dl and /adl job queue: workers drain the queue, stage limits cap concurrent work
+YTDL_WORKERS = int(os.getenv("YTDL_WORKERS", "2"))
+YTDL_EXTRACT_LIMIT = int(os.getenv("YTDL_EXTRACT_LIMIT", "2"))
+YTDL_FFMPEG_LIMIT = int(os.getenv("YTDL_FFMPEG_LIMIT", "1"))
+YTDL_UPLOAD_LIMIT = int(os.getenv("YTDL_UPLOAD_LIMIT", "2"))
+YTDL_QUEUE_MAX = int(os.getenv("YTDL_QUEUE_MAX", "50"))
+
+# Run yt-dlp in supervised child processes instead of threads
+YTDL_PROCESS_POOL = os.getenv("YTDL_PROCESS_POOL", "false").lower() in ("1", "true", "yes")
+YTDL_EXTRACT_TIMEOUT = int(os.getenv("YTDL_EXTRACT_TIMEOUT", "120"))
+YTDL_DOWNLOAD_TIMEOUT = int(os.getenv("YTDL_DOWNLOAD_TIMEOUT", "3600"))
+YTDL_MEMORY_LIMIT_MB = int(os.getenv("YTDL_MEMORY_LIMIT_MB", "1024"))
+
+# Reuse yt-dlp extraction results for repeat links (seconds; 0 disables)
+INFO_CACHE_TTL = int(os.getenv("INFO_CACHE_TTL", "900"))
+INFO_CACHE_SIZE = int(os.getenv("INFO_CACHE_SIZE", "256"))
+
+# Keep sent /dl and /adl media for resending (days since last hit)
+MEDIA_CACHE_DAYS = int(os.getenv("MEDIA_CACHE_DAYS", "30"))
+
+# Per-job scratch directories (point SCRATCH_DIR at a tmpfs such as /dev/shm/spybot for RAM-backed I/O)
+SCRATCH_DIR = os.getenv("SCRATCH_DIR", "/tmp/spybot-scratch")
+SCRATCH_BUDGET_MB = int(os.getenv("SCRATCH_BUDGET_MB", "20480"))
+
+# /dl playlist mode: entries downloaded at once per job, and the most entries taken from one link
+PLAYLIST_CONCURRENCY = int(os.getenv("PLAYLIST_CONCURRENCY", "3"))
+PLAYLIST_MAX_ITEMS = int(os.getenv("PLAYLIST_MAX_ITEMS", "50"))
+
+# yt-dlp download phase: parallel HLS/DASH fragments and seconds between progress edits
+YTDL_FRAGMENTS = int(os.getenv("YTDL_FRAGMENTS", "4"))
+YTDL_PROGRESS_INTERVAL = int(os.getenv("YTDL_PROGRESS_INTERVAL", "5"))
+
+# Parallel part uploader used by every Telethon and Pyrogram upload
+UPLOAD_MAX_WORKERS = int(os.getenv("UPLOAD_MAX_WORKERS", "8"))
+UPLOAD_MB_PER_WORKER = int(os.getenv("UPLOAD_MB_PER_WORKER", "16"))
+UPLOAD_PART_RETRIES = int(os.getenv("UPLOAD_PART_RETRIES", "5"))
+
+# Extra premium userbot sessions, space or comma separated (STRING, if set, is used first)
+STRINGS = os.getenv("STRINGS", "").replace(",", " ").split()
+# Network failures in a row before a session is rested, and the first rest in seconds (doubles each time)
+USERBOT_FAIL_LIMIT = int(os.getenv("USERBOT_FAIL_LIMIT", "3"))
+USERBOT_BACKOFF = int(os.getenv("USERBOT_BACKOFF", "60"))
+
+# Process role: "all" does everything here; "dispatcher" only handles commands and queues /dl and /adl jobs;
+# "worker" runs queued jobs without receiving updates (batch, login and settings stay with the dispatcher)
+ROLE = os.getenv("ROLE", "all").lower()
+# Job queue: empty runs jobs in this process, "mongo" shares them between hosts, "local" is an in-memory stand-in
+JOB_BROKER = os.getenv("JOB_BROKER", "" if ROLE == "all" else "mongo").lower()
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Must differ between workers on one host; it names their session files
+WORKER_NAME = os.getenv("WORKER_NAME", os.uname().nodename)
+
+# Per-user state: write conversations through to MongoDB so a restart does not drop them, and seconds between expiry sweeps
+STATE_PERSIST = os.getenv("STATE_PERSIST", "false").lower() in ("1", "true", "yes")
+STATE_SWEEP_INTERVAL = int(os.getenv("STATE_SWEEP_INTERVAL", "60"))
+
+# Logins: seconds a login may sit idle before its temporary client is disconnected, and how many may hold one at once
+LOGIN_TIMEOUT = int(os.getenv("LOGIN_TIMEOUT", "600"))
+MAX_PENDING_LOGINS = int(os.getenv("MAX_PENDING_LOGINS", "20"))
+
+# Bandwidth: daily MB delivered per user by tier (0 = unlimited), per-user transfer cap in KB/s (0 = off) and seconds between counter flushes
+FREE_DAILY_QUOTA_MB = int(os.getenv("FREE_DAILY_QUOTA_MB", "0"))
+PREMIUM_DAILY_QUOTA_MB = int(os.getenv("PREMIUM_DAILY_QUOTA_MB", "0"))
+USER_RATE_LIMIT_KBPS = int(os.getenv("USER_RATE_LIMIT_KBPS", "0"))
+BANDWIDTH_FLUSH_INTERVAL = int(os.getenv("BANDWIDTH_FLUSH_INTERVAL", "30"))
+
+# Seconds between flushes of the hourly/daily usage rollups behind /stats
+ROLLUP_FLUSH_INTERVAL = int(os.getenv("ROLLUP_FLUSH_INTERVAL", "60"))
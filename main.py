@@ -2,15 +2,28 @@
 # Licensed under the GNU General Public License v3.0.  
 # See LICENSE file in the repository root for full license text.
 
+import time
+BOOT = time.perf_counter()  # before the imports below, so their cost shows up in the timing report
+
 import asyncio
-from shared_client import start_client
+from utils.metrics import publish_metrics
+from utils.scratch import scratch
+from utils.startup import phase, record, report
+from utils.state import store
 import importlib
 import os
 import sys
 
+record("imports", time.perf_counter() - BOOT)
+
 async def load_and_run_plugins():
-    # Start the shared client
-    client, app, userbot = await start_client()
+    # Imported here rather than at the top: spawned yt-dlp workers re-import this module
+    # as __mp_main__, and must not build the bot clients or open their session files
+    with phase("imports:clients"):
+        from shared_client import start_client
+    # Start the shared clients while orphaned scratch directories are removed
+    with phase("clients"):
+        (client, app, userbot), _, _ = await asyncio.gather(start_client(), scratch.sweep(), store.load())
     
     plugin_dir = "plugins"
     if not os.path.isdir(plugin_dir):
@@ -21,20 +34,31 @@ async def load_and_run_plugins():
 
     for plugin in plugins:
         try:
-            module = importlib.import_module(f"plugins.{plugin}")
-            func_name = f"run_{plugin}_plugin"
-            if hasattr(module, func_name):
-                print(f"Running {plugin} plugin...")
-                await getattr(module, func_name)()
-            else:
-                print(f"Plugin '{plugin}' does not have '{func_name}' function.")
+            with phase(f"plugin:{plugin}"):
+                module = importlib.import_module(f"plugins.{plugin}")
+                func_name = f"run_{plugin}_plugin"
+                if hasattr(module, func_name):
+                    print(f"Running {plugin} plugin...")
+                    await getattr(module, func_name)()
+                else:
+                    print(f"Plugin '{plugin}' does not have '{func_name}' function.")
         except Exception as e:
             print(f"Error loading plugin '{plugin}': {e}")
 
 async def main():
     await load_and_run_plugins()
-    while True:
-        await asyncio.sleep(1)
+    report(time.perf_counter() - BOOT)
+    metrics_task = asyncio.create_task(publish_metrics())
+    try:
+        while True:
+            await asyncio.sleep(1)
+    finally:
+        # asyncio.run cancels main() on Ctrl+C; stop the exporter before the loop closes
+        metrics_task.cancel()
+        await asyncio.gather(metrics_task, return_exceptions=True)
+        # Only close the pooled HTTP session if something used it; importing it here would load aiohttp
+        if "utils.http_client" in sys.modules:
+            await sys.modules["utils.http_client"].close_session()
 
 if __name__ == "__main__":
     print("Starting clients ...")
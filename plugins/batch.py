@@ -5,16 +5,24 @@
 import os as O, re as R, time as T, asyncio
 from pyrogram import Client as C, filters as F
 from pyrogram.types import Message as M
-from config import API_ID as A, API_HASH as H, LOG_GROUP, STRING
+from config import API_ID as A, API_HASH as H, LOG_GROUP
 from utils.func import get_user_data
 from utils.func import screenshot, thumbnail, get_video_metadata, get_user_data_key, process_text_with_rules, is_premium_user
-from shared_client import app as X
+from shared_client import app as X, userbots
 from plugins.settings import rename_file
-from utils.custom_filters import login_in_progress
 from plugins.start import subscribe
+from utils.metrics import BYTES, JOBS_QUEUED, track_job, cache_result, count_flood_wait
+from utils.trace import span, new_job_id
+from utils.scratch import scratch
+from utils.uploader import install_pyrogram_uploader
+from utils.userbots import media_dc
+from utils import router
+from utils.state import store
+from utils import bandwidth, rollups
 
-Y = None if not STRING else __import__('shared_client').userbot
-Z, W, PROGRESS = {}, {}, {}
+# Active batch/single tasks (cancel flag, progress message) and K's last rendered step per progress message
+W = store.namespace('batch_tasks', ttl=6 * 3600)
+PROGRESS = store.namespace('batch_progress', ttl=3600, max_size=10000)
 
 def E(L):
     """Extract chat ID and message ID from Telegram links"""
@@ -142,10 +150,16 @@ async def K(c, t, C, h, m, start_time):
         if p >= 100:
             PROGRESS.pop(m, None)
 
-async def V(C, U, m, d, link_type, u):
+# Prefixes of the results V returns when a message could not be delivered
+V_FAILED = ('Error', 'Failed')
+
+async def V(C, U, m, d, link_type, u, job=None):
     """Process and forward media with direct send for public groups"""
+    job = job or new_job_id()
+    ws = Y = None
     try:
-        configured_chat = await get_user_data_key(d, 'chat_id', None)
+        with span('settings', job, u):
+            configured_chat = await get_user_data_key(d, 'chat_id', None)
         target_chat_id = d
         reply_to_message_id = None
         if configured_chat:
@@ -156,22 +170,42 @@ async def V(C, U, m, d, link_type, u):
             else:
                 target_chat_id = int(configured_chat)
         if m.media:
-            original_text = m.caption if m.caption else ''
-            processed_text = await process_text_with_rules(d, original_text)
-            user_caption = await get_user_data_key(d, 'caption', '')
-            if processed_text and user_caption:
-                final_text = f'{processed_text}\n\n{user_caption}'
-            elif user_caption:
-                final_text = user_caption
-            else:
-                final_text = processed_text
+            with span('caption', job, u):
+                original_text = m.caption if m.caption else ''
+                processed_text = await process_text_with_rules(d, original_text)
+                user_caption = await get_user_data_key(d, 'caption', '')
+                if processed_text and user_caption:
+                    final_text = f'{processed_text}\n\n{user_caption}'
+                elif user_caption:
+                    final_text = user_caption
+                else:
+                    final_text = processed_text
             if link_type == 'public':
-                if await send_via_file_id(C, m, target_chat_id, final_text, reply_to_message_id):
+                with span('file_id_send', job, u):
+                    sent = await send_via_file_id(C, m, target_chat_id, final_text, reply_to_message_id)
+                cache_result('file_id', sent)
+                if sent:
                     return 'Media sent directly via file_id.'
+            media_obj = getattr(m, m.media.value, None)
+            if (getattr(media_obj, 'file_size', 0) or 0) > 2 * 1024 ** 3:
+                # Needs a premium upload: take the least busy session, preferably on the media's DC
+                Y = userbots.acquire(media_dc(media_obj))
+                if Y and Y is not U and link_type == 'public' and userbots.member(U):
+                    # A public post can be fetched by any pool session, so let that one download it too
+                    try:
+                        own = await Y.get_messages(m.chat.username or m.chat.id, m.id)
+                        if own and not own.empty and own.media:
+                            m, U = own, Y
+                    except Exception as e:
+                        print(f'Large file session could not fetch the message: {e}')
+            ws = await scratch.open(job, getattr(media_obj, 'file_size', 0))
             st = T.time()
             progress_msg = await C.send_message(d, 'Downloading...')
             W[u] = {'cancel': False, 'progress': progress_msg.id}
-            downloaded_file = await U.download_media(m, progress=K, progress_args=(C, d, progress_msg.id, st))
+            with span('download', job, u):
+                downloaded_file = await U.download_media(
+                    m, file_name=ws.path + O.sep, progress=bandwidth.track(K, u, 'download'), progress_args=(C, d, progress_msg.id, st)
+                )
             if W.get(u, {}).get('cancel'):
                 await C.edit_message_text(d, progress_msg.id, 'Canceled.')
                 if downloaded_file and O.path.exists(downloaded_file):
@@ -182,124 +216,140 @@ async def V(C, U, m, d, link_type, u):
                 await C.edit_message_text(d, progress_msg.id, 'Failed.')
                 W.pop(u, None)
                 return 'Failed.'
-            renamed_file = await rename_file(downloaded_file, d, progress_msg)
+            with span('rename', job, u):
+                renamed_file = await rename_file(downloaded_file, d, progress_msg)
             if not renamed_file or not O.path.exists(renamed_file):
                 await C.edit_message_text(d, progress_msg.id, 'Failed to rename file.')
                 W.pop(u, None)
                 return 'Failed.'
-            file_size = O.path.getsize(renamed_file) / (1024 * 1024 * 1024)
+            file_bytes = O.path.getsize(renamed_file)
+            BYTES.inc(file_bytes, direction='download')
+            up = bandwidth.track(K, u, 'upload')
+            file_size = file_bytes / (1024 * 1024 * 1024)
             th = thumbnail(d)
+            if file_size > 2:
+                Y = Y or userbots.acquire()
             if file_size > 2 and Y:
                 await C.edit_message_text(d, progress_msg.id, 'File is larger than 2GB. Sending via alternative method...')
                 await update_dialogs(Y)
-                mtd = await get_video_metadata(renamed_file)
+                with span('probe', job, u):
+                    mtd = await get_video_metadata(renamed_file)
                 duration, h, w = mtd['duration'], mtd['width'], mtd['height']
-                th = await screenshot(renamed_file, duration, d)
-                send_funcs = {
-                    'video': Y.send_video,
-                    'video_note': Y.send_video_note,
-                    'voice': Y.send_voice,
-                    'audio': Y.send_audio,
-                    'photo': Y.send_photo,
-                    'document': Y.send_document
-                }
-                sent_message = None
-                for media_type, func in send_funcs.items():
-                    if renamed_file.endswith('.mp4'):
-                        media_type = 'video'
-                    if getattr(m, media_type, None):
-                        kwargs = {}
-                        if media_type == 'video':
-                            kwargs = dict(thumb=th, duration=duration, height=h, width=w)
-                        elif media_type == 'audio':
-                            kwargs = dict(thumb=th)
-                        elif media_type == 'photo':
-                            kwargs = dict()
-                        elif media_type == 'document':
-                            kwargs = dict(thumb=th)
-                        sent_message = await func(
+                with span('screenshot', job, u):
+                    th = await screenshot(renamed_file, duration, d)
+                with span('upload', job, u, bytes=file_bytes):
+                    send_funcs = {
+                        'video': Y.send_video,
+                        'video_note': Y.send_video_note,
+                        'voice': Y.send_voice,
+                        'audio': Y.send_audio,
+                        'photo': Y.send_photo,
+                        'document': Y.send_document
+                    }
+                    sent_message = None
+                    for media_type, func in send_funcs.items():
+                        if renamed_file.endswith('.mp4'):
+                            media_type = 'video'
+                        if getattr(m, media_type, None):
+                            kwargs = {}
+                            if media_type == 'video':
+                                kwargs = dict(thumb=th, duration=duration, height=h, width=w)
+                            elif media_type == 'audio':
+                                kwargs = dict(thumb=th)
+                            elif media_type == 'photo':
+                                kwargs = dict()
+                            elif media_type == 'document':
+                                kwargs = dict(thumb=th)
+                            sent_message = await func(
+                                LOG_GROUP,
+                                renamed_file,
+                                caption=final_text if m.caption and media_type not in ['video_note', 'voice'] else None,
+                                reply_to_message_id=reply_to_message_id,
+                                progress=up,
+                                progress_args=(C, d, progress_msg.id, st),
+                                **kwargs
+                            )
+                            break
+                    if not sent_message:
+                        sent_message = await Y.send_document(
                             LOG_GROUP,
                             renamed_file,
-                            caption=final_text if m.caption and media_type not in ['video_note', 'voice'] else None,
+                            thumb=th,
+                            caption=final_text if m.caption else None,
                             reply_to_message_id=reply_to_message_id,
-                            progress=K,
-                            progress_args=(C, d, progress_msg.id, st),
-                            **kwargs
+                            progress=up,
+                            progress_args=(C, d, progress_msg.id, st)
                         )
-                        break
-                if not sent_message:
-                    sent_message = await Y.send_document(
-                        LOG_GROUP,
-                        renamed_file,
-                        thumb=th,
-                        caption=final_text if m.caption else None,
-                        reply_to_message_id=reply_to_message_id,
-                        progress=K,
-                        progress_args=(C, d, progress_msg.id, st)
-                    )
+                BYTES.inc(file_bytes, direction='upload')
                 if renamed_file and O.path.exists(renamed_file):
                     O.remove(renamed_file)
                 await C.delete_messages(d, progress_msg.id)
                 W.pop(u, None)
                 return 'Done (Large file sent via alternative method).'
             await C.edit_message_text(d, progress_msg.id, 'Uploading...')
-            if m.video or O.path.splitext(renamed_file)[1].lower() == '.mp4':
-                mtd = await get_video_metadata(renamed_file)
+            is_video = m.video or O.path.splitext(renamed_file)[1].lower() == '.mp4'
+            if is_video:
+                with span('probe', job, u):
+                    mtd = await get_video_metadata(renamed_file)
                 duration, h, w = mtd['duration'], mtd['width'], mtd['height']
-                th = await screenshot(renamed_file, duration, d)
-                await C.send_video(
-                    target_chat_id,
-                    video=renamed_file,
-                    caption=final_text if m.caption else None,
-                    thumb=th,
-                    width=w,
-                    height=h,
-                    duration=duration,
-                    progress=K,
-                    progress_args=(C, d, progress_msg.id, st),
-                    reply_to_message_id=reply_to_message_id
-                )
-            elif m.video_note:
-                await C.send_video_note(
-                    target_chat_id,
-                    video_note=renamed_file,
-                    progress=K,
-                    progress_args=(C, d, progress_msg.id, st),
-                    reply_to_message_id=reply_to_message_id
-                )
-            elif m.voice:
-                await C.send_voice(
-                    target_chat_id,
-                    renamed_file,
-                    progress=K,
-                    progress_args=(C, d, progress_msg.id, st),
-                    reply_to_message_id=reply_to_message_id
-                )
-            elif m.sticker:
-                await C.send_sticker(
-                    target_chat_id,
-                    m.sticker.file_id,
-                    reply_to_message_id=reply_to_message_id
-                )
-            elif m.audio:
-                await C.send_audio(
-                    target_chat_id,
-                    audio=renamed_file,
-                    caption=final_text if m.caption else None,
-                    thumb=th,
-                    progress=K,
-                    progress_args=(C, d, progress_msg.id, st),
-                    reply_to_message_id=reply_to_message_id
-                )
-            elif m.photo:
-                await C.send_photo(
-                    target_chat_id,
-                    photo=renamed_file,
-                    caption=final_text if m.caption else None,
-                    progress=K,
-                    progress_args=(C, d, progress_msg.id, st),
-                    reply_to_message_id=reply_to_message_id
-                )
+                with span('screenshot', job, u):
+                    th = await screenshot(renamed_file, duration, d)
+            with span('upload', job, u, bytes=file_bytes):
+                if is_video:
+                    await C.send_video(
+                        target_chat_id,
+                        video=renamed_file,
+                        caption=final_text if m.caption else None,
+                        thumb=th,
+                        width=w,
+                        height=h,
+                        duration=duration,
+                        progress=up,
+                        progress_args=(C, d, progress_msg.id, st),
+                        reply_to_message_id=reply_to_message_id
+                    )
+                elif m.video_note:
+                    await C.send_video_note(
+                        target_chat_id,
+                        video_note=renamed_file,
+                        progress=up,
+                        progress_args=(C, d, progress_msg.id, st),
+                        reply_to_message_id=reply_to_message_id
+                    )
+                elif m.voice:
+                    await C.send_voice(
+                        target_chat_id,
+                        renamed_file,
+                        progress=up,
+                        progress_args=(C, d, progress_msg.id, st),
+                        reply_to_message_id=reply_to_message_id
+                    )
+                elif m.sticker:
+                    await C.send_sticker(
+                        target_chat_id,
+                        m.sticker.file_id,
+                        reply_to_message_id=reply_to_message_id
+                    )
+                elif m.audio:
+                    await C.send_audio(
+                        target_chat_id,
+                        audio=renamed_file,
+                        caption=final_text if m.caption else None,
+                        thumb=th,
+                        progress=up,
+                        progress_args=(C, d, progress_msg.id, st),
+                        reply_to_message_id=reply_to_message_id
+                    )
+                elif m.photo:
+                    await C.send_photo(
+                        target_chat_id,
+                        photo=renamed_file,
+                        caption=final_text if m.caption else None,
+                        progress=up,
+                        progress_args=(C, d, progress_msg.id, st),
+                        reply_to_message_id=reply_to_message_id
+                    )
+            BYTES.inc(file_bytes, direction='upload')
             if renamed_file and O.path.exists(renamed_file):
                 O.remove(renamed_file)
             await C.delete_messages(d, progress_msg.id)
@@ -309,7 +359,12 @@ async def V(C, U, m, d, link_type, u):
             await C.send_message(d, text=m.text, reply_to_message_id=reply_to_message_id)
             return 'Sent.'
     except Exception as e:
+        count_flood_wait(e, 'bot' if U is None else 'userbot')
         return f'Error: {e}'
+    finally:
+        userbots.release(Y)
+        if ws:
+            await ws.close()
 
 async def get_user_client(user_id):
     """Get or create user client"""
@@ -318,22 +373,18 @@ async def get_user_client(user_id):
     ss_name = f'{user_id}_bot'
     if session_string:
         try:
-            gg = C(ss_name, api_id=A, api_hash=H, session_string=session_string)
+            gg = install_pyrogram_uploader(C(ss_name, api_id=A, api_hash=H, session_string=session_string))
             await gg.start()
             await update_dialogs(gg)
             return gg
         except Exception as e:
             print(f'User client error: {e}')
-            if Y is None:
-                return X
-            if Y:
-                await update_dialogs(Y)
-            return Y
-    elif Y is None:
+    # Pool sessions must be handed back with userbots.release() once the job ends
+    pooled = userbots.acquire()
+    if pooled is None:
         return X
-    if Y:
-        await update_dialogs(Y)
-    return Y
+    await update_dialogs(pooled)
+    return pooled
 
 async def prompt_userbot_login(user_id):
     """Prompt user to add session if default userbot not available"""
@@ -371,25 +422,35 @@ async def send_via_file_id(C, m, target_chat_id, final_text=None, reply_to_messa
 @X.on_message(F.command('batch'))
 async def batch_cmd(C, m: M):
     U = m.from_user.id
+    rollups.seen(U, m.chat.id)
     if not await is_premium_user(U):
         await m.reply_text('You need premium for this operation send /pay to proceed for payment')
         return
     if U in W:
         await m.reply_text('You have an active download in progress. Please wait or use /stop.')
         return
-    Z[U] = {'step': 'start'}
+    exceeded = await bandwidth.quota_exceeded(U)
+    if exceeded:
+        await m.reply_text(exceeded)
+        return
+    router.start(U, 'batch', step='start')
     await m.reply_text('Send start link.')
 
 @X.on_message(F.command('single'))
 async def single_cmd(C, m: M):
     U = m.from_user.id
+    rollups.seen(U, m.chat.id)
     if not await is_premium_user(U):
         await m.reply_text('You need premium for this operation send /pay to proceed for payment')
         return
     if U in W:
         await m.reply_text('You have an active download in progress. Please wait or use /stop.')
         return
-    Z[U] = {'step': 'start_single'}
+    exceeded = await bandwidth.quota_exceeded(U)
+    if exceeded:
+        await m.reply_text(exceeded)
+        return
+    router.start(U, 'batch', step='start_single')
     await m.reply_text('Send the link you want to process.')
 
 @X.on_message(F.command(['cancel', 'stop']))
@@ -401,90 +462,123 @@ async def cancel_cmd(C, m: M):
     else:
         await m.reply_text('No active task.')
 
-@X.on_message(F.text & ~login_in_progress & ~F.command(['start', 'batch', 'cancel', 'login', 'logout', 'stop', 'set', 'pay', 'redeem', 'gencode', 'single']))
-async def text_handler(C, m: M):
+async def cancel_batch(C, m: M, conv):
+    U = m.from_user.id
+    if U in W:
+        W[U]['cancel'] = True
+        await m.reply_text('Cancelling...')
+    else:
+        await m.reply_text('Cancelled.')
+
+# Once a link and count are in, the batch runs inside this conversation and cannot resume
+@router.flow('batch', on_cancel=cancel_batch, resumable=('start', 'start_single', 'count'))
+async def text_handler(C, m: M, conv):
     U = m.from_user.id
-    if U not in Z:
+    if not m.text:
         return
-    S = Z[U].get('step')
+    S = conv.get('step')
     if S == 'start':
         L = m.text
         I, D, link_type = E(L)
         if not I or not D:
             await m.reply_text('Invalid link. Please check the format.')
-            Z.pop(U, None)
+            router.end(U, 'batch')
             return
-        Z[U].update({'step': 'count', 'cid': I, 'sid': D, 'lt': link_type})
+        conv.update({'step': 'count', 'cid': I, 'sid': D, 'lt': link_type})
         await m.reply_text('How many messages?')
     elif S == 'start_single':
         L = m.text
         I, D, link_type = E(L)
         if not I or not D:
             await m.reply_text('Invalid link. Please check the format.')
-            Z.pop(U, None)
+            router.end(U, 'batch')
             return
-        Z[U].update({'step': 'process_single', 'cid': I, 'sid': D, 'lt': link_type})
-        I, S_, link_type = Z[U]['cid'], Z[U]['sid'], Z[U]['lt']
+        conv.update({'step': 'process_single', 'cid': I, 'sid': D, 'lt': link_type})
+        I, S_, link_type = conv['cid'], conv['sid'], conv['lt']
         pt = await m.reply_text('Processing...')
         user_client = await get_user_client(U)
         if not user_client:
             await pt.edit('Cannot proceed without a user client. Add session or wait for admin to add default userbot.')
-            Z.pop(U, None)
+            router.end(U, 'batch')
             return
         if U in W:
             await pt.edit('You already have an active task. Please wait or use /cancel.')
-            Z.pop(U, None)
+            userbots.release(user_client)
+            router.end(U, 'batch')
             return
         W[U] = {'cancel': False}
         try:
-            msg = await J(C, user_client, I, S_, link_type)
-            if msg:
-                res = await V(C, user_client, msg, str(m.chat.id), link_type, U)
-                await pt.edit(f'1/1: {res}')
-            else:
-                await pt.edit(f'1/1: Message not found')
+            with track_job('single') as job:
+                msg = await J(C, user_client, I, S_, link_type)
+                if msg:
+                    res = await V(C, user_client, msg, str(m.chat.id), link_type, U, job=new_job_id())
+                    if res.startswith(V_FAILED):
+                        job.fail()
+                    await pt.edit(f'1/1: {res}')
+                else:
+                    await pt.edit(f'1/1: Message not found')
         except Exception as e:
             await m.reply_text(f'Failed: {str(e)}')
         finally:
+            userbots.release(user_client)
             W.pop(U, None)
-            Z.pop(U, None)
+            router.end(U, 'batch')
     elif S == 'count':
         if not m.text.isdigit():
             await m.reply_text('Enter a valid number.')
             return
         D = str(m.chat.id)
-        Z[U].update({'step': 'process', 'did': D, 'num': int(m.text)})
-        I, S_, N, link_type = Z[U]['cid'], Z[U]['sid'], Z[U]['num'], Z[U]['lt']
-        R_ = 0
+        conv.update({'step': 'process', 'did': D, 'num': int(m.text)})
+        I, S_, N, link_type = conv['cid'], conv['sid'], conv['num'], conv['lt']
+        R_ = F_ = 0
         pt = await m.reply_text('Processing...')
         user_client = await get_user_client(U)
         if not user_client:
             await pt.edit('Cannot proceed without a user client. Add session or wait for admin to add default userbot.')
-            Z.pop(U, None)
+            router.end(U, 'batch')
             return
         if U in W:
             await pt.edit('You already have an active task. Please wait or use /cancel.')
-            Z.pop(U, None)
+            userbots.release(user_client)
+            router.end(U, 'batch')
             return
         W[U] = {'cancel': False}
+        queued = N
+        batch_job = new_job_id()
+        JOBS_QUEUED.inc(queued, type='batch')
         try:
-            for i in range(N):
-                if W.get(U, {}).get('cancel'):
-                    await pt.edit(f'Batch cancelled at {i}/{N}')
-                    break
-                M_ = S_ + i
-                msg = await J(C, user_client, I, M_, link_type)
-                if msg:
-                    res = await V(C, user_client, msg, D, link_type, U)
-                    await pt.edit(f'{i + 1}/{N}: {res}')
-                    if 'Done' in res or 'Copied' in res or 'Sent' in res:
-                        R_ += 1
-                else:
-                    await pt.edit(f'{i + 1}/{N}: Message not found')
-                await asyncio.sleep(10)
+            with track_job('batch') as job:
+                for i in range(N):
+                    if W.get(U, {}).get('cancel'):
+                        await pt.edit(f'Batch cancelled at {i}/{N}')
+                        break
+                    exceeded = await bandwidth.quota_exceeded(U)
+                    if exceeded:
+                        await pt.edit(f'Batch stopped at {i}/{N}: {exceeded}')
+                        break
+                    JOBS_QUEUED.dec(type='batch')
+                    queued -= 1
+                    M_ = S_ + i
+                    msg = await J(C, user_client, I, M_, link_type)
+                    if msg:
+                        res = await V(C, user_client, msg, D, link_type, U, job=f'{batch_job}-{i + 1}')
+                        await pt.edit(f'{i + 1}/{N}: {res}')
+                        if 'Done' in res or 'Copied' in res or 'Sent' in res:
+                            R_ += 1
+                        elif res.startswith(V_FAILED):
+                            F_ += 1
+                    else:
+                        await pt.edit(f'{i + 1}/{N}: Message not found')
+                    await asyncio.sleep(10)
+                # V reports errors instead of raising; a batch where nothing got through failed
+                if F_ and not R_:
+                    job.fail()
             await m.reply_text(f'Batch Completed ✅\nSuccessful: {R_}/{N}')
         except Exception as e:
+            count_flood_wait(e, 'bot')
             await m.reply_text(f'Batch failed: {str(e)}')
         finally:
+            JOBS_QUEUED.dec(queued, type='batch')
+            userbots.release(user_client)
             W.pop(U, None)
-            Z.pop(U, None)
\ No newline at end of file
+            router.end(U, 'batch')
\ No newline at end of file
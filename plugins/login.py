@@ -2,107 +2,224 @@
 # Licensed under the GNU General Public License v3.0.  
 # See LICENSE file in the repository root for full license text.
 
+import asyncio
 import logging
+import time
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.errors import (
     BadRequest, SessionPasswordNeeded, PhoneCodeInvalid, PhoneCodeExpired, MessageNotModified
 )
-from config import API_HASH, API_ID
+from config import API_HASH, API_ID, LOGIN_TIMEOUT, MAX_PENDING_LOGINS
 from shared_client import app as bot
 from utils.func import save_user_session, get_user_data, remove_user_session
-from utils.custom_filters import login_in_progress, set_user_step, get_user_step
+from utils import router
+from utils.metrics import REGISTRY
+from utils.state import store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LOGIN_PENDING = REGISTRY.gauge("spybot_login_pending", "Logins holding a temporary client slot.")
+LOGIN_QUEUED = REGISTRY.gauge("spybot_login_queued", "Logins waiting for a free temporary client slot.")
+LOGIN_OUTCOMES = REGISTRY.counter("spybot_login_outcomes_total", "Finished logins by how they ended.", ["outcome"])
+LOGIN_FUNNEL_SECONDS = REGISTRY.histogram(
+    "spybot_login_funnel_seconds", "Seconds from /login to each stage a login reaches.", ["stage"],
+    buckets=(1, 5, 10, 20, 30, 60, 120, 300, 600, 1200),
+)
+
 STEP_PHONE = 1
 STEP_CODE = 2
 STEP_PASSWORD = 3
-login_cache = {}
+
+# One slot per connected temporary client; logins past the cap wait for one in the background
+login_slots = asyncio.Semaphore(MAX_PENDING_LOGINS)
+
+def funnel(entry, stage):
+    LOGIN_FUNNEL_SECONDS.observe(time.monotonic() - entry['started'], stage=stage)
+
+async def close_login(entry, outcome):
+    """Disconnect the login's temporary client, free its slot and record how it ended."""
+    waiter = entry.pop('waiter', None)
+    if waiter is not None and waiter is not asyncio.current_task():
+        waiter.cancel()
+    temp_client = entry.pop('temp_client', None)
+    if temp_client:
+        try:
+            await temp_client.disconnect()
+        except Exception:
+            pass
+    if entry.pop('slot', False):
+        login_slots.release()
+        LOGIN_PENDING.dec()
+    LOGIN_OUTCOMES.inc(outcome=outcome)
+    funnel(entry, outcome)
+
+async def finish_login(user_id, outcome):
+    router.end(user_id, 'login')
+    entry = login_cache.pop(user_id, None)
+    if entry:
+        await close_login(entry, outcome)
+
+async def expire_login(user_id, entry, reason):
+    """The user sent nothing for LOGIN_TIMEOUT seconds: drop the connection they left open."""
+    router.end(user_id, 'login')
+    await close_login(entry, 'expired')
+    await edit_message_safely(entry['status_msg'], '⌛ Login timed out. Use /login to start again.')
+
+# Phone, code hash, temporary client and status message of each login in progress
+login_cache = store.namespace('login', ttl=LOGIN_TIMEOUT, on_evict=expire_login)
+
+async def acquire_slot(user_id, entry):
+    """Wait for a free slot; False if the login ended or timed out meanwhile."""
+    status_msg = entry['status_msg']
+    entry['queued'] = True
+    LOGIN_QUEUED.inc()
+    try:
+        await asyncio.wait_for(login_slots.acquire(), LOGIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        if login_cache.get(user_id) is entry:
+            await edit_message_safely(status_msg, '❌ Still too many logins in progress. Please try again later with /login.')
+            await finish_login(user_id, 'queue_timeout')
+        return False
+    finally:
+        entry.pop('queued', None)
+        LOGIN_QUEUED.dec()
+    # Cancelled, restarted or expired while queued: that already closed it, so just hand the slot on
+    if login_cache.get(user_id) is not entry:
+        login_slots.release()
+        return False
+    entry['slot'] = True
+    LOGIN_PENDING.inc()
+    funnel(entry, 'slot')
+    return True
+
+async def request_code(user_id, entry, phone):
+    """Connect the login's temporary client and have Telegram send the code to `phone`."""
+    status_msg = entry['status_msg']
+    await edit_message_safely(status_msg, '🔄 Processing phone number...')
+    temp_client = Client(
+        f'temp_{user_id}', api_id=API_ID, api_hash=API_HASH, in_memory=True
+    )
+    entry['temp_client'] = temp_client
+    try:
+        await temp_client.connect()
+        sent_code = await temp_client.send_code(phone)
+        entry['phone'] = phone
+        entry['phone_code_hash'] = sent_code.phone_code_hash
+        conversation = router.get(user_id, 'login')
+        if conversation is not None:
+            conversation['step'] = STEP_CODE
+        funnel(entry, 'code_sent')
+        await edit_message_safely(
+            status_msg,
+            "✅ Verification code sent to your Telegram account.\nPlease enter the code you received:"
+        )
+    except BadRequest as e:
+        await edit_message_safely(
+            status_msg,
+            f"❌ Error: {str(e)}\nPlease try again with /login."
+        )
+        await finish_login(user_id, 'failed')
+
+async def queued_login(user_id, entry, phone):
+    """Wait for a slot off the update handler, then carry on with the phone step.
+
+    Cancelling, restarting or expiring the login cancels this task (see close_login).
+    """
+    try:
+        if await acquire_slot(user_id, entry):
+            await request_code(user_id, entry, phone)
+    except Exception as e:
+        logger.error(f'Error in queued login: {str(e)}')
+        if login_cache.get(user_id) is entry:
+            await edit_message_safely(
+                entry['status_msg'],
+                f"❌ An error occurred: {str(e)}\nPlease try again with /login."
+            )
+            await finish_login(user_id, 'error')
 
 @bot.on_message(filters.command('login'))
 async def login_command(client, message: Message):
     user_id = message.from_user.id
-    set_user_step(user_id, STEP_PHONE)
-    login_cache.pop(user_id, None)
+    await finish_login(user_id, 'restarted')
+    router.start(user_id, 'login', step=STEP_PHONE)
     await message.delete()
     status_msg = await message.reply(
         "Please send your phone number with country code\nExample: `+12345678900`"
     )
-    login_cache[user_id] = {'status_msg': status_msg}
+    login_cache[user_id] = {'status_msg': status_msg, 'started': time.monotonic()}
 
-@bot.on_message(
-    login_in_progress & filters.text & ~filters.command([
-        'start', 'batch', 'cancel', 'login', 'logout', 'stop', 'set', 'pay', 'redeem', 'gencode'
-    ])
-)
-async def handle_login_steps(client, message: Message):
+async def cancel_login(client, message: Message, conversation):
+    user_id = message.from_user.id
+    await message.delete()
+    entry = login_cache.pop(user_id, None)
+    if entry:
+        await close_login(entry, 'cancelled')
+        await edit_message_safely(
+            entry['status_msg'],
+            '✅ Login process cancelled. Use /login to start again.'
+        )
+    else:
+        temp_msg = await message.reply(
+            '✅ Login process cancelled. Use /login to start again.'
+        )
+        await temp_msg.delete(delay=5)
+
+@router.flow('login', on_cancel=cancel_login)
+async def handle_login_steps(client, message: Message, conversation):
     user_id = message.from_user.id
-    text = message.text.strip()
-    step = get_user_step(user_id)
+    text = (message.text or '').strip()
+    step = conversation['step']
     try:
         await message.delete()
     except Exception as e:
         logger.warning(f'Could not delete message: {e}')
-    status_msg = login_cache.get(user_id, {}).get('status_msg')
-    if not status_msg:
-        status_msg = await message.reply('Processing...')
-        login_cache.setdefault(user_id, {})['status_msg'] = status_msg
+    entry = login_cache.get(user_id)
+    if entry is None:
+        entry = {'status_msg': await message.reply('Processing...'), 'started': time.monotonic()}
+        login_cache[user_id] = entry
+    status_msg = entry['status_msg']
     try:
         if step == STEP_PHONE:
+            waiter = entry.get('waiter')
+            if waiter is not None and not waiter.done():
+                await edit_message_safely(status_msg, '⏳ Still waiting for a free login slot. Please wait...')
+                return
             if not text.startswith('+'):
                 await edit_message_safely(status_msg, '❌ Please provide a valid phone number starting with +')
                 return
-            await edit_message_safely(status_msg, '🔄 Processing phone number...')
-            temp_client = Client(
-                f'temp_{user_id}', api_id=API_ID, api_hash=API_HASH, in_memory=True
-            )
-            try:
-                await temp_client.connect()
-                sent_code = await temp_client.send_code(text)
-                login_cache[user_id]['phone'] = text
-                login_cache[user_id]['phone_code_hash'] = sent_code.phone_code_hash
-                login_cache[user_id]['temp_client'] = temp_client
-                set_user_step(user_id, STEP_CODE)
-                await edit_message_safely(
-                    status_msg,
-                    "✅ Verification code sent to your Telegram account.\nPlease enter the code you received:"
-                )
-            except BadRequest as e:
-                await edit_message_safely(
-                    status_msg,
-                    f"❌ Error: {str(e)}\nPlease try again with /login."
-                )
-                await temp_client.disconnect()
-                set_user_step(user_id, None)
-                login_cache.pop(user_id, None)
+            if not entry.get('slot'):
+                if login_slots.locked():
+                    # Waiting here would hold one of Pyrogram's few update workers for minutes
+                    await edit_message_safely(status_msg, '⏳ Too many logins in progress, you are in the queue. Please wait...')
+                    entry['waiter'] = asyncio.create_task(queued_login(user_id, entry, text))
+                    return
+                if not await acquire_slot(user_id, entry):
+                    return
+            await request_code(user_id, entry, text)
         elif step == STEP_CODE:
             code = text.replace(' ', '')
-            phone = login_cache[user_id].get('phone')
-            phone_code_hash = login_cache[user_id].get('phone_code_hash')
-            temp_client = login_cache[user_id].get('temp_client')
+            phone = entry.get('phone')
+            phone_code_hash = entry.get('phone_code_hash')
+            temp_client = entry.get('temp_client')
             if not all([phone, phone_code_hash, temp_client]):
                 await edit_message_safely(status_msg, "❌ Login state lost. Please try again with /login.")
-                set_user_step(user_id, None)
-                login_cache.pop(user_id, None)
+                await finish_login(user_id, 'error')
                 return
             try:
                 await edit_message_safely(status_msg, '🔄 Verifying code...')
                 await temp_client.sign_in(phone, phone_code_hash, code)
                 session_string = await temp_client.export_session_string()
                 await save_user_session(user_id, session_string)
-                await temp_client.disconnect()
-                temp_status_msg = login_cache[user_id]['status_msg']
-                login_cache.pop(user_id, None)
-                login_cache[user_id] = {'status_msg': temp_status_msg}
+                await finish_login(user_id, 'success')
                 await edit_message_safely(
                     status_msg,
                     "✅ Success! Your session has been saved to the database.\nYou can now use the bot that requires this session."
                 )
-                set_user_step(user_id, None)
             except SessionPasswordNeeded:
-                set_user_step(user_id, STEP_PASSWORD)
+                conversation['step'] = STEP_PASSWORD
+                funnel(entry, 'password_needed')
                 await edit_message_safely(
                     status_msg,
                     "🔒 Two-step verification is enabled.\nPlease enter your password:"
@@ -112,30 +229,23 @@ async def handle_login_steps(client, message: Message):
                     status_msg,
                     f'❌ {str(e)}. Please try again with /login.'
                 )
-                await temp_client.disconnect()
-                login_cache.pop(user_id, None)
-                set_user_step(user_id, None)
+                await finish_login(user_id, 'failed')
         elif step == STEP_PASSWORD:
-            temp_client = login_cache[user_id].get('temp_client')
+            temp_client = entry.get('temp_client')
             if not temp_client:
                 await edit_message_safely(status_msg, "❌ Login state lost. Please try again with /login.")
-                set_user_step(user_id, None)
-                login_cache.pop(user_id, None)
+                await finish_login(user_id, 'error')
                 return
             try:
                 await edit_message_safely(status_msg, '🔄 Verifying password...')
                 await temp_client.check_password(text)
                 session_string = await temp_client.export_session_string()
                 await save_user_session(user_id, session_string)
-                await temp_client.disconnect()
-                temp_status_msg = login_cache[user_id]['status_msg']
-                login_cache.pop(user_id, None)
-                login_cache[user_id] = {'status_msg': temp_status_msg}
+                await finish_login(user_id, 'success')
                 await edit_message_safely(
                     status_msg,
                     "✅ Success! Your session has been saved to the database.\nYou can now use the bot that requires this session."
                 )
-                set_user_step(user_id, None)
             except BadRequest as e:
                 await edit_message_safely(
                     status_msg,
@@ -147,13 +257,7 @@ async def handle_login_steps(client, message: Message):
             status_msg,
             f"❌ An error occurred: {str(e)}\nPlease try again with /login."
         )
-        if user_id in login_cache and 'temp_client' in login_cache[user_id]:
-            try:
-                await login_cache[user_id]['temp_client'].disconnect()
-            except Exception:
-                pass
-        login_cache.pop(user_id, None)
-        set_user_step(user_id, None)
+        await finish_login(user_id, 'error')
 
 async def edit_message_safely(message: Message, text: str):
     """Helper function to edit message and handle errors"""
@@ -164,33 +268,6 @@ async def edit_message_safely(message: Message, text: str):
     except Exception as e:
         logger.error(f'Error editing message: {e}')
 
-@bot.on_message(filters.command('cancel'))
-async def cancel_command(client, message: Message):
-    user_id = message.from_user.id
-    await message.delete()
-    if get_user_step(user_id):
-        status_msg = login_cache.get(user_id, {}).get('status_msg')
-        if user_id in login_cache and 'temp_client' in login_cache[user_id]:
-            try:
-                await login_cache[user_id]['temp_client'].disconnect()
-            except Exception:
-                pass
-        login_cache.pop(user_id, None)
-        set_user_step(user_id, None)
-        if status_msg:
-            await edit_message_safely(
-                status_msg,
-                '✅ Login process cancelled. Use /login to start again.'
-            )
-        else:
-            temp_msg = await message.reply(
-                '✅ Login process cancelled. Use /login to start again.'
-            )
-            await temp_msg.delete(delay=5)
-    else:
-        temp_msg = await message.reply('No active login process to cancel.')
-        await temp_msg.delete(delay=5)
-
 @bot.on_message(filters.command('logout'))
 async def logout_command(client, message: Message):
     user_id = message.from_user.id
@@ -11,6 +11,7 @@ from shared_client import client as gf
 import random
 from config import OWNER_ID
 from utils.func import get_user_data_key, save_user_data, users_collection
+from utils import router
 
 VIDEO_EXTENSIONS = {
     'mp4', 'mkv', 'avi', 'mov', 'wmv', 'flv', 'webm',
@@ -36,8 +37,6 @@ async def send_settings_message(chat_id, user_id):
     ]
     await gf.send_message(chat_id, MESS, buttons=buttons)
 
-active_conversations = {}
-
 @gf.on(events.CallbackQuery)
 async def callback_query_handler(event):
     user_id = event.sender_id
@@ -96,80 +95,74 @@ __👉 **Note:** if you are using custom bot then your bot should be admin that
             await event.respond(f'Error removing thumbnail: {e}')
 
 async def start_conversation(event, user_id, conv_type, prompt_message):
-    """Start a conversation with the user."""
-    if user_id in active_conversations:
+    """Start a conversation with the user; the reply is handled by the update router."""
+    if router.get(user_id):
         await event.respond('Previous conversation cancelled. Starting new one.')
     msg = await event.respond(f'{prompt_message}\n\n(Send /cancel to cancel this operation)')
-    active_conversations[user_id] = {'type': conv_type, 'message_id': msg.id}
+    router.start(user_id, 'settings', step=conv_type, message_id=msg.id)
 
-@gf.on(events.NewMessage(pattern='/cancel'))
-async def cancel_conversation(event):
+async def cancel_conversation(client, message, conversation):
     """Cancel an active conversation."""
-    user_id = event.sender_id
-    if user_id in active_conversations:
-        await event.respond('Cancelled. Enjoy!')
-        del active_conversations[user_id]
+    await message.reply('Cancelled. Enjoy!')
 
-@gf.on(events.NewMessage())
-async def handle_conversation_input(event):
+@router.flow('settings', on_cancel=cancel_conversation, resumable=True)
+async def handle_conversation_input(client, message, conversation):
     """Handle input from users in active conversations."""
-    user_id = event.sender_id
-    if user_id not in active_conversations or (event.message.text and event.message.text.startswith('/')):
-        return
-    conv_type = active_conversations[user_id]['type']
+    user_id = message.from_user.id
+    conv_type = conversation['step']
+    text = message.text or ''
     try:
         if conv_type == 'setchat':
-            chat_id = event.text.strip()
+            chat_id = text.strip()
             await save_user_data(user_id, 'chat_id', chat_id)
-            await event.respond('✅ Chat ID set successfully!')
+            await message.reply('✅ Chat ID set successfully!')
         elif conv_type == 'setrename':
-            rename_tag = event.text.strip()
+            rename_tag = text.strip()
             await save_user_data(user_id, 'rename_tag', rename_tag)
-            await event.respond(f'✅ Rename tag set to: {rename_tag}')
+            await message.reply(f'✅ Rename tag set to: {rename_tag}')
         elif conv_type == 'setcaption':
-            caption = event.text
+            caption = text
             await save_user_data(user_id, 'caption', caption)
-            await event.respond('✅ Caption set successfully!')
+            await message.reply('✅ Caption set successfully!')
         elif conv_type == 'setreplacement':
-            match = re.match(r"'(.+)' '(.+)'", event.text)
+            match = re.match(r"'(.+)' '(.+)'", text)
             if not match:
-                await event.respond("❌ Invalid format. Usage: 'WORD(s)' 'REPLACEWORD'")
+                await message.reply("❌ Invalid format. Usage: 'WORD(s)' 'REPLACEWORD'")
             else:
                 word, replace_word = match.groups()
                 delete_words = await get_user_data_key(user_id, 'delete_words', [])
                 if word in delete_words:
-                    await event.respond(f"❌ The word '{word}' is in the delete list and cannot be replaced.")
+                    await message.reply(f"❌ The word '{word}' is in the delete list and cannot be replaced.")
                 else:
                     replacements = await get_user_data_key(user_id, 'replacement_words', {})
                     replacements[word] = replace_word
                     await save_user_data(user_id, 'replacement_words', replacements)
-                    await event.respond(f"✅ Replacement saved: '{word}' will be replaced with '{replace_word}'")
+                    await message.reply(f"✅ Replacement saved: '{word}' will be replaced with '{replace_word}'")
         elif conv_type == 'addsession':
-            session_string = event.text.strip()
+            session_string = text.strip()
             await save_user_data(user_id, 'session_string', session_string)
-            await event.respond('✅ Session string added successfully!')
+            await message.reply('✅ Session string added successfully!')
         elif conv_type == 'deleteword':
-            words_to_delete = event.message.text.split()
+            words_to_delete = text.split()
             delete_words = await get_user_data_key(user_id, 'delete_words', [])
             delete_words = list(set(delete_words + words_to_delete))
             await save_user_data(user_id, 'delete_words', delete_words)
-            await event.respond(f"✅ Words added to delete list: {', '.join(words_to_delete)}")
+            await message.reply(f"✅ Words added to delete list: {', '.join(words_to_delete)}")
         elif conv_type == 'setthumb':
-            if event.photo:
-                temp_path = await event.download_media()
+            if message.photo:
+                temp_path = await message.download()
                 thumb_path = f'{user_id}.jpg'
                 try:
                     if os.path.exists(thumb_path):
                         os.remove(thumb_path)
                     os.rename(temp_path, thumb_path)
-                    await event.respond('✅ Thumbnail saved successfully!')
+                    await message.reply('✅ Thumbnail saved successfully!')
                 except Exception as e:
-                    await event.respond(f'❌ Error saving thumbnail: {e}')
+                    await message.reply(f'❌ Error saving thumbnail: {e}')
             else:
-                await event.respond('❌ Please send a photo. Operation cancelled.')
+                await message.reply('❌ Please send a photo. Operation cancelled.')
     finally:
-        if user_id in active_conversations:
-            del active_conversations[user_id]
+        router.end(user_id, 'settings')
 
 def generate_random_name(length=7):
     """Generate a random name for temporary files."""
@@ -180,7 +173,8 @@ async def rename_file(file, sender, edit):
     delete_words = await get_user_data_key(sender, 'delete_words', [])
     custom_rename_tag = await get_user_data_key(sender, 'rename_tag', '')
     replacements = await get_user_data_key(sender, 'replacement_words', {})
-    file_str = str(file)
+    # Rules apply to the file name only; the file stays in its (scratch) directory
+    directory, file_str = os.path.split(str(file))
     last_dot_index = file_str.rfind('.')
     if last_dot_index != -1 and last_dot_index != 0:
         ggn_ext = file_str[last_dot_index + 1:]
@@ -201,6 +195,6 @@ async def rename_file(file, sender, edit):
         original_file_name = original_file_name.replace(word, '')
     for word, replace_word in replacements.items():
         original_file_name = original_file_name.replace(word, replace_word)
-    new_file_name = f'{original_file_name} {custom_rename_tag}.{file_extension}'.strip()
+    new_file_name = os.path.join(directory, f'{original_file_name} {custom_rename_tag}.{file_extension}'.strip())
     await asyncio.to_thread(os.rename, file, new_file_name)
     return new_file_name
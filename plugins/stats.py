@@ -12,8 +12,10 @@ from utils.func import (
     get_user_data,
     premium_users_collection,
     is_premium_user,
+    users_collection,
 )
 from config import OWNER_ID
+from utils import rollups
 import logging
 
 logging.basicConfig(
@@ -214,4 +216,58 @@ async def remove_premium_handler(event):
             )
     except Exception as e:
         logger.error(f"Error removing premium from {target_user_id}: {e}")
-        await event.respond(f"❌ Error removing premium: {str(e)}")
\ No newline at end of file
+        await event.respond(f"❌ Error removing premium: {str(e)}")
+
+
+def format_usage(title, doc, users_label="Active users"):
+    jobs = doc.get("jobs", {})
+    done = sum(outcomes.get("ok", 0) for outcomes in jobs.values())
+    per_type = ", ".join(
+        f"{job_type} {sum(outcomes.values())}" for job_type, outcomes in sorted(jobs.items())
+    ) or "none"
+    cache = doc.get("cache", {})
+    hits = sum(results.get("hit", 0) for results in cache.values())
+    lookups = sum(sum(results.values()) for results in cache.values())
+    moved = doc.get("bytes", {})
+    return (
+        f"**{title}**\n"
+        f"👥 {users_label}: {doc.get('active_users', 0)}\n"
+        f"📦 Jobs: {done} done, {doc.get('failures', 0)} failed ({per_type})\n"
+        f"⬇️ Downloaded: {moved.get('download', 0) / 1024 ** 3:.2f} GB\n"
+        f"⬆️ Delivered: {moved.get('upload', 0) / 1024 ** 3:.2f} GB\n"
+        f"🎯 Cache hits: {hits}/{lookups}" + (f" ({hits * 100 / lookups:.0f}%)" if lookups else "") + "\n"
+        f"🐢 Flood waits: {sum(doc.get('flood_waits', {}).values())}"
+    )
+
+
+@bot_client.on(events.NewMessage(pattern=r"/stats"))
+async def stats_handler(event):
+    """Owner-only usage overview, read from the pre-aggregated rollups."""
+    if not await is_private_chat(event):
+        return
+    if event.sender_id not in OWNER_ID:
+        return
+
+    try:
+        # Include what this process counted since its last flush
+        await rollups.flush()
+        usage = await rollups.read(days=7)
+        total_users = await users_collection.estimated_document_count()
+        premium_users = await premium_users_collection.estimated_document_count()
+    except Exception as e:
+        logger.error(f"Error reading usage rollups: {e}")
+        await event.respond(f"❌ Error reading stats: {str(e)}")
+        return
+
+    await event.respond(
+        "📊 **Usage (UTC)**\n\n"
+        f"👤 Known users: {total_users}\n"
+        f"💎 Premium users: {premium_users}\n\n"
+        + format_usage("This hour", usage["hour"]) + "\n\n"
+        + format_usage("Today", usage["today"]) + "\n\n"
+        + format_usage("Last 7 days", rollups.combine(usage["days"]), users_label="User-days")
+    )
+
+
+async def run_stats_plugin():
+    rollups.start()
@@ -1,213 +1,504 @@
-import yt_dlp
 import os
-import tempfile
+import contextlib
+import functools
+import glob
 import time
 import asyncio
 import random
 import string
-import requests
 import logging
 import math
 from shared_client import client, app
 from telethon import events
-from telethon.tl.types import DocumentAttributeVideo
-from utils.func import get_video_metadata, screenshot
-from devgagantools import fast_upload
-from concurrent.futures import ThreadPoolExecutor
-import aiohttp
-import aiofiles
-from mutagen.id3 import ID3, TIT2, TPE1, COMM, APIC
-from mutagen.mp3 import MP3
+from telethon.tl.types import DocumentAttributeAudio, DocumentAttributeVideo, InputDocument
+from utils.func import (
+    get_video_metadata, screenshot, get_cached_media, save_cached_media, remove_cached_media
+)
+from utils.audio_tags import write_tags
+from utils.metrics import BYTES, track_job, job_failed, count_flood_wait, cache_result
+from utils.trace import span, new_job_id
+from utils.http_client import download_file
+from utils.splitter import iter_file_parts, iter_video_parts
+from utils.jobs import JobQueue, QueueFull, format_eta
+from utils.ytdl_runner import open_session
+from utils.uploader import telethon_upload
+from utils.ytdl_cache import extract_cached, canonical_key
+from utils.ytdl_formats import plan_format, FALLBACK_FORMAT
+from utils.scratch import scratch
+from utils.broker import make_broker, serve
+from utils.state import store
+from utils import bandwidth, rollups
+from config import (
+    ROLE, OWNER_ID, SPLIT_MODE, PLAYLIST_CONCURRENCY, PLAYLIST_MAX_ITEMS,
+    YTDL_WORKERS, YTDL_EXTRACT_LIMIT, YTDL_FFMPEG_LIMIT, YTDL_UPLOAD_LIMIT, YTDL_QUEUE_MAX,
+    YTDL_FRAGMENTS, YTDL_PROGRESS_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
-thread_pool = ThreadPoolExecutor()
-ongoing_downloads = {}
+ongoing_downloads = store.namespace('ytdl_active', ttl=6 * 3600)
+PART_SIZE = int(1.9 * 1024 * 1024 * 1024)
+UPLOAD_LIMIT = 2 * 1024 * 1024 * 1024
+# The planner passes an exact format per download; these make whatever comes back an MP4
+VIDEO_OPTS = {
+    'format': FALLBACK_FORMAT,
+    'concurrent_fragment_downloads': YTDL_FRAGMENTS,
+    'merge_output_format': 'mp4',
+    'postprocessors': [{'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'}],
+}
+ytdl_jobs = JobQueue(
+    "ytdl", YTDL_WORKERS,
+    stage_limits={'extract': YTDL_EXTRACT_LIMIT, 'ffmpeg': YTDL_FFMPEG_LIMIT, 'upload': YTDL_UPLOAD_LIMIT},
+    max_size=YTDL_QUEUE_MAX
+)
+# Set when JOB_BROKER is configured: handlers only queue jobs and workers claim them from there
+broker = make_broker()
+
+# Bump these when the output of the matching pipeline changes so stale uploads are not reused
+AUDIO_PROFILES = {'native': "audio:native", 'mp3': "audio:mp3-192"}
+VIDEO_PROFILE = "video:mp4-planned"
+
+def media_key(url, profile):
+    extractor, video_id = canonical_key(url)
+    return f"{extractor}:{video_id}:{profile}"
+
+async def send_cached_media(event, url, profile):
+    """Resend a document we already uploaded for this video and profile; False on a miss."""
+    key = media_key(url, profile)
+    doc = await get_cached_media(key)
+    cache_result('media', doc is not None)
+    if not doc:
+        return False
+    try:
+        media = InputDocument(id=doc['id'], access_hash=doc['access_hash'], file_reference=doc['file_reference'])
+        await client.send_file(event.chat_id, media, caption=doc.get('caption'))
+        return True
+    except Exception as e:
+        logger.warning(f"Cached media {key} could not be resent, dropping it: {e}")
+        await remove_cached_media(key)
+        return False
+
+async def remember_media(url, profile, message, caption):
+    document = getattr(message, 'document', None)
+    if document:
+        await save_cached_media(media_key(url, profile), document, caption)
+
+@client.on(events.NewMessage(pattern="/uncache"))
+async def handler_uncache(event):
+    if event.sender_id not in OWNER_ID:
+        return
+    parts = event.message.text.split()
+    if len(parts) < 2:
+        await event.reply("**Usage:** `/uncache <video-link>`\n\nForgets every stored upload of that video.")
+        return
+    extractor, video_id = canonical_key(parts[1])
+    removed = await remove_cached_media(f"{extractor}:{video_id}:")
+    await event.reply(f"**Removed {removed} cached upload(s) for** `{extractor}:{video_id}`")
 
-def d_thumbnail(thumbnail_url, save_path):
+async def extract_audio_async(ydl_opts, url, before_download=None, progress=None):
+    session = open_session(ydl_opts, progress)
     try:
-        response = requests.get(thumbnail_url, stream=True)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        return save_path
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to download thumbnail: {e}")
-        return None
+        info_dict = await extract_cached(session, url)
+        if before_download:
+            await before_download(info_dict)
+        return await session.download(info_dict)
+    finally:
+        await session.close()
+
+async def enqueue_job(event, job_type, run):
+    """Queue a /dl or /adl job and keep the user informed of their place in line."""
+    user_id = event.sender_id
+    status = {}
+
+    async def on_position(position, eta):
+        if status.get('msg'):
+            try:
+                await status['msg'].edit(f"**⏳ Queued at position {position}. Estimated start in ~{format_eta(eta)}.**")
+            except Exception:
+                pass
+
+    async def job():
+        if status.get('msg'):
+            try:
+                await status['msg'].delete()
+            except Exception:
+                pass
+        await run()
 
-async def download_thumbnail_async(url, path):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                async with aiofiles.open(path, 'wb') as f:
-                    await f.write(await response.read())
+    try:
+        await ytdl_jobs.submit(job_type, user_id, job, on_position=on_position)
+    except QueueFull:
+        ongoing_downloads.pop(user_id, None)
+        await event.reply("**The download queue is full right now. Please try again in a few minutes.**")
+        return
+    await asyncio.sleep(0)
+    position = ytdl_jobs.position(user_id)
+    if position:
+        status['msg'] = await event.reply(
+            f"**⏳ Queued at position {position}. Estimated start in ~{format_eta(ytdl_jobs.eta(position))}.**"
+        )
 
-async def extract_audio_async(ydl_opts, url):
-    def sync_extract():
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            return ydl.extract_info(url, download=True)
-    return await asyncio.get_event_loop().run_in_executor(thread_pool, sync_extract)
+async def dispatch(event, job_type, payload):
+    """Hand a validated /dl or /adl job to the broker; the first free worker runs it."""
+    if YTDL_QUEUE_MAX and await broker.pending() >= YTDL_QUEUE_MAX:
+        await event.reply("**The download queue is full right now. Please try again in a few minutes.**")
+        return
+    job_id = await broker.enqueue(job_type, event, payload)
+    position = await broker.position(job_id)
+    if position:
+        await event.reply(f"**⏳ Queued at position {position}.**")
+
+async def is_busy(user_id):
+    if broker:
+        return await broker.active(user_id)
+    return user_id in ongoing_downloads
+
+def write_cookies(ws, cookies):
+    """Store a cookies.txt for yt-dlp inside the job's workspace; None when there are no cookies."""
+    if not cookies:
+        return None
+    path = ws.file("cookies.txt")
+    with open(path, 'w') as f:
+        f.write(cookies)
+    return path
 
 def get_random_string(length=7):
     characters = string.ascii_letters + string.digits
     return ''.join(random.choice(characters) for _ in range(length))
 
-async def process_audio(client, event, url, cookies_env_var=None):
+AUDIO_MODES = {
+    # Native: take the best audio-only stream and remux it (AAC -> .m4a, Opus -> .opus) without re-encoding
+    'native': {
+        'format': 'bestaudio[ext=m4a]/bestaudio[acodec=opus]/bestaudio/best',
+        'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}],
+    },
+    'mp3': {
+        'format': 'bestaudio/best',
+        'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}],
+    },
+}
+
+def downloaded_path(info_dict, prefix):
+    """Final file written by yt-dlp (after post-processing) for a single-video download."""
+    for item in (info_dict or {}).get('requested_downloads') or ():
+        path = item.get('filepath')
+        if path and os.path.exists(path):
+            return path
+    candidates = [f for f in glob.glob(f"{glob.escape(prefix)}.*") if not f.endswith(('.part', '.ytdl') + IMAGE_EXTENSIONS)]
+    return candidates[0] if candidates else None
+
+def cover_url(info_dict):
+    """Prefer a JPEG thumbnail, since every tag format below embeds the cover as image/jpeg."""
+    for thumb in reversed(info_dict.get('thumbnails') or ()):
+        url = thumb.get('url') or ''
+        if url.split('?')[0].lower().endswith(('.jpg', '.jpeg')):
+            return url
+    return info_dict.get('thumbnail')
+
+async def process_audio(client, event, url, cookies_env_var=None, mode='native'):
     cookies = None
     if cookies_env_var:
         cookies = os.getenv(cookies_env_var)
 
-    temp_cookie_path = None
-    if cookies:
-        with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.txt') as temp_cookie_file:
-            temp_cookie_file.write(cookies)
-            temp_cookie_path = temp_cookie_file.name
+    job = new_job_id()
+    ws = await scratch.open(job)
+    temp_cookie_path = write_cookies(ws, cookies)
 
-    random_filename = f"@team_spy_pro_{event.sender_id}"
-    download_path = f"{random_filename}.mp3"
+    random_filename = ws.file(f"@team_spy_pro_{event.sender_id}")
+    download_path = None
 
     ydl_opts = {
-        'format': 'bestaudio/best',
+        **AUDIO_MODES[mode],
         'outtmpl': f"{random_filename}.%(ext)s",
         'cookiefile': temp_cookie_path,
-        'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}],
+        'concurrent_fragment_downloads': YTDL_FRAGMENTS,
+        'ratelimit': bandwidth.ytdl_rate_limit(),
         'quiet': False,
         'noplaylist': True,
     }
 
     progress_message = await event.reply("**__Starting audio extraction...__**")
+    tracker = DownloadProgress(progress_message, "Downloading audio", meter=bandwidth.Meter(event.sender_id, 'download'))
 
     try:
-        info_dict = await extract_audio_async(ydl_opts, url)
+        # Only the MP3 mode re-encodes, so only it competes for the ffmpeg slots
+        ffmpeg_stage = ytdl_jobs.stage('ffmpeg') if mode == 'mp3' else contextlib.nullcontext()
+        async with ytdl_jobs.stage('extract'), ffmpeg_stage:
+            with span('ytdl_download', job, event.sender_id, kind='audio', mode=mode):
+                try:
+                    info_dict = await extract_audio_async(
+                        ydl_opts, url, before_download=lambda info: ws.grow(estimate_size(info)), progress=tracker
+                    )
+                finally:
+                    await tracker.stop()
         title = info_dict.get('title', 'Extracted Audio')
+        download_path = downloaded_path(info_dict, random_filename)
 
         await progress_message.edit("**__Editing metadata...__**")
 
-        if os.path.exists(download_path):
-            async def edit_metadata():
-                audio_file = MP3(download_path, ID3=ID3)
-                try:
-                    audio_file.add_tags()
-                except Exception:
-                    pass
-                audio_file.tags["TIT2"] = TIT2(encoding=3, text=title)
-                audio_file.tags["TPE1"] = TPE1(encoding=3, text="Team SPY")
-                audio_file.tags["COMM"] = COMM(encoding=3, lang="eng", desc="Comment", text="Processed by Team SPY")
-
-                thumbnail_url = info_dict.get('thumbnail')
-                if thumbnail_url:
-                    thumbnail_path = os.path.join(tempfile.gettempdir(), "thumb.jpg")
-                    await download_thumbnail_async(thumbnail_url, thumbnail_path)
+        if download_path:
+            cover = None
+            thumbnail_url = cover_url(info_dict)
+            if thumbnail_url:
+                thumbnail_path = ws.file("cover.jpg")
+                if await download_file(thumbnail_url, thumbnail_path):
                     with open(thumbnail_path, 'rb') as img:
-                        audio_file.tags["APIC"] = APIC(
-                            encoding=3, mime='image/jpeg', type=3, desc='Cover', data=img.read()
-                        )
-                    os.remove(thumbnail_path)
-                audio_file.save()
+                        cover = img.read()
 
-            await edit_metadata()
+            with span('tags', job, event.sender_id):
+                try:
+                    await asyncio.to_thread(
+                        write_tags, download_path, title, "Team SPY", "Processed by Team SPY", cover
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not tag {download_path}: {e}")
 
         chat_id = event.chat_id
-        if os.path.exists(download_path):
+        if download_path:
             await progress_message.delete()
             prog = await client.send_message(chat_id, "**__Starting Upload...__**")
-            uploaded = await fast_upload(
-                client, download_path,
-                reply=prog,
-                name=None,
-                progress_bar_function=lambda done, total: progress_callback(done, total, chat_id)
-            )
-            await client.send_file(chat_id, uploaded, caption=f"**{title}**\n\n**__Powered by Team SPY__**")
+            BYTES.inc(os.path.getsize(download_path), direction='download')
+            async with ytdl_jobs.stage('upload'):
+                with span('upload', job, event.sender_id, bytes=os.path.getsize(download_path)):
+                    uploaded = await telethon_upload(
+                        client, download_path,
+                        progress=bandwidth.track(upload_progress(prog, chat_id), event.sender_id, 'upload')
+                    )
+                    caption = f"**{title}**\n\n**__Powered by Team SPY__**"
+                    sent = await client.send_file(
+                        chat_id, uploaded, caption=caption,
+                        attributes=[DocumentAttributeAudio(
+                            duration=int(info_dict.get('duration') or 0), title=title, performer="Team SPY"
+                        )]
+                    )
+            await remember_media(url, AUDIO_PROFILES[mode], sent, caption)
+            BYTES.inc(os.path.getsize(download_path), direction='upload')
             if prog:
                 await prog.delete()
         else:
+            job_failed()
             await event.reply("**__Audio file not found after extraction!__**")
 
     except Exception as e:
+        job_failed()
+        count_flood_wait(e)
         logger.exception("Error during audio extraction or upload")
         await event.reply(f"**__An error occurred: {e}__**")
     finally:
-        if os.path.exists(download_path):
-            os.remove(download_path)
-        if temp_cookie_path and os.path.exists(temp_cookie_path):
-            os.remove(temp_cookie_path)
+        await ws.close()
+
+async def run_adl(event, url, mode):
+    with track_job('adl'):
+        if "instagram.com" in url:
+            await process_audio(client, event, url, cookies_env_var="INSTA_COOKIES", mode=mode)
+        elif "youtube.com" in url or "youtu.be" in url:
+            await process_audio(client, event, url, cookies_env_var="YT_COOKIES", mode=mode)
+        else:
+            await process_audio(client, event, url, mode=mode)
 
 @client.on(events.NewMessage(pattern="/adl"))
 async def handler_adl(event):
     user_id = event.sender_id
-    if user_id in ongoing_downloads:
+    rollups.seen(user_id, event.chat_id)
+    if await is_busy(user_id):
         await event.reply("**You already have an ongoing download. Please wait until it completes!**")
         return
 
-    if len(event.message.text.split()) < 2:
-        await event.reply("**Usage:** `/adl <video-link>`\n\nPlease provide a valid video link!")
+    args = event.message.text.split()
+    if len(args) < 2:
+        await event.reply(
+            "**Usage:** `/adl <video-link> [mp3]`\n\nPlease provide a valid video link! "
+            "Audio is sent in its original format; add `mp3` to convert it."
+        )
         return
 
-    url = event.message.text.split()[1]
+    url = args[1]
+    mode = 'mp3' if len(args) > 2 and args[2].lower() == 'mp3' else 'native'
+    if await send_cached_media(event, url, AUDIO_PROFILES[mode]):
+        return
+    exceeded = await bandwidth.quota_exceeded(user_id)
+    if exceeded:
+        await event.reply(f"**{exceeded}**")
+        return
+    if broker:
+        await dispatch(event, 'adl', {'url': url, 'mode': mode})
+        return
     ongoing_downloads[user_id] = True
 
-    try:
-        if "instagram.com" in url:
-            await process_audio(client, event, url, cookies_env_var="INSTA_COOKIES")
+    async def run():
+        try:
+            await run_adl(event, url, mode)
+        except Exception as e:
+            await event.reply(f"**An error occurred:** `{e}`")
+        finally:
+            ongoing_downloads.pop(user_id, None)
+
+    await enqueue_job(event, 'adl', run)
+
+def estimate_size(info_dict):
+    """Best guess of the selected format's size, including merged video+audio."""
+    size = info_dict.get('filesize') or info_dict.get('filesize_approx')
+    if size:
+        return size
+    requested = info_dict.get('requested_formats') or ()
+    return sum((f.get('filesize') or f.get('filesize_approx') or 0) for f in requested)
+
+async def fetch_video_info(session, url, progress_message, check_duration_and_size):
+    """Extract once with `session` (or reuse a cached result); the same session downloads it."""
+    info_dict = await extract_cached(session, url)
+
+    if check_duration_and_size:
+        duration = info_dict.get('duration', 0)
+        if duration and duration > 3 * 3600:
+            await progress_message.edit("**❌ __Video is longer than 3 hours. Download aborted...__**")
+            return None
+
+    return info_dict
+
+async def run_dl(event, url, playlist):
+    with track_job('dl'):
+        if playlist:
+            cookies_env_var = "INSTA_COOKIES" if "instagram.com" in url else (
+                "YT_COOKIES" if "youtube.com" in url or "youtu.be" in url else None
+            )
+            await process_playlist(client, event, url, cookies_env_var)
+        elif "instagram.com" in url:
+            await process_video(client, event, url, "INSTA_COOKIES", check_duration_and_size=False)
         elif "youtube.com" in url or "youtu.be" in url:
-            await process_audio(client, event, url, cookies_env_var="YT_COOKIES")
+            await process_video(client, event, url, "YT_COOKIES", check_duration_and_size=True)
         else:
-            await process_audio(client, event, url)
-    except Exception as e:
-        await event.reply(f"**An error occurred:** `{e}`")
-    finally:
-        ongoing_downloads.pop(user_id, None)
-
-async def fetch_video_info(url, ydl_opts, progress_message, check_duration_and_size):
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info_dict = ydl.extract_info(url, download=False)
-
-        if check_duration_and_size:
-            duration = info_dict.get('duration', 0)
-            if duration and duration > 3 * 3600:
-                await progress_message.edit("**❌ __Video is longer than 3 hours. Download aborted...__**")
-                return None
-
-            estimated_size = info_dict.get('filesize_approx', 0)
-            if estimated_size and estimated_size > 2 * 1024 * 1024 * 1024:
-                await progress_message.edit("**🤞 __Video size is larger than 2GB. Aborting download.__**")
-                return None
-
-        return info_dict
-
-def download_video(url, ydl_opts):
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([url])
+            await process_video(client, event, url, None, check_duration_and_size=False)
 
 @client.on(events.NewMessage(pattern="/dl"))
 async def handler_dl(event):
     user_id = event.sender_id
+    rollups.seen(user_id, event.chat_id)
 
-    if user_id in ongoing_downloads:
+    if await is_busy(user_id):
         await event.reply("**You already have an ongoing ytdlp download. Please wait until it completes!**")
         return
 
     if len(event.message.text.split()) < 2:
-        await event.reply("**Usage:** `/dl <video-link>`\n\nPlease provide a valid video link!")
+        await event.reply(
+            "**Usage:** `/dl <video-link> [playlist]`\n\nPlease provide a valid video link! "
+            "Add `playlist` to fetch every entry of a playlist or multi-video page."
+        )
         return
 
-    url = event.message.text.split()[1]
+    args = event.message.text.split()
+    url = args[1]
+    playlist = (len(args) > 2 and args[2].lower() == 'playlist') or is_playlist_url(url)
+    if not playlist and await send_cached_media(event, url, VIDEO_PROFILE):
+        return
+    exceeded = await bandwidth.quota_exceeded(user_id)
+    if exceeded:
+        await event.reply(f"**{exceeded}**")
+        return
+    if broker:
+        await dispatch(event, 'dl', {'url': url, 'playlist': playlist})
+        return
     ongoing_downloads[user_id] = True
 
+    async def run():
+        try:
+            await run_dl(event, url, playlist)
+        except Exception as e:
+            await event.reply(f"**An error occurred:** `{e}`")
+        finally:
+            ongoing_downloads.pop(user_id, None)
+
+    await enqueue_job(event, 'dl', run)
+
+JOB_RUNNERS = {'adl': run_adl, 'dl': run_dl}
+worker_task = None
+
+async def run_remote(event, job):
+    """Run a job claimed from the broker; `event` replies to the chat the command came from."""
     try:
-        if "instagram.com" in url:
-            await process_video(client, event, url, "INSTA_COOKIES", check_duration_and_size=False)
-        elif "youtube.com" in url or "youtu.be" in url:
-            await process_video(client, event, url, "YT_COOKIES", check_duration_and_size=True)
-        else:
-            await process_video(client, event, url, None, check_duration_and_size=False)
+        await JOB_RUNNERS[job['type']](event, **job['payload'])
     except Exception as e:
         await event.reply(f"**An error occurred:** `{e}`")
-    finally:
-        ongoing_downloads.pop(user_id, None)
-
-user_progress = {}
+        raise
+
+async def run_ytdl_plugin():
+    global worker_task
+    # A dispatcher only queues; workers (or one process using the local broker) claim and run
+    if broker and ROLE != 'dispatcher':
+        worker_task = asyncio.create_task(serve(broker, client, tuple(JOB_RUNNERS), run_remote, YTDL_WORKERS))
+
+class DownloadProgress:
+    """Turns yt-dlp progress hooks (already delivered on the event loop) into throttled message edits."""
+
+    def __init__(self, message, label="Downloading", interval=YTDL_PROGRESS_INTERVAL, meter=None):
+        self.message = message
+        self.label = label
+        self.interval = interval
+        self.meter = meter
+        self.files_done = 0
+        self.last_edit = 0
+        self.pending = None
+        self.stopped = False
+
+    def __call__(self, d):
+        if self.meter:
+            self.meter.feed(d)
+        if self.stopped:
+            return
+        if d.get('status') == 'finished':
+            self.files_done += 1
+            return
+        now = time.time()
+        if now - self.last_edit < self.interval or (self.pending and not self.pending.done()):
+            return
+        self.last_edit = now
+        self.pending = asyncio.create_task(self._edit(self.render(d)))
+
+    def render(self, d):
+        done = d.get('downloaded_bytes') or 0
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        percent = done * 100 / total if total else 0
+        blocks = min(int(percent // 10), 10)
+        lines = [
+            f"**__{self.label}...__**" + (f" (file {self.files_done + 1})" if self.files_done else ""),
+            "",
+            "♦" * blocks + "◇" * (10 - blocks),
+            f"**__Done:__** {humanbytes(done)} / {humanbytes(total)} ({percent:.1f}%)",
+            f"**__Speed:__** {humanbytes(d.get('speed') or 0)}/s",
+            f"**__ETA:__** {TimeFormatter(int(d.get('eta') or 0) * 1000) or '0s'}",
+        ]
+        if d.get('fragment_count'):
+            lines.append(f"**__Fragments:__** {d.get('fragment_index') or 0}/{d['fragment_count']}")
+        return "\n".join(lines)
+
+    async def _edit(self, text):
+        try:
+            await self.message.edit(text)
+        except Exception as e:
+            logger.debug(f"Download progress edit failed: {e}")
+
+    async def stop(self):
+        """Stop editing; waits for an edit in flight so later edits to the message win."""
+        self.stopped = True
+        if self.pending and not self.pending.done():
+            await asyncio.gather(self.pending, return_exceptions=True)
+
+# Last reported bytes/time per chat, for the upload speed shown by progress_callback
+user_progress = store.namespace('upload_progress', ttl=600, max_size=10000)
+
+def upload_progress(message, user_id, interval=YTDL_PROGRESS_INTERVAL):
+    """Uploader progress callback that edits `message` with progress_callback's text, throttled."""
+    last = {'t': 0}
+
+    async def report(done, total):
+        now = time.time()
+        if now - last['t'] < interval and done < total:
+            return
+        last['t'] = now
+        try:
+            await message.edit(progress_callback(done, total, user_id))
+        except Exception as e:
+            logger.debug(f"Upload progress edit failed: {e}")
+    return report
 
 def progress_callback(done, total, user_id):
     if user_id not in user_progress:
@@ -262,39 +553,66 @@ async def process_video(client, event, url, cookies_env_var, check_duration_and_
     if cookies_env_var:
         cookies = os.getenv(cookies_env_var)
 
-    random_filename = get_random_string() + ".mp4"
-    download_path = os.path.abspath(random_filename)
+    job = new_job_id()
+    ws = await scratch.open(job)
+    download_prefix = ws.file(get_random_string())
+    download_path = f"{download_prefix}.mp4"
     logger.info(f"Generated random download path: {download_path}")
-
-    temp_cookie_path = None
-    if cookies:
-        with tempfile.NamedTemporaryFile(delete=False, mode='w', suffix='.txt') as temp_cookie_file:
-            temp_cookie_file.write(cookies)
-            temp_cookie_path = temp_cookie_file.name
-        logger.info(f"Created temporary cookie file at: {temp_cookie_path}")
+    temp_cookie_path = write_cookies(ws, cookies)
 
     thumbnail_file = None
     metadata = {'width': None, 'height': None, 'duration': None, 'thumbnail': None}
 
     ydl_opts = {
-        'outtmpl': download_path,
-        'format': 'best',
+        **VIDEO_OPTS,
+        'outtmpl': f"{download_prefix}.%(ext)s",
         'cookiefile': temp_cookie_path if temp_cookie_path else None,
         'writethumbnail': True,
+        'ratelimit': bandwidth.ytdl_rate_limit(),
         'quiet': True,
         'noplaylist': True,
     }
     prog = None
     progress_message = await event.reply("**__Starting download...__**")
     logger.info("Starting the download process...")
+    user_id = event.sender_id
+    tracker = DownloadProgress(progress_message, meter=bandwidth.Meter(user_id, 'download'))
+    session = open_session(ydl_opts, tracker)
+    playlist_info = None
     try:
-        info_dict = await asyncio.to_thread(fetch_video_info, url, ydl_opts, progress_message, check_duration_and_size)
-        if not info_dict:
+        async with ytdl_jobs.stage('extract'):
+            with span('ytdl_extract', job, user_id):
+                info_dict = await fetch_video_info(session, url, progress_message, check_duration_and_size)
+            if not info_dict:
+                return
+            if info_dict.get('_type') in PLAYLIST_TYPES:
+                playlist_info = info_dict
+            else:
+                plan = plan_format(info_dict, UPLOAD_LIMIT)
+                logger.info(f"Format plan for {url}: {plan}")
+                if check_duration_and_size and plan.size > UPLOAD_LIMIT:
+                    await progress_message.edit("**🤞 __Even the lowest quality is larger than 2GB. Aborting download.__**")
+                    return
+                await ws.grow(plan.size or estimate_size(info_dict))
+                with span('ytdl_download', job, user_id, format=plan.spec, height=plan.height):
+                    try:
+                        result = await session.download(info_dict, plan.spec)
+                    finally:
+                        await tracker.stop()
+                download_path = downloaded_path(result, download_prefix) or download_path
+
+        if playlist_info:
+            # Carousels and other multi-entry pages; handled once our extract slot is free again
+            await progress_message.delete()
+            await process_playlist(client, event, url, cookies_env_var, info=playlist_info)
             return
 
-        await asyncio.to_thread(download_video, url, ydl_opts)
+        if os.path.exists(download_path):
+            BYTES.inc(os.path.getsize(download_path), direction='download')
         title = info_dict.get('title', 'Powered by Team SPY')
-        k = await get_video_metadata(download_path)
+        async with ytdl_jobs.stage('ffmpeg'):
+            with span('probe', job, user_id):
+                k = await get_video_metadata(download_path)
         W = k.get('width')
         H = k.get('height')
         D = k.get('duration')
@@ -304,101 +622,337 @@ async def process_video(client, event, url, cookies_env_var, check_duration_and_
         thumbnail_url = info_dict.get('thumbnail', None)
         THUMB = None
 
-        if thumbnail_url:
-            thumbnail_file = os.path.join(tempfile.gettempdir(), get_random_string() + ".jpg")
-            downloaded_thumb = d_thumbnail(thumbnail_url, thumbnail_file)
-            if downloaded_thumb:
-                logger.info(f"Thumbnail saved at: {downloaded_thumb}")
+        with span('thumbnail', job, user_id):
+            if thumbnail_url:
+                thumbnail_file = ws.file("thumb.jpg")
+                downloaded_thumb = await download_file(thumbnail_url, thumbnail_file)
+                if downloaded_thumb:
+                    logger.info(f"Thumbnail saved at: {downloaded_thumb}")
 
-        if thumbnail_file and os.path.exists(thumbnail_file):
-            THUMB = thumbnail_file
-        else:
-            THUMB = await screenshot(download_path, metadata['duration'], event.sender_id)
+            if thumbnail_file and os.path.exists(thumbnail_file):
+                THUMB = thumbnail_file
+            else:
+                async with ytdl_jobs.stage('ffmpeg'):
+                    THUMB = await screenshot(download_path, metadata['duration'], event.sender_id)
 
         chat_id = event.chat_id
-        SIZE = 2 * 1024 * 1024 * 1024
+        SIZE = UPLOAD_LIMIT
         caption = f"{title}"
 
         if os.path.exists(download_path) and os.path.getsize(download_path) > SIZE:
             prog = await client.send_message(chat_id, "**__Starting Upload...__**")
-            await split_and_upload_file(app, chat_id, download_path, caption)
+            async with ytdl_jobs.stage('upload'):
+                if SPLIT_MODE == "video" and metadata['duration'] and metadata['duration'] > 1:
+                    # Room for the part being uploaded plus the one being cut
+                    await ws.grow(2 * PART_SIZE)
+                    await split_and_upload_video(app, chat_id, user_id, download_path, caption, metadata['duration'])
+                else:
+                    await split_and_upload_file(app, chat_id, user_id, download_path, caption)
             await prog.delete()
-            if thumbnail_file and os.path.exists(thumbnail_file):
-                os.remove(thumbnail_file)
-            if temp_cookie_path and os.path.exists(temp_cookie_path):
-                os.remove(temp_cookie_path)
             return
 
         if os.path.exists(download_path):
             await progress_message.delete()
             prog = await client.send_message(chat_id, "**__Starting Upload...__**")
-            uploaded = await fast_upload(
-                client, download_path,
-                reply=prog,
-                progress_bar_function=lambda done, total: progress_callback(done, total, chat_id)
-            )
-            await client.send_file(
-                event.chat_id,
-                uploaded,
-                caption=f"**{title}**",
-                attributes=[
-                    DocumentAttributeVideo(
-                        duration=metadata['duration'],
-                        w=metadata['width'],
-                        h=metadata['height'],
-                        supports_streaming=True
+            async with ytdl_jobs.stage('upload'):
+                with span('upload', job, user_id, bytes=os.path.getsize(download_path)):
+                    uploaded = await telethon_upload(
+                        client, download_path, progress=bandwidth.track(upload_progress(prog, chat_id), user_id, 'upload')
                     )
-                ],
-                thumb=THUMB if THUMB else None
-            )
+                    sent = await client.send_file(
+                        event.chat_id,
+                        uploaded,
+                        caption=f"**{title}**",
+                        attributes=[
+                            DocumentAttributeVideo(
+                                duration=metadata['duration'],
+                                w=metadata['width'],
+                                h=metadata['height'],
+                                supports_streaming=True
+                            )
+                        ],
+                        thumb=THUMB if THUMB else None
+                    )
+            await remember_media(url, VIDEO_PROFILE, sent, f"**{title}**")
+            BYTES.inc(os.path.getsize(download_path), direction='upload')
             if prog:
                 await prog.delete()
         else:
+            job_failed()
             await event.reply("**__File not found after download. Something went wrong!__**")
     except Exception as e:
+        job_failed()
+        count_flood_wait(e)
         logger.exception("An error occurred during download or upload.")
         await event.reply(f"**__An error occurred: {e}__**")
     finally:
-        if os.path.exists(download_path):
-            os.remove(download_path)
-        if temp_cookie_path and os.path.exists(temp_cookie_path):
-            os.remove(temp_cookie_path)
-        if thumbnail_file and os.path.exists(thumbnail_file):
-            os.remove(thumbnail_file)
+        await session.close()
+        await ws.close()
 
-async def split_and_upload_file(app, sender, file_path, caption):
+async def split_and_upload_file(app, sender, user_id, file_path, caption):
     if not os.path.exists(file_path):
         await app.send_message(sender, "❌ File not found!")
         return
 
     file_size = os.path.getsize(file_path)
     start = await app.send_message(sender, f"ℹ️ File size: {file_size / (1024 * 1024):.2f} MB")
-    PART_SIZE = int(1.9 * 1024 * 1024 * 1024)
-
-    part_number = 0
-    async with aiofiles.open(file_path, mode="rb") as f:
-        while True:
-            chunk = await f.read(PART_SIZE)
-            if not chunk:
-                break
-
-            base_name, file_ext = os.path.splitext(file_path)
-            part_file = f"{base_name}.part{str(part_number).zfill(3)}{file_ext}"
-
-            async with aiofiles.open(part_file, mode="wb") as part_f:
-                await part_f.write(chunk)
 
+    # Each part is a bounded view of the original file: no temp copies, no 1.9 GB buffers
+    for part_number, part in iter_file_parts(file_path, PART_SIZE):
+        with part:
             edit = await app.send_message(sender, f"⬆️ Uploading part {part_number + 1}...")
             part_caption = f"{caption} \n\n**Part : {part_number + 1}**"
-            await app.send_document(sender, document=part_file, caption=part_caption)
+            await app.send_document(
+                sender, document=part, file_name=part.name, caption=part_caption,
+                progress=bandwidth.track(None, user_id, 'upload')
+            )
+            BYTES.inc(len(part), direction='upload')
             await edit.delete()
-            os.remove(part_file)
 
-            part_number += 1
+    await start.delete()
+    os.remove(file_path)
+
+async def split_and_upload_video(app, sender, user_id, file_path, caption, duration):
+    """Upload an oversized video as independently playable, streamable parts."""
+    if not os.path.exists(file_path):
+        await app.send_message(sender, "❌ File not found!")
+        return
+
+    file_size = os.path.getsize(file_path)
+    start = await app.send_message(sender, f"ℹ️ File size: {file_size / (1024 * 1024):.2f} MB")
+
+    uploaded_parts = 0
+    try:
+        # Probed and thumbnailed in the same ffmpeg slot as its cut, so the upload of
+        # part N never waits behind the cut of part N+1
+        async def prepare(part_path, part_length):
+            meta = await get_video_metadata(part_path)
+            part_duration = meta['duration'] if meta['duration'] > 1 else int(part_length)
+            return meta, part_duration, await screenshot(part_path, part_duration, sender)
+
+        # iter_video_parts cuts part N+1 with ffmpeg while part N is uploading; aclosing stops
+        # that cut and removes its file straight away if an upload fails
+        ffmpeg_slot = functools.partial(ytdl_jobs.stage, 'ffmpeg')
+        parts = iter_video_parts(file_path, PART_SIZE, duration, slot=ffmpeg_slot, prepare=prepare)
+        async with contextlib.aclosing(parts):
+            async for part_number, part_path, part_start, part_length, prepared in parts:
+                edit = await app.send_message(sender, f"⬆️ Uploading part {part_number + 1}...")
+                meta, part_duration, thumb = prepared
+                part_caption = f"{caption} \n\n**Part : {part_number + 1}**"
+                try:
+                    await app.send_video(
+                        sender,
+                        video=part_path,
+                        caption=part_caption,
+                        duration=part_duration,
+                        width=meta['width'],
+                        height=meta['height'],
+                        thumb=thumb,
+                        supports_streaming=True,
+                        progress=bandwidth.track(None, user_id, 'upload')
+                    )
+                finally:
+                    if thumb and thumb != f"{sender}.jpg" and os.path.exists(thumb):
+                        os.remove(thumb)
+                BYTES.inc(os.path.getsize(part_path), direction='upload')
+                uploaded_parts += 1
+                await edit.delete()
+    except RuntimeError as e:
+        if uploaded_parts:
+            raise
+        logger.warning(f"Playable split failed, falling back to byte parts: {e}")
+        await start.delete()
+        await split_and_upload_file(app, sender, user_id, file_path, caption)
+        return
 
     await start.delete()
     os.remove(file_path)
 
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+def is_playlist_url(url):
+    """Links that only make sense as a whole list (not a single video inside a list)."""
+    return '/playlist' in url or ('list=' in url and 'v=' not in url)
+
+class PlaylistStatus:
+    """One status message for the whole playlist, edited at most every few seconds."""
+
+    def __init__(self, message, title, total):
+        self.message = message
+        self.title = title
+        self.total = total
+        self.active = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.last_edit = 0
+
+    def text(self, final=False):
+        head = "✅ **Playlist finished**" if final else "📥 **Downloading playlist**"
+        return (
+            f"{head}\n**{self.title}**\n\n"
+            f"⬆️ Uploaded: {self.uploaded}/{self.total}\n"
+            f"⬇️ In progress: {self.active}\n"
+            f"❌ Failed: {self.failed}"
+        )
+
+    async def refresh(self, force=False, final=False):
+        now = time.time()
+        if not force and now - self.last_edit < 5:
+            return
+        self.last_edit = now
+        try:
+            await self.message.edit(self.text(final))
+        except Exception as e:
+            logger.debug(f"Playlist status edit failed: {e}")
+
+async def download_playlist_item(entry, index, ws, cookies_path, limiter, status, user_id):
+    """Download one entry into the workspace; returns (path, info, reserved bytes) or None on failure."""
+    prefix = ws.file(f"{index:03d}")
+    async with limiter:
+        status.active += 1
+        await status.refresh()
+        session = open_session({
+            **VIDEO_OPTS,
+            'outtmpl': f"{prefix}.%(ext)s",
+            'cookiefile': cookies_path,
+            'ratelimit': bandwidth.ytdl_rate_limit(PLAYLIST_CONCURRENCY),
+            'quiet': True,
+            'noplaylist': True,
+        }, bandwidth.Meter(user_id, 'download').feed)
+        reserved = 0
+        try:
+            async with ytdl_jobs.stage('extract'):
+                if entry.get('_type') in ('url', 'url_transparent'):
+                    info = await extract_cached(session, entry.get('url') or entry.get('webpage_url'))
+                else:
+                    info = entry
+                plan = plan_format(info, UPLOAD_LIMIT)
+                size = plan.size or estimate_size(info)
+                await ws.grow(size)
+                reserved = size
+                result = await session.download(info, plan.spec)
+            path = downloaded_path(result, prefix)
+            if path:
+                BYTES.inc(os.path.getsize(path), direction='download')
+                return path, info, reserved
+        except Exception as e:
+            logger.warning(f"Playlist item {index + 1} failed: {e}")
+        finally:
+            status.active -= 1
+            await session.close()
+    await ws.shrink(reserved)
+    return None
+
+async def upload_playlist_item(chat_id, user_id, path, info, index):
+    caption = f"**{info.get('title') or f'Item {index + 1}'}**"
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        await client.send_file(chat_id, path, caption=caption)
+        return
+    if os.path.getsize(path) > UPLOAD_LIMIT:
+        await split_and_upload_file(app, chat_id, user_id, path, caption)
+        return
+
+    async with ytdl_jobs.stage('ffmpeg'):
+        meta = await get_video_metadata(path)
+        duration = int(info.get('duration') or 0) or meta['duration']
+        thumb = await screenshot(path, duration, user_id)
+    async with ytdl_jobs.stage('upload'):
+        uploaded = await telethon_upload(client, path, progress=bandwidth.track(None, user_id, 'upload'))
+        sent = await client.send_file(
+            chat_id,
+            uploaded,
+            caption=caption,
+            attributes=[
+                DocumentAttributeVideo(
+                    duration=duration,
+                    w=info.get('width') or meta['width'],
+                    h=info.get('height') or meta['height'],
+                    supports_streaming=True
+                )
+            ],
+            thumb=thumb
+        )
+    BYTES.inc(os.path.getsize(path), direction='upload')
+    item_url = info.get('webpage_url') or info.get('original_url')
+    if item_url:
+        await remember_media(item_url, VIDEO_PROFILE, sent, caption)
+
+async def process_playlist(client, event, url, cookies_env_var, info=None):
+    """Download up to PLAYLIST_MAX_ITEMS entries concurrently and upload them in playlist order."""
+    cookies = os.getenv(cookies_env_var) if cookies_env_var else None
+    job = new_job_id()
+    user_id = event.sender_id
+    chat_id = event.chat_id
+    ws = await scratch.open(job)
+    cookies_path = write_cookies(ws, cookies)
+    message = await event.reply("**__Reading playlist...__**")
+    tasks = []
+    try:
+        if info is None:
+            session = open_session({
+                'extract_flat': 'in_playlist',
+                'playlistend': PLAYLIST_MAX_ITEMS,
+                'cookiefile': cookies_path,
+                'quiet': True,
+            })
+            try:
+                async with ytdl_jobs.stage('extract'):
+                    with span('ytdl_extract', job, user_id, kind='playlist'):
+                        info = await session.extract(url)
+            finally:
+                await session.close()
+
+        entries = [e for e in (info.get('entries') or []) if e][:PLAYLIST_MAX_ITEMS]
+        if info.get('_type') not in PLAYLIST_TYPES or not entries:
+            await message.edit("**__No playlist entries found in that link.__**")
+            return
+
+        status = PlaylistStatus(message, info.get('title') or url, len(entries))
+        await status.refresh(force=True)
+        limiter = asyncio.Semaphore(PLAYLIST_CONCURRENCY)
+        tasks = [
+            asyncio.create_task(download_playlist_item(entry, i, ws, cookies_path, limiter, status, user_id))
+            for i, entry in enumerate(entries)
+        ]
+        # Items download concurrently but are uploaded strictly in playlist order
+        for index, task in enumerate(tasks):
+            item = await task
+            if not item:
+                status.failed += 1
+                await status.refresh()
+                continue
+            path, item_info, reserved = item
+            size = os.path.getsize(path)
+            try:
+                with span('upload', job, user_id, bytes=size, item=index + 1):
+                    await upload_playlist_item(chat_id, user_id, path, item_info, index)
+                status.uploaded += 1
+            except Exception as e:
+                count_flood_wait(e)
+                logger.warning(f"Uploading playlist item {index + 1} failed: {e}")
+                status.failed += 1
+            finally:
+                # The split helpers delete the file themselves once every part is sent
+                try:
+                    with contextlib.suppress(FileNotFoundError):
+                        await asyncio.to_thread(os.remove, path)
+                finally:
+                    await ws.shrink(reserved)
+            await status.refresh()
+        await status.refresh(force=True, final=True)
+    except Exception as e:
+        job_failed()
+        count_flood_wait(e)
+        logger.exception("Playlist download failed")
+        await event.reply(f"**__An error occurred: {e}__**")
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await ws.close()
+
 PROGRESS_BAR = """
 │ **__Completed:__** {1}/{2}
 │ **__Bytes:__** {0}%
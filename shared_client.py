@@ -1,35 +1,75 @@
+import asyncio
 from telethon import TelegramClient
-from config import API_ID, API_HASH, BOT_TOKEN, STRING
+from config import API_ID, API_HASH, BOT_TOKEN, STRING, STRINGS, ROLE, WORKER_NAME
 from pyrogram import Client
+from utils.uploader import install_pyrogram_uploader
+from utils.userbots import UserbotPool
+from utils.startup import phase
+from utils.router import install_router
 
-client = TelegramClient("telethonbot", API_ID, API_HASH)
-app = Client("pyrogrambot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
-userbot = Client("4gbbot", api_id=API_ID, api_hash=API_HASH, session_string=STRING)
+SESSIONS = list(dict.fromkeys(([STRING] if STRING else []) + STRINGS))
 
-async def start_client():
-    # Start Telethon client
-    try:
-        await client.start(bot_token=BOT_TOKEN)
-        print("SpyLib started...")
-    except Exception as e:
-        print(f"Failed to start Telethon bot: {e}")
-        raise
+# Workers only send and upload: they get their own session files and never receive updates
+WORKER = ROLE == "worker"
+client = TelegramClient(
+    f"telethonbot-{WORKER_NAME}" if WORKER else "telethonbot", API_ID, API_HASH, receive_updates=not WORKER
+)
+app = Client(
+    f"pyrogrambot-{WORKER_NAME}" if WORKER else "pyrogrambot",
+    api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN, no_updates=WORKER
+)
+userbot_clients = [
+    Client("4gbbot" if i == 0 else f"4gbbot{i + 1}", api_id=API_ID, api_hash=API_HASH, session_string=session)
+    for i, session in enumerate(SESSIONS)
+]
+userbot = userbot_clients[0] if userbot_clients else Client("4gbbot", api_id=API_ID, api_hash=API_HASH, session_string=STRING)
+userbots = UserbotPool()
+install_pyrogram_uploader(app)
+install_router(app)
+for _userbot in userbot_clients or [userbot]:
+    install_pyrogram_uploader(_userbot)
+
+async def start_telethon():
+    with phase("client:telethon"):
+        try:
+            await client.start(bot_token=BOT_TOKEN)
+            print("SpyLib started...")
+        except Exception as e:
+            print(f"Failed to start Telethon bot: {e}")
+            raise
 
-    # Start Pyrogram userbot if STRING is provided
-    if STRING:
+async def start_app():
+    with phase("client:pyrogram"):
         try:
-            await userbot.start()
-            print("Userbot started...")
+            await app.start()
+            print("Pyro App Started...")
         except Exception as e:
-            print(f"Check your premium string session, it may be invalid or expired: {e}")
+            print(f"Failed to start Pyrogram bot: {e}")
             raise
 
-    # Start Pyrogram bot client
-    try:
-        await app.start()
-        print("Pyro App Started...")
-    except Exception as e:
-        print(f"Failed to start Pyrogram bot: {e}")
-        raise
+async def start_userbot(i, session_client):
+    """Started client, or None when the session is invalid; it then stays out of the pool."""
+    with phase(f"client:userbot{i}"):
+        try:
+            await session_client.start()
+            print(f"Userbot {i} started...")
+            return session_client
+        except Exception as e:
+            print(f"Check your premium string session {i}, it may be invalid or expired: {e}")
+            return None
+
+async def start_client():
+    # Every client connects and authorizes at the same time; most of the wait is network round trips.
+    # Batch jobs, the only users of the userbot pool, stay with the dispatcher
+    sessions = [] if WORKER else userbot_clients
+    _, _, *started = await asyncio.gather(
+        start_telethon(), start_app(), *(start_userbot(i, c) for i, c in enumerate(sessions, 1))
+    )
+    # Added in configuration order so the STRING session stays userbot1
+    for session_client in started:
+        if session_client:
+            await userbots.add(session_client)
+    if sessions and not userbots:
+        raise RuntimeError("None of the premium string sessions could be started")
 
     return client, app, userbot
@@ -0,0 +1,93 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+# mutagen is imported inside each tagger so only /adl jobs pay for loading it
+
+import base64
+import importlib
+import os
+
+
+def _tag_mp3(path, title, artist, comment, cover):
+    from mutagen.id3 import ID3, TIT2, TPE1, COMM, APIC
+    from mutagen.mp3 import MP3
+    audio = MP3(path, ID3=ID3)
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags["TIT2"] = TIT2(encoding=3, text=title)
+    audio.tags["TPE1"] = TPE1(encoding=3, text=artist)
+    audio.tags["COMM"] = COMM(encoding=3, lang="eng", desc="Comment", text=comment)
+    if cover:
+        audio.tags["APIC"] = APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=cover)
+    audio.save()
+
+
+def _tag_mp4(path, title, artist, comment, cover):
+    from mutagen.mp4 import MP4, MP4Cover
+    audio = MP4(path)
+    if audio.tags is None:
+        audio.add_tags()
+    audio.tags["\xa9nam"] = [title]
+    audio.tags["\xa9ART"] = [artist]
+    audio.tags["\xa9cmt"] = [comment]
+    if cover:
+        audio.tags["covr"] = [MP4Cover(cover, imageformat=MP4Cover.FORMAT_JPEG)]
+    audio.save()
+
+
+def _picture(cover):
+    from mutagen.flac import Picture
+    picture = Picture()
+    picture.type = 3
+    picture.mime = "image/jpeg"
+    picture.desc = "Cover"
+    picture.data = cover
+    return picture
+
+
+def _tag_vorbis(module, name):
+    def tag(path, title, artist, comment, cover):
+        audio = getattr(importlib.import_module(f"mutagen.{module}"), name)(path)
+        audio["title"] = title
+        audio["artist"] = artist
+        audio["comment"] = comment
+        if cover:
+            # Ogg containers carry cover art as a base64 FLAC picture block
+            audio["metadata_block_picture"] = base64.b64encode(_picture(cover).write()).decode("ascii")
+        audio.save()
+    return tag
+
+
+def _tag_flac(path, title, artist, comment, cover):
+    from mutagen.flac import FLAC
+    audio = FLAC(path)
+    audio["title"] = title
+    audio["artist"] = artist
+    audio["comment"] = comment
+    if cover:
+        audio.clear_pictures()
+        audio.add_picture(_picture(cover))
+    audio.save()
+
+
+TAGGERS = {
+    ".mp3": _tag_mp3,
+    ".m4a": _tag_mp4,
+    ".mp4": _tag_mp4,
+    ".opus": _tag_vorbis("oggopus", "OggOpus"),
+    ".ogg": _tag_vorbis("oggvorbis", "OggVorbis"),
+    ".flac": _tag_flac,
+}
+
+
+def write_tags(path, title, artist, comment, cover=None):
+    """Write title/artist/comment and optional JPEG cover in the file's own container format.
+
+    Blocking; call it through asyncio.to_thread. Returns False for containers we cannot tag.
+    """
+    tagger = TAGGERS.get(os.path.splitext(path)[1].lower())
+    if not tagger:
+        return False
+    tagger(path, title, artist, comment, cover)
+    return True
@@ -0,0 +1,235 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""Per-user transfer accounting, daily quotas and optional throughput shaping.
+
+Download and upload progress callbacks report cumulative bytes through a Meter.
+The deltas are summed in memory per user and day and flushed to the statistics
+collection every BANDWIDTH_FLUSH_INTERVAL seconds, one $inc per user and day.
+Daily quotas count delivered (uploaded) bytes; with USER_RATE_LIMIT_KBPS set, a
+token bucket per user also caps how fast that user's transfers run.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from config import (
+    OWNER_ID, BANDWIDTH_FLUSH_INTERVAL, FREE_DAILY_QUOTA_MB, PREMIUM_DAILY_QUOTA_MB, USER_RATE_LIMIT_KBPS
+)
+from utils.metrics import REGISTRY
+from utils.state import store
+
+logger = logging.getLogger(__name__)
+
+BANDWIDTH_FLUSHES = REGISTRY.counter("spybot_bandwidth_flushes_total", "Per-user byte flushes to MongoDB by result.", ["result"])
+QUOTA_REJECTIONS = REGISTRY.counter("spybot_quota_rejections_total", "Jobs refused because the user's daily quota is used up.", ["tier"])
+THROTTLED_SECONDS = REGISTRY.counter(
+    "spybot_throttled_seconds_total", "Time transfers spent waiting on per-user rate limits.", ["direction"]
+)
+
+DIRECTIONS = ("download", "upload")
+RATE = USER_RATE_LIMIT_KBPS * 1024
+RETENTION = timedelta(days=90)
+
+# Bytes not flushed yet: {(user_id, day): {direction: bytes}}
+_pending = {}
+_flusher = None
+_collection = None
+_buckets = store.namespace('bandwidth_buckets', ttl=600, max_size=10000)
+
+
+def _day():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def record(user_id, nbytes, direction):
+    """Count `nbytes` moved for `user_id`; they reach MongoDB with the next flush."""
+    if not user_id or nbytes <= 0:
+        return
+    counts = _pending.setdefault((user_id, _day()), dict.fromkeys(DIRECTIONS, 0))
+    counts[direction] += nbytes
+    _start_flusher()
+
+
+class TokenBucket:
+    """`rate` bytes per second with up to one second of burst; callers go into debt and wait it off."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def reserve(self, nbytes):
+        """Take `nbytes` now and return how many seconds the caller should wait for them."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= nbytes
+        return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+async def throttle(user_id, nbytes, direction):
+    if not RATE or not user_id or nbytes <= 0:
+        return
+    bucket = _buckets.get(user_id)
+    if bucket is None:
+        bucket = _buckets[user_id] = TokenBucket(RATE)
+    wait = bucket.reserve(nbytes)
+    if wait:
+        THROTTLED_SECONDS.inc(wait, direction=direction)
+        await asyncio.sleep(wait)
+
+
+class Meter:
+    """Turns one transfer's cumulative progress into per-user byte deltas."""
+
+    def __init__(self, user_id, direction):
+        self.user_id = user_id
+        self.direction = direction
+        self.seen = {}
+
+    def _delta(self, done, key=None):
+        # A retried part can report less than before; only bytes past the high-water mark count
+        delta = done - self.seen.get(key, 0)
+        if delta <= 0:
+            return 0
+        self.seen[key] = done
+        record(self.user_id, delta, self.direction)
+        return delta
+
+    async def update(self, done, total=None):
+        await throttle(self.user_id, self._delta(done), self.direction)
+
+    def feed(self, d):
+        """yt-dlp progress hook; downloaded_bytes starts over for every file of a download."""
+        if d.get('downloaded_bytes'):
+            self._delta(d['downloaded_bytes'], d.get('filename'))
+
+
+def track(progress, user_id, direction):
+    """Wrap a Pyrogram-style `progress(current, total, *args)` so the transfer is counted and shaped.
+
+    The wrapper is a coroutine function on purpose: Pyrogram runs plain
+    callbacks in its thread pool, where the shaping sleep would not work.
+    """
+    meter = Meter(user_id, direction)
+
+    async def metered(current, total, *args):
+        await meter.update(current, total)
+        if progress is not None:
+            result = progress(current, total, *args)
+            if inspect.isawaitable(result):
+                await result
+    return metered
+
+
+def ytdl_rate_limit(share=1):
+    """yt-dlp `ratelimit` for one of `share` concurrent downloads of a user; None when unshaped."""
+    return max(1, RATE // share) if RATE else None
+
+
+def daily_quota(premium):
+    return (PREMIUM_DAILY_QUOTA_MB if premium else FREE_DAILY_QUOTA_MB) * 1024 * 1024
+
+
+async def used_today(user_id):
+    """Bytes delivered to `user_id` today: the flushed total plus what this process still holds."""
+    day = _day()
+    doc = await _store().find_one({"_id": f"{user_id}:{day}"}, {"upload": 1})
+    flushed = doc.get("upload", 0) if doc else 0
+    return flushed + _pending.get((user_id, day), {}).get("upload", 0)
+
+
+async def quota_exceeded(user_id):
+    """The message to send when `user_id` has used up today's quota, otherwise None."""
+    if not (FREE_DAILY_QUOTA_MB or PREMIUM_DAILY_QUOTA_MB) or user_id in OWNER_ID:
+        return None
+    from utils.func import is_premium_user
+    premium = await is_premium_user(user_id)
+    limit = daily_quota(premium)
+    if not limit:
+        return None
+    used = await used_today(user_id)
+    if used < limit:
+        return None
+    QUOTA_REJECTIONS.inc(tier="premium" if premium else "free")
+    message = (
+        f"You have used today's transfer quota ({used / 1024 ** 3:.2f} GB of {limit / 1024 ** 3:.2f} GB). "
+        "It resets at 00:00 UTC."
+    )
+    return message if premium else message + " Send /pay to get a larger one."
+
+
+def _store():
+    global _collection
+    if _collection is None:
+        from utils.func import statistics_collection
+        _collection = statistics_collection
+    return _collection
+
+
+def _start_flusher():
+    # Like the state sweeper, this needs a running loop, so it starts with the first recorded byte
+    global _flusher
+    if _flusher is None:
+        try:
+            _flusher = asyncio.get_running_loop().create_task(_flush_forever())
+        except RuntimeError:
+            pass
+
+
+async def _flush_forever():
+    # Nothing here may end the loop: a dead flusher would silently stop all accounting
+    indexed = False
+    while True:
+        await asyncio.sleep(BANDWIDTH_FLUSH_INTERVAL)
+        if not indexed:
+            try:
+                await _store().create_index("expireAt", expireAfterSeconds=0)
+                indexed = True
+            except Exception as e:
+                logger.warning(f"Could not create the bandwidth expiry index, retrying next flush: {e}")
+        try:
+            await flush()
+        except Exception:
+            logger.exception("Bandwidth flush failed")
+
+
+async def flush():
+    """Write every pending count with one bulk upsert; counts that fail stay pending for the next try."""
+    if not _pending:
+        return 0
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+    batch = list(_pending.items())
+    _pending.clear()
+    expire_at = datetime.now(timezone.utc) + RETENTION
+    ops = [
+        UpdateOne(
+            {"_id": f"{user_id}:{day}"},
+            {"$inc": {d: n for d, n in counts.items() if n},
+             "$setOnInsert": {"user_id": user_id, "day": day, "expireAt": expire_at}},
+            upsert=True,
+        )
+        for (user_id, day), counts in batch
+    ]
+    try:
+        await _store().bulk_write(ops, ordered=False)
+    except Exception as e:
+        # An unordered bulk write applies every op it does not report, so only those are retried
+        if isinstance(e, BulkWriteError):
+            failed = [batch[error["index"]] for error in e.details.get("writeErrors", [])]
+        else:
+            failed = batch
+        for key, counts in failed:
+            merged = _pending.setdefault(key, dict.fromkeys(DIRECTIONS, 0))
+            for direction, n in counts.items():
+                merged[direction] += n
+        BANDWIDTH_FLUSHES.inc(result="error")
+        logger.warning(f"Could not flush bandwidth counters for {len(failed)} user(s): {e}")
+        return len(ops) - len(failed)
+    BANDWIDTH_FLUSHES.inc(result="ok")
+    return len(ops)
@@ -0,0 +1,263 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""Job queue shared by a dispatcher and any number of worker processes.
+
+The dispatcher stores each accepted command as a job document. Workers claim
+jobs with a lease and keep extending it with heartbeats while the job runs; a
+job whose lease runs out (its worker crashed or lost the network) goes back to
+the queue for another worker, up to JOB_MAX_ATTEMPTS claims.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from config import JOB_BROKER, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, WORKER_NAME
+from utils.metrics import REGISTRY
+from utils.trace import new_job_id
+
+logger = logging.getLogger(__name__)
+
+BROKER_JOBS = REGISTRY.counter("spybot_broker_jobs_total", "Broker jobs by type and final status.", ["type", "status"])
+LEASES_LOST = REGISTRY.counter("spybot_broker_leases_lost_total", "Jobs cancelled because their lease moved elsewhere.")
+
+POLL_INTERVAL = 2
+WORKER_ID = f"{WORKER_NAME}-{os.getpid()}"
+
+
+def _job_document(job_type, event, payload):
+    return {
+        "type": job_type,
+        "user_id": event.sender_id,
+        "chat_id": event.chat_id,
+        "message_id": event.message.id,
+        "text": event.message.text,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "worker": None,
+        "progress": None,
+    }
+
+
+class MongoBroker:
+    """Jobs live in one collection; claims are single find_one_and_update calls, so two workers never share one."""
+
+    def __init__(self, collection):
+        self.jobs = collection
+        self._indexes_ready = False
+
+    async def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.jobs.create_index([("status", 1), ("type", 1), ("created", 1)])
+        await self.jobs.create_index("user_id")
+        await self.jobs.create_index("expireAt", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    async def enqueue(self, job_type, event, payload):
+        await self._ensure_indexes()
+        job = _job_document(job_type, event, payload)
+        job.update(_id=new_job_id(), created=datetime.now(timezone.utc), lease_until=None)
+        await self.jobs.insert_one(job)
+        return job["_id"]
+
+    async def claim(self, job_types):
+        now = datetime.now(timezone.utc)
+        # Jobs that keep losing their worker are probably what kills it
+        abandoned = await self.jobs.update_many(
+            {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": JOB_MAX_ATTEMPTS}},
+            {"$set": {"status": "failed", "error": "lease expired too many times", "expireAt": now + timedelta(days=1)}}
+        )
+        if abandoned.modified_count:
+            logger.warning(f"Gave up on {abandoned.modified_count} job(s) whose workers kept disappearing")
+        return await self.jobs.find_one_and_update(
+            {"type": {"$in": list(job_types)}, "$or": [
+                {"status": "queued"},
+                # Checked here too: the update_many above can race another worker's claim
+                {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": JOB_MAX_ATTEMPTS}},
+            ]},
+            {"$set": {"status": "running", "worker": WORKER_ID, "started": now,
+                      "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS)},
+             "$inc": {"attempts": 1}},
+            sort=[("created", 1)],
+            return_document=True,
+        )
+
+    async def heartbeat(self, job_id, progress=None):
+        """Extend our lease; False when another worker has taken the job over."""
+        now = datetime.now(timezone.utc)
+        result = await self.jobs.update_one(
+            {"_id": job_id, "worker": WORKER_ID, "status": "running"},
+            {"$set": {"lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS), "progress": progress, "beat": now}}
+        )
+        return result.matched_count == 1
+
+    async def finish(self, job_id, error=None):
+        now = datetime.now(timezone.utc)
+        await self.jobs.update_one(
+            {"_id": job_id, "worker": WORKER_ID},
+            {"$set": {"status": "failed" if error else "done", "error": error, "finished": now,
+                      "expireAt": now + timedelta(days=1)}}
+        )
+
+    async def active(self, user_id):
+        return await self.jobs.count_documents({"user_id": user_id, "status": {"$in": ["queued", "running"]}}, limit=1) > 0
+
+    async def pending(self):
+        return await self.jobs.count_documents({"status": "queued"})
+
+    async def position(self, job_id):
+        job = await self.jobs.find_one({"_id": job_id}, {"created": 1})
+        if not job:
+            return None
+        return await self.jobs.count_documents({"status": "queued", "created": {"$lte": job["created"]}})
+
+
+class LocalBroker:
+    """In-memory stand-in with the same interface, for running dispatcher and worker in one process."""
+
+    def __init__(self):
+        self.jobs = {}
+
+    async def enqueue(self, job_type, event, payload):
+        job = _job_document(job_type, event, payload)
+        job.update(_id=new_job_id(), created=time.monotonic(), lease_until=0)
+        self.jobs[job["_id"]] = job
+        return job["_id"]
+
+    async def claim(self, job_types):
+        now = time.monotonic()
+        for job in sorted(self.jobs.values(), key=lambda j: j["created"]):
+            expired = job["status"] == "running" and job["lease_until"] < now
+            if job["type"] not in job_types or not (job["status"] == "queued" or expired):
+                continue
+            if expired and job["attempts"] >= JOB_MAX_ATTEMPTS:
+                job.update(status="failed", error="lease expired too many times")
+                continue
+            job.update(status="running", worker=WORKER_ID, lease_until=now + JOB_LEASE_SECONDS)
+            job["attempts"] += 1
+            return dict(job)
+        return None
+
+    async def heartbeat(self, job_id, progress=None):
+        job = self.jobs.get(job_id)
+        if not job or job["worker"] != WORKER_ID or job["status"] != "running":
+            return False
+        job.update(lease_until=time.monotonic() + JOB_LEASE_SECONDS, progress=progress)
+        return True
+
+    async def finish(self, job_id, error=None):
+        # Finished jobs are only kept for the Mongo broker's audit trail
+        self.jobs.pop(job_id, None)
+
+    async def active(self, user_id):
+        return any(j["user_id"] == user_id and j["status"] in ("queued", "running") for j in self.jobs.values())
+
+    async def pending(self):
+        return sum(1 for j in self.jobs.values() if j["status"] == "queued")
+
+    async def position(self, job_id):
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+        return sum(1 for j in self.jobs.values() if j["status"] == "queued" and j["created"] <= job["created"])
+
+
+def make_broker(kind=JOB_BROKER):
+    """Broker chosen by JOB_BROKER, or None when jobs run in-process."""
+    if kind == "mongo":
+        from utils.func import db
+        return MongoBroker(db["jobs"])
+    if kind == "local":
+        return LocalBroker()
+    if kind:
+        raise ValueError(f"Unknown JOB_BROKER {kind!r}")
+    return None
+
+
+class RemoteEvent:
+    """Enough of a Telethon NewMessage event, rebuilt on a worker from a job document.
+
+    Replies go to the original chat through the worker's own client, and the
+    latest reply is reported back to the job as its progress.
+    """
+
+    def __init__(self, client, job):
+        self.client = client
+        self.job_id = job["_id"]
+        self.chat_id = job["chat_id"]
+        self.sender_id = job["user_id"]
+        self.message = SimpleNamespace(id=job["message_id"], text=job["text"])
+        self.progress = None
+
+    async def reply(self, message, **kwargs):
+        self.progress = message
+        return await self.client.send_message(self.chat_id, message, reply_to=self.message.id, **kwargs)
+
+
+async def _run_leased(broker, client, job, run):
+    event = RemoteEvent(client, job)
+    task = asyncio.create_task(run(event, job))
+    lease_until = time.monotonic() + JOB_LEASE_SECONDS
+    error = None
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=JOB_LEASE_SECONDS / 3)
+            if done:
+                break
+            try:
+                held = await broker.heartbeat(job["_id"], event.progress)
+            except Exception as e:
+                # A failed heartbeat is retried while the lease lasts; after that another
+                # worker may claim the job, so it must not keep running here as well
+                held = time.monotonic() < lease_until
+                logger.warning(f"Heartbeat for job {job['_id']} failed: {e}")
+            else:
+                if held:
+                    lease_until = time.monotonic() + JOB_LEASE_SECONDS
+            if not held:
+                LEASES_LOST.inc()
+                logger.warning(f"Lost the lease on job {job['_id']}; cancelling it here")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return
+        task.result()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        logger.exception(f"Job {job['_id']} failed: {e}")
+    BROKER_JOBS.inc(type=job["type"], status="failed" if error else "done")
+    await broker.finish(job["_id"], error)
+
+
+async def serve(broker, client, job_types, run, capacity):
+    """Claim and run jobs forever, at most `capacity` at a time.
+
+    `run(event, job)` gets a RemoteEvent replying through `client` and the job
+    document; heartbeats carry the event's latest reply as the job's progress.
+    """
+    running = set()
+    slots = asyncio.Semaphore(capacity)
+    logger.info(f"Worker {WORKER_ID} taking {', '.join(job_types)} jobs ({capacity} at a time)")
+    while True:
+        await slots.acquire()
+        try:
+            job = await broker.claim(job_types)
+        except Exception as e:
+            logger.error(f"Could not claim a job: {e}")
+            job = None
+        if job is None:
+            slots.release()
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+        task = asyncio.create_task(_run_leased(broker, client, job, run))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
@@ -3,13 +3,15 @@
 # See LICENSE file in the repository root for full license text.
 
 import concurrent.futures
+import functools
 import time
 from motor.motor_asyncio import AsyncIOMotorClient
 import asyncio
 import os, re
-import cv2
 import logging
 from datetime import datetime, timedelta, timezone
+from utils.metrics import MONGO_SECONDS
+from config import MEDIA_CACHE_DAYS
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,6 +30,16 @@ users_collection = db["users"]
 premium_users_collection = db["premium_users"]
 statistics_collection = db["statistics"]
 codedb = db["redeem_code"]
+media_cache_collection = db["media_cache"]
+_media_index_ready = False
+
+def mongo_timed(func):
+    """Record the latency of a MongoDB helper under its function name."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with MONGO_SECONDS.time(op=func.__name__):
+            return await func(*args, **kwargs)
+    return wrapper
 
 def is_private_link(link: str) -> bool:
     return bool(PRIVATE_LINK_PATTERN.match(link))
@@ -55,6 +67,7 @@ VIDEO_EXTENSIONS = {
     "mp4", "mkv", "avi", "mov", "wmv", "flv", "webm", "mpeg", "mpg", "3gp"
 }
 
+@mongo_timed
 async def save_user_data(user_id: int, key: str, value):
     """Save user data to MongoDB."""
     await users_collection.update_one(
@@ -83,6 +96,7 @@ async def process_text_with_rules(user_id: int, text: str) -> str:
         logger.error(f"Error processing text with rules: {e}")
         return text
 
+@mongo_timed
 async def get_user_data_key(user_id: int, key: str, default=None):
     """Get user data from MongoDB."""
     user_data = await users_collection.find_one({"user_id": int(user_id)})
@@ -96,7 +110,10 @@ async def screenshot(video: str, duration: int, sender: str) -> str | None:
         return existing_screenshot
 
     time_stamp = hhmmss(duration // 2)
-    output_file = datetime.now().isoformat("_", "seconds") + ".jpg"
+    # Next to the video, so it is removed together with the job's scratch directory
+    output_file = os.path.join(
+        os.path.dirname(video), f"thumb_{os.path.splitext(os.path.basename(video))[0]}_{int(time.time())}.jpg"
+    )
 
     cmd = [
         "ffmpeg",
@@ -132,6 +149,7 @@ async def get_video_metadata(file_path: str) -> dict:
     try:
         def _extract_metadata():
             try:
+                import cv2  # OpenCV takes seconds to import; only load it once a video is probed
                 vcap = cv2.VideoCapture(file_path)
                 if not vcap.isOpened():
                     return default_values
@@ -154,6 +172,7 @@ async def get_video_metadata(file_path: str) -> dict:
         logger.error(f"Error in get_video_metadata: {e}")
         return default_values
 
+@mongo_timed
 async def remove_user_session(user_id: int) -> bool:
     """Remove user session string from MongoDB"""
     try:
@@ -182,6 +201,7 @@ def get_dummy_filename(info: dict) -> str:
     }.get(file_type, "bin")
     return f"downloaded_file_{int(time.time())}.{extension}"
 
+@mongo_timed
 async def save_user_session(user_id: int, session_string: str) -> bool:
     """Save user session string to MongoDB"""
     try:
@@ -199,6 +219,7 @@ async def save_user_session(user_id: int, session_string: str) -> bool:
         logger.error(f"Error saving session for user {user_id}: {e}")
         return False
 
+@mongo_timed
 async def get_user_data(user_id: int):
     """Get user data from MongoDB"""
     try:
@@ -208,6 +229,7 @@ async def get_user_data(user_id: int):
         logger.error(f"Error retrieving user data for {user_id}: {e}")
         return None
 
+@mongo_timed
 async def add_premium_user(user_id: int, duration_value: int, duration_unit: str):
     """Add a user as premium member with expiration time"""
     try:
@@ -245,6 +267,7 @@ async def add_premium_user(user_id: int, duration_value: int, duration_unit: str
         logger.error(f"Error adding premium user {user_id}: {e}")
         return False, str(e)
 
+@mongo_timed
 async def is_premium_user(user_id: int) -> bool:
     """Check if user is a premium member"""
     try:
@@ -257,6 +280,7 @@ async def is_premium_user(user_id: int) -> bool:
         logger.error(f"Error checking premium status for {user_id}: {e}")
         return False
 
+@mongo_timed
 async def get_premium_details(user_id: int):
     """Get premium subscription details for a user"""
     try:
@@ -268,6 +292,57 @@ async def get_premium_details(user_id: int):
         logger.error(f"Error getting premium details for {user_id}: {e}")
         return None
 
+@mongo_timed
+async def get_cached_media(key: str):
+    """Look up a previously sent document and push its expiry forward on a hit"""
+    try:
+        now = datetime.now(timezone.utc)
+        return await media_cache_collection.find_one_and_update(
+            {"_id": key},
+            {"$set": {"expireAt": now + timedelta(days=MEDIA_CACHE_DAYS), "last_hit": now}, "$inc": {"hits": 1}}
+        )
+    except Exception as e:
+        logger.error(f"Error reading media cache for {key}: {e}")
+        return None
+
+@mongo_timed
+async def save_cached_media(key: str, document, caption: str):
+    """Remember the Telegram document sent for `key` so later requests can resend it"""
+    global _media_index_ready
+    try:
+        if not _media_index_ready:
+            await media_cache_collection.create_index("expireAt", expireAfterSeconds=0)
+            _media_index_ready = True
+        now = datetime.now(timezone.utc)
+        await media_cache_collection.update_one(
+            {"_id": key},
+            {"$set": {
+                "id": document.id,
+                "access_hash": document.access_hash,
+                "file_reference": document.file_reference,
+                "size": getattr(document, "size", 0),
+                "caption": caption,
+                "created": now,
+                "expireAt": now + timedelta(days=MEDIA_CACHE_DAYS)
+            }, "$setOnInsert": {"hits": 0}},
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error saving media cache for {key}: {e}")
+
+@mongo_timed
+async def remove_cached_media(prefix: str) -> int:
+    """Drop one cache entry, or every profile of a video when given its `extractor:id:` prefix"""
+    try:
+        if prefix.endswith(":"):
+            result = await media_cache_collection.delete_many({"_id": {"$regex": f"^{re.escape(prefix)}"}})
+        else:
+            result = await media_cache_collection.delete_one({"_id": prefix})
+        return result.deleted_count
+    except Exception as e:
+        logger.error(f"Error removing media cache for {prefix}: {e}")
+        return 0
+
 a1 = "c2F2ZV9yZXN0cmljdGVkX2NvbnRlbnRfYm90cw==" 
 a2 = "Nzk2"
 a3 = "Z2V0X21lc3NhZ2Vz" 
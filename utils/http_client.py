@@ -0,0 +1,49 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import os
+import aiofiles
+import aiohttp
+from config import HTTP_TIMEOUT, HTTP_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+_session = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Process-wide pooled session; created lazily inside the running loop."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, sock_connect=10),
+        )
+    return _session
+
+
+async def download_file(url: str, path: str) -> str | None:
+    """Stream `url` to `path` without blocking the loop; returns None on failure."""
+    try:
+        async with get_session().get(url) as response:
+            response.raise_for_status()
+            async with aiofiles.open(path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    await f.write(chunk)
+        return path
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Failed to download {url}: {e}")
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,134 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from utils.metrics import JOBS_QUEUED, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+STAGE_WAITING = REGISTRY.gauge("spybot_stage_waiting", "Jobs waiting for a stage slot.", ["queue", "stage"])
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ("job_type", "user_id", "run", "on_position", "enqueued_at")
+
+    def __init__(self, job_type, user_id, run, on_position=None):
+        self.job_type = job_type
+        self.user_id = user_id
+        self.run = run
+        self.on_position = on_position
+        self.enqueued_at = time.time()
+
+
+class JobQueue:
+    """FIFO queue drained by a fixed number of workers, with per-stage concurrency caps.
+
+    `run` is an async callable taking no arguments. Workers are started lazily
+    on the first submit so the queue can be created at import time.
+    """
+
+    def __init__(self, name, workers, stage_limits=None, max_size=0, default_duration=60.0):
+        self.name = name
+        self.workers = workers
+        self.max_size = max_size
+        self.stage_limits = dict(stage_limits or {})
+        self._stages = {}
+        self._waiting = deque()
+        self._wakeup = None
+        self._tasks = []
+        self._avg_duration = default_duration
+
+    def _ensure_stages(self):
+        if not self._stages:
+            self._stages = {k: asyncio.Semaphore(v) for k, v in self.stage_limits.items()}
+
+    def _ensure_started(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Condition()
+        self._ensure_stages()
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def position(self, user_id):
+        """1-based place of the user's first waiting job, or None."""
+        for i, job in enumerate(self._waiting):
+            if job.user_id == user_id:
+                return i + 1
+        return None
+
+    def eta(self, position):
+        """Seconds until a job at `position` should start, from the running average."""
+        return -(-position // self.workers) * self._avg_duration
+
+    async def submit(self, job_type, user_id, run, on_position=None):
+        """Enqueue a job and return its position; raises QueueFull when at capacity."""
+        self._ensure_started()
+        if self.max_size and len(self._waiting) >= self.max_size:
+            raise QueueFull(f"{self.name} queue is full")
+        self._waiting.append(Job(job_type, user_id, run, on_position))
+        JOBS_QUEUED.inc(type=job_type)
+        async with self._wakeup:
+            self._wakeup.notify()
+        return len(self._waiting)
+
+    @asynccontextmanager
+    async def stage(self, name):
+        """Hold one of the limited slots for a stage (extract, ffmpeg, upload...).
+
+        Also usable by jobs that never went through submit(), such as broker jobs on a worker.
+        """
+        self._ensure_stages()
+        sem = self._stages.get(name)
+        if sem is None:
+            yield
+            return
+        STAGE_WAITING.inc(queue=self.name, stage=name)
+        try:
+            await sem.acquire()
+        finally:
+            STAGE_WAITING.dec(queue=self.name, stage=name)
+        try:
+            yield
+        finally:
+            sem.release()
+
+    async def _announce_positions(self):
+        for i, job in enumerate(list(self._waiting)):
+            if job.on_position:
+                try:
+                    await job.on_position(i + 1, self.eta(i + 1))
+                except Exception as e:
+                    logger.debug(f"Position update failed: {e}")
+
+    async def _worker(self, index):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self._waiting)
+                job = self._waiting.popleft()
+            JOBS_QUEUED.dec(type=job.job_type)
+            asyncio.create_task(self._announce_positions())
+            started = time.time()
+            try:
+                await job.run()
+            except Exception as e:
+                logger.exception(f"{self.name} job for {job.user_id} failed: {e}")
+            finally:
+                elapsed = time.time() - started
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * elapsed
+
+
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds}s" if minutes else f"{seconds}s"
@@ -0,0 +1,267 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config import METRICS_FILE, METRICS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _fmt_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{n}="{_escape(v)}"' for n, v in pairs)
+        return "{" + body + "}"
+
+    def snapshot(self):
+        """Current values keyed by label-value tuples."""
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{self._fmt_labels(key)} {_num(value)}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, count, total) in items:
+            for bound, c in zip(self.buckets, counts):
+                yield f"{self.name}_bucket{self._fmt_labels(key, ('le', _num(bound)))} {c}"
+            yield f"{self.name}_bucket{self._fmt_labels(key, ('le', '+Inf'))} {count}"
+            yield f"{self.name}_count{self._fmt_labels(key)} {count}"
+            yield f"{self.name}_sum{self._fmt_labels(key)} {_num(total)}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, func):
+        """Register a callable that refreshes derived metrics right before rendering."""
+        self._collectors.append(func)
+
+    def render(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+JOBS_ACTIVE = REGISTRY.gauge("spybot_jobs_active", "Jobs currently running by type.", ["type"])
+JOBS_QUEUED = REGISTRY.gauge("spybot_jobs_queued", "Jobs waiting to run by type.", ["type"])
+JOBS_TOTAL = REGISTRY.counter("spybot_jobs_total", "Finished jobs by type and outcome.", ["type", "outcome"])
+BYTES = REGISTRY.counter("spybot_bytes_total", "Bytes moved by direction.", ["direction"])
+STAGE_SECONDS = REGISTRY.histogram("spybot_stage_seconds", "Latency of delivery stages.", ["stage"])
+FLOOD_WAITS = REGISTRY.counter("spybot_flood_waits_total", "FloodWait errors by client.", ["client"])
+FLOOD_WAIT_SECONDS = REGISTRY.counter("spybot_flood_wait_seconds_total", "Seconds requested by FloodWait errors.", ["client"])
+CACHE = REGISTRY.counter("spybot_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"])
+MONGO_SECONDS = REGISTRY.histogram(
+    "spybot_mongo_seconds", "Latency of MongoDB calls.", ["op"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+LAST_PUBLISH = REGISTRY.gauge("spybot_last_publish_timestamp_seconds", "Unix time the bot last exported metrics.")
+
+
+class _Job:
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome = "ok"
+
+    def fail(self):
+        self.outcome = "error"
+
+
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+@contextmanager
+def track_job(job_type):
+    """Count a job as active for the duration of the block.
+
+    The job is counted as failed if the block raises, or if it reports its own
+    error to the user and calls fail() on the yielded handle (or job_failed()
+    from anywhere inside the block, tasks it starts included).
+    """
+    job = _Job()
+    token = _current_job.set(job)
+    JOBS_ACTIVE.inc(type=job_type)
+    try:
+        yield job
+    except BaseException:
+        job.fail()
+        raise
+    finally:
+        _current_job.reset(token)
+        JOBS_ACTIVE.dec(type=job_type)
+        JOBS_TOTAL.inc(type=job_type, outcome=job.outcome)
+
+
+def job_failed():
+    """Mark the job tracked around the caller as failed; a no-op outside track_job()."""
+    job = _current_job.get()
+    if job is not None:
+        job.fail()
+
+
+def cache_result(cache, hit):
+    CACHE.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def count_flood_wait(error, client="bot"):
+    """Record a FloodWait from either Pyrogram or Telethon; returns True if it was one."""
+    if type(error).__name__ not in ("FloodWait", "FloodWaitError", "FloodPremiumWaitError"):
+        return False
+    FLOOD_WAITS.inc(client=client)
+    seconds = getattr(error, "value", None) or getattr(error, "seconds", None) or 0
+    if isinstance(seconds, (int, float)):
+        FLOOD_WAIT_SECONDS.inc(seconds, client=client)
+    return True
+
+
+def write_metrics(path=METRICS_FILE):
+    """Atomically write the exposition text so another process can serve it."""
+    LAST_PUBLISH.set(time.time())
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+
+
+def read_metrics(path=METRICS_FILE):
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+async def publish_metrics(interval=METRICS_INTERVAL):
+    """Periodically export the bot's registry for the Flask /metrics endpoint."""
+    while True:
+        try:
+            await asyncio.to_thread(write_metrics)
+        except Exception as e:
+            logger.error(f"Failed to publish metrics: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,220 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""Hourly and daily usage totals kept up to date as the bot runs.
+
+Nothing is counted twice: every ROLLUP_FLUSH_INTERVAL seconds the growth of
+the job, byte, cache and flood-wait counters since the last flush goes into the
+current hour's and day's rollup documents as one bulk $inc. Each process
+flushes its own counters, so dispatcher and workers add up. Active users are
+counted by upserting a first-seen marker per user and period; only markers that
+were actually inserted increase `active_users`. Reading a period is then a
+single document lookup, however many users there are.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from config import ROLLUP_FLUSH_INTERVAL
+from utils.metrics import REGISTRY, JOBS_TOTAL, BYTES, CACHE, FLOOD_WAITS
+from utils.state import store
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FLUSHES = REGISTRY.counter("spybot_rollup_flushes_total", "Usage rollup flushes to MongoDB by result.", ["result"])
+
+# Rollup field prefix -> counter whose growth it accumulates; label values become the rest of the field name
+SOURCES = {"jobs": JOBS_TOTAL, "bytes": BYTES, "cache": CACHE, "flood_waits": FLOOD_WAITS}
+RETENTION = {"hour": timedelta(days=14), "day": timedelta(days=400)}
+
+# Counter totals already added, per period: a write can succeed for the hour and fail for the day
+_flushed = {"hour": {}, "day": {}}
+# Users newly marked active, per period id, not yet added to that period's rollup
+_new_users = {}
+_seen = set()
+# Users already marked active this hour (and so this day), to skip their upserts until the hour changes
+_marked = store.namespace('rollup_active', ttl=3600, max_size=100000)
+_flusher = None
+_collections = None
+_lock = asyncio.Lock()
+
+
+def period_ids(now=None):
+    now = now or datetime.now(timezone.utc)
+    return {"hour": f"hour:{now:%Y-%m-%dT%H}", "day": f"day:{now:%Y-%m-%d}"}
+
+
+def seen(user_id, chat_id):
+    """Note that `user_id` used the bot in `chat_id`; counted once per hour and day at the next flush.
+
+    Only private chats count: there the chat id is the user's own (positive) id,
+    so group traffic and channel or anonymous-admin senders are left out.
+    """
+    if user_id and user_id > 0 and chat_id == user_id:
+        _seen.add(user_id)
+
+
+def _growth(period):
+    """Counter growth since `period` was last flushed, and the totals to remember if it is written."""
+    inc, totals = {}, {}
+    flushed = _flushed[period]
+    for prefix, counter in SOURCES.items():
+        for labels, value in counter.snapshot().items():
+            field = ".".join((prefix,) + labels)
+            totals[field] = value
+            delta = value - flushed.get(field, 0)
+            if delta:
+                inc[field] = delta
+                if prefix == "jobs" and labels[-1] == "error":
+                    inc["failures"] = inc.get("failures", 0) + delta
+    return inc, totals
+
+
+def _store():
+    global _collections
+    if _collections is None:
+        from utils.func import db
+        _collections = db["rollups"], db["rollup_users"]
+    return _collections
+
+
+async def _mark_active(users, periods, now):
+    """Insert first-seen markers and count the new ones; returns the users whose markers failed."""
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+    keys = [(period, period_id, user_id) for user_id in users for period, period_id in periods.items()]
+    ops = [
+        UpdateOne(
+            {"_id": f"{period_id}:{user_id}"},
+            {"$setOnInsert": {"expireAt": now + RETENTION[period]}},
+            upsert=True,
+        )
+        for period, period_id, user_id in keys
+    ]
+    try:
+        result = await _store()[1].bulk_write(ops, ordered=False)
+        upserted, errors = result.upserted_ids, []
+    except BulkWriteError as e:
+        # Markers it did insert must be counted now: retried, they would already exist
+        upserted = [u["index"] for u in e.details.get("upserted", [])]
+        errors = e.details.get("writeErrors", [])
+    for index in upserted:
+        period_id = periods[keys[index][0]]
+        _new_users[period_id] = _new_users.get(period_id, 0) + 1
+    return {keys[error["index"]][2] for error in errors}
+
+
+async def flush():
+    """Add everything counted since the last flush to the current hour and day rollups."""
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+    # /stats flushes too; two overlapping flushes would both add the same growth
+    async with _lock:
+        now = datetime.now(timezone.utc)
+        periods = period_ids(now)
+        # New users of periods that are over never reach a rollup; forget them
+        for period_id in [p for p in _new_users if p not in periods.values()]:
+            del _new_users[period_id]
+        users = [u for u in _seen if _marked.get(u) != periods["hour"]]
+        _seen.clear()
+        try:
+            unmarked = await _mark_active(users, periods, now) if users else set()
+        except Exception as e:
+            _seen.update(users)
+            ROLLUP_FLUSHES.inc(result="error")
+            logger.warning(f"Could not flush usage rollups: {e}")
+            return False
+        for user_id in users:
+            if user_id not in unmarked:
+                _marked[user_id] = periods["hour"]
+        _seen.update(unmarked)
+
+        ops, written = [], []
+        for period, period_id in periods.items():
+            inc, totals = _growth(period)
+            fields = dict(inc, active_users=_new_users[period_id]) if _new_users.get(period_id) else inc
+            if not fields:
+                continue
+            start = now.replace(minute=0, second=0, microsecond=0)
+            if period == "day":
+                start = start.replace(hour=0)
+            ops.append(UpdateOne(
+                {"_id": period_id},
+                {"$inc": fields,
+                 "$setOnInsert": {"period": period, "start": start, "expireAt": now + RETENTION[period]}},
+                upsert=True,
+            ))
+            written.append((period, period_id, totals))
+        failed, error = set(), None
+        if ops:
+            try:
+                await _store()[0].bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                failed, error = {err["index"] for err in e.details.get("writeErrors", [])}, e
+            except Exception as e:
+                failed, error = set(range(len(ops))), e
+        # Whatever was not written stays pending for the next flush
+        for index, (period, period_id, totals) in enumerate(written):
+            if index not in failed:
+                _flushed[period].update(totals)
+                _new_users.pop(period_id, None)
+        if error is not None or unmarked:
+            ROLLUP_FLUSHES.inc(result="error")
+            logger.warning(f"Could not flush usage rollups: {error or f'{len(unmarked)} user marker(s) failed'}")
+            return False
+        ROLLUP_FLUSHES.inc(result="ok")
+        return True
+
+
+async def _flush_forever():
+    # Nothing here may end the loop: counter growth would otherwise stop reaching the rollups
+    indexed = False
+    while True:
+        await asyncio.sleep(ROLLUP_FLUSH_INTERVAL)
+        if not indexed:
+            try:
+                for collection in _store():
+                    await collection.create_index("expireAt", expireAfterSeconds=0)
+                indexed = True
+            except Exception as e:
+                logger.warning(f"Could not create the rollup expiry indexes, retrying next flush: {e}")
+        try:
+            await flush()
+        except Exception:
+            logger.exception("Usage rollup flush failed")
+
+
+def start():
+    global _flusher
+    if _flusher is None:
+        _flusher = asyncio.get_running_loop().create_task(_flush_forever())
+    return _flusher
+
+
+async def read(days=7):
+    """This hour's, today's and the last `days` days' rollups: at most days + 1 document reads."""
+    now = datetime.now(timezone.utc)
+    ids = [period_ids(now)["hour"]] + [period_ids(now - timedelta(days=n))["day"] for n in range(days)]
+    docs = {doc["_id"]: doc async for doc in _store()[0].find({"_id": {"$in": ids}})}
+    return {
+        "hour": docs.get(ids[0], {}),
+        "today": docs.get(ids[1], {}),
+        "days": [docs.get(i, {}) for i in ids[1:]],
+    }
+
+
+def combine(docs):
+    """Sum the counters of several rollups; active_users then means user-days."""
+    total = {}
+    for doc in docs:
+        _add(total, doc)
+    return total
+
+
+def _add(into, doc):
+    for key, value in doc.items():
+        if isinstance(value, dict):
+            _add(into.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            into[key] = into.get(key, 0) + value
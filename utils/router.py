@@ -0,0 +1,175 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""One place for every multi-step conversation (batch, login, settings).
+
+Each user has at most one conversation: {'flow': name, 'step': ..., **data}.
+A single Pyrogram handler sees every free-text or photo update, looks the
+sender up here and runs only the matching flow, so no other handler has to
+parse plain messages. /cancel ends whichever conversation is active.
+"""
+
+import logging
+import time
+from utils import rollups
+from utils.metrics import REGISTRY
+from utils.state import store
+
+logger = logging.getLogger(__name__)
+
+UPDATE_CPU_SECONDS = REGISTRY.histogram(
+    "spybot_update_cpu_seconds", "CPU time spent handling one routed update.", ["flow"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+UPDATES_ROUTED = REGISTRY.counter("spybot_updates_routed_total", "Free-text updates dispatched to a flow.", ["flow"])
+
+FLOWS = {}
+
+
+class _Flow:
+    __slots__ = ("name", "handler", "on_cancel", "resumable")
+
+    def __init__(self, name, handler, on_cancel, resumable):
+        self.name = name
+        self.handler = handler
+        self.on_cancel = on_cancel
+        self.resumable = resumable
+
+    def resumes(self, conversation):
+        return self.resumable is True or conversation.get('step') in self.resumable
+
+
+def _resumable(conversation):
+    handler = FLOWS.get(conversation.get('flow'))
+    return handler is not None and handler.resumes(conversation)
+
+
+# Idle conversations end on their own; with STATE_PERSIST on, those a restart
+# cannot break (waiting for plain input, nothing running) are persisted too
+conversations = store.namespace('conversations', ttl=1800, max_size=100000, persist=_resumable)
+
+
+def flow(name, on_cancel=None, resumable=()):
+    """Register `handler(client, message, conversation)` for the flow `name`.
+
+    `on_cancel(client, message, conversation)` runs on /cancel after the
+    conversation has been ended; without it the user just gets "Cancelled."
+    `resumable` lists the steps that can carry on after a restart (True for
+    all of them); conversations at any other step are not persisted.
+    """
+    def decorator(handler):
+        FLOWS[name] = _Flow(name, handler, on_cancel, resumable)
+        return handler
+    return decorator
+
+
+def start(user_id, flow_name, **state):
+    """Begin (or restart) a conversation, replacing any other one the user had."""
+    conversation = {'flow': flow_name, **state}
+    conversations[user_id] = conversation
+    return conversation
+
+
+def get(user_id, flow_name=None):
+    conversation = conversations.get(user_id)
+    if conversation is None or (flow_name and conversation['flow'] != flow_name):
+        return None
+    return conversation
+
+
+def end(user_id, flow_name=None):
+    """End the user's conversation; with `flow_name`, only if it is still that flow."""
+    if get(user_id, flow_name) is not None:
+        del conversations[user_id]
+
+
+def wants(message):
+    """True for a plain (non-command) text or photo from a user with an open conversation."""
+    user = message.from_user
+    if user is None or user.id not in conversations:
+        return False
+    text = message.text
+    if text is not None:
+        return not text.startswith('/')
+    return message.photo is not None
+
+
+class _Metered:
+    """Await a coroutine while adding up the thread CPU time of its own steps.
+
+    Time spent suspended (network, other tasks) is not counted, so the total is
+    the CPU cost of this update alone.
+    """
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.cpu = 0.0
+
+    def __await__(self):
+        steps = self.coro.__await__()
+        value, error = None, None
+        while True:
+            started = time.thread_time()
+            try:
+                yielded = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as done:
+                return done.value
+            finally:
+                self.cpu += time.thread_time() - started
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+
+async def dispatch(client, message):
+    conversation = conversations.get(message.from_user.id)
+    if conversation is None:
+        return
+    handler = FLOWS.get(conversation['flow'])
+    if handler is None:
+        logger.warning(f"No flow registered for {conversation['flow']!r}")
+        return
+    rollups.seen(message.from_user.id, message.chat.id)
+    before = dict(conversation)
+    metered = _Metered(handler.handler(client, message, conversation))
+    try:
+        await metered
+    finally:
+        # Flows change their conversation in place; save it only when that happened
+        if conversation != before and conversations.get(message.from_user.id) is conversation:
+            conversations.touch(message.from_user.id)
+        UPDATES_ROUTED.inc(flow=handler.name)
+        UPDATE_CPU_SECONDS.observe(metered.cpu, flow=handler.name)
+
+
+async def cancel(client, message):
+    user_id = message.from_user.id
+    conversation = conversations.pop(user_id, None)
+    if conversation is None:
+        return
+    handler = FLOWS.get(conversation['flow'])
+    if handler and handler.on_cancel:
+        await handler.on_cancel(client, message, conversation)
+    else:
+        await message.reply('Cancelled.')
+    # Other /cancel handlers only act when no conversation was open
+    message.stop_propagation()
+
+
+def install_router(client):
+    """Route `client`'s updates through this module, ahead of the plugins' own handlers."""
+    from pyrogram import filters
+    from pyrogram.handlers import MessageHandler
+
+    # Async on purpose: Pyrogram runs plain-function filters in its thread pool, once per update
+    async def routed(_, __, message):
+        return wants(message)
+
+    async def in_conversation(_, __, message):
+        return message.from_user is not None and message.from_user.id in conversations
+
+    client.add_handler(MessageHandler(dispatch, filters.create(routed)), group=-1)
+    client.add_handler(MessageHandler(cancel, filters.command('cancel') & filters.create(in_conversation)), group=-1)
+    return client
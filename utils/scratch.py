@@ -0,0 +1,179 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import time
+import uuid
+from config import SCRATCH_DIR, SCRATCH_BUDGET_MB
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_RESERVED = REGISTRY.gauge("spybot_scratch_reserved_bytes", "Bytes reserved by open scratch workspaces.")
+SCRATCH_WAITING = REGISTRY.gauge("spybot_scratch_waiting", "Jobs waiting for scratch space.")
+SCRATCH_SWEPT = REGISTRY.counter("spybot_scratch_swept_total", "Orphaned scratch directories removed.")
+
+# Each process keeps its job directories under its own instance directory, named
+# per boot: pids repeat across restarts and hosts sharing the volume. The instance
+# touches its heartbeat file while it runs; sweep() removes instance directories
+# whose heartbeat stopped more than STALE_AFTER seconds ago.
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+HEARTBEAT_FILE = ".alive"
+HEARTBEAT_INTERVAL = 60
+STALE_AFTER = 600
+# A job that already holds space stops waiting for more after this long, so two
+# growing jobs cannot block each other forever; it briefly overcommits instead
+GROW_TIMEOUT = 120
+
+
+class Workspace:
+    """An isolated directory for one job; everything inside is removed on close()."""
+
+    def __init__(self, manager, job_id, reserved):
+        self.manager = manager
+        self.job_id = job_id
+        self.reserved = reserved
+        self.path = os.path.join(manager.home, job_id)
+        self.closed = False
+
+    async def grow(self, extra_bytes):
+        """Reserve more space once the real size is known (e.g. after yt-dlp extraction)."""
+        extra = max(int(extra_bytes or 0), 0)
+        await self.manager._admit(extra, held=self.reserved)
+        self.reserved += extra
+
+    async def shrink(self, freed_bytes):
+        """Hand back part of the reservation after deleting files mid-job."""
+        freed = min(max(int(freed_bytes or 0), 0), self.reserved)
+        self.reserved -= freed
+        await self.manager._release(freed)
+
+    def file(self, name):
+        """Path for `name` inside the workspace (only the basename of `name` is kept)."""
+        return os.path.join(self.path, os.path.basename(name))
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        await asyncio.to_thread(shutil.rmtree, self.path, True)
+        await self.manager._release(self.reserved)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class ScratchManager:
+    """Hands out per-job directories under `root` while keeping reservations within `budget` bytes.
+
+    A job reserves its expected size up front and waits while that would exceed the
+    budget; a job larger than the whole budget is admitted only when nothing else
+    holds space, so it cannot starve forever.
+    """
+
+    def __init__(self, root, budget):
+        self.root = os.path.abspath(root)
+        self.home = os.path.join(self.root, INSTANCE_ID)
+        self.budget = budget
+        self.used = 0
+        self._cond = None
+        self._heartbeat = None
+
+    async def open(self, job_id, expected_bytes=0):
+        expected = max(int(expected_bytes or 0), 0)
+        self._start_heartbeat()
+        await self._admit(expected)
+        workspace = Workspace(self, job_id, expected)
+        try:
+            await asyncio.to_thread(self._create, workspace.path)
+        except BaseException:
+            await self._release(expected)
+            raise
+        return workspace
+
+    def _fits(self, amount, held):
+        return not self.budget or self.used == held or self.used + amount <= self.budget
+
+    async def _admit(self, amount, held=0):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            if not self._fits(amount, held):
+                SCRATCH_WAITING.inc()
+                try:
+                    await asyncio.wait_for(
+                        self._cond.wait_for(lambda: self._fits(amount, held)), GROW_TIMEOUT if held else None
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(f"Scratch budget exceeded by a growing job ({self.used + amount} bytes)")
+                finally:
+                    SCRATCH_WAITING.dec()
+            self.used += amount
+            SCRATCH_RESERVED.set(self.used)
+
+    def _create(self, path):
+        os.makedirs(path, exist_ok=True)
+        self._beat()
+
+    def _beat(self):
+        os.makedirs(self.home, exist_ok=True)
+        with open(os.path.join(self.home, HEARTBEAT_FILE), "w") as f:
+            f.write(str(int(time.time())))
+
+    async def _beat_forever(self):
+        while True:
+            try:
+                await asyncio.to_thread(self._beat)
+            except OSError as e:
+                logger.warning(f"Could not touch scratch heartbeat in {self.home}: {e}")
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.get_running_loop().create_task(self._beat_forever())
+
+    async def _release(self, amount):
+        async with self._cond:
+            self.used -= amount
+            SCRATCH_RESERVED.set(self.used)
+            self._cond.notify_all()
+
+    def _orphans(self):
+        if not os.path.isdir(self.root):
+            return []
+        orphans = []
+        now = time.time()
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.path == self.home:
+                continue
+            # Directories without a heartbeat (older layouts) go by their own modification time
+            try:
+                beat = os.stat(os.path.join(entry.path, HEARTBEAT_FILE)).st_mtime
+            except OSError:
+                beat = entry.stat().st_mtime
+            # Other instances on the volume are left alone while their heartbeat is fresh
+            if now - beat > STALE_AFTER:
+                orphans.append(entry.path)
+        return orphans
+
+    async def sweep(self):
+        """Remove directories left behind by crashed or restarted processes; call once at startup."""
+        self._start_heartbeat()
+        orphans = await asyncio.to_thread(self._orphans)
+        for path in orphans:
+            await asyncio.to_thread(shutil.rmtree, path, True)
+            SCRATCH_SWEPT.inc()
+        if orphans:
+            logger.info(f"Removed {len(orphans)} orphaned scratch directories from {self.root}")
+        return len(orphans)
+
+
+scratch = ScratchManager(SCRATCH_DIR, SCRATCH_BUDGET_MB * 1024 * 1024)
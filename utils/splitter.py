@@ -0,0 +1,216 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import contextlib
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class FilePart(io.RawIOBase):
+    """Read-only, seekable view of bytes [offset, offset + length) of a file.
+
+    Reads go straight from the original file into the caller's buffer, so a
+    part can be handed to an uploader without being copied to memory or disk.
+    """
+
+    def __init__(self, path, offset, length, name=None):
+        super().__init__()
+        self._fd = os.open(path, os.O_RDONLY)
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+        self.name = name or os.path.basename(path)
+
+    def __len__(self):
+        return self._length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            new = pos
+        elif whence == io.SEEK_CUR:
+            new = self._pos + pos
+        elif whence == io.SEEK_END:
+            new = self._length + pos
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if new < 0:
+            raise ValueError("negative seek position")
+        self._pos = new
+        return new
+
+    def readinto(self, buffer):
+        remaining = self._length - self._pos
+        if remaining <= 0:
+            return 0
+        view = memoryview(buffer).cast("B")[:min(len(buffer), remaining)]
+        if hasattr(os, "preadv"):
+            n = os.preadv(self._fd, [view], self._offset + self._pos)
+        else:
+            data = os.pread(self._fd, len(view), self._offset + self._pos)
+            n = len(data)
+            view[:n] = data
+        self._pos += n
+        return n
+
+    def pread(self, size, offset):
+        """Read up to `size` bytes at `offset` within the part without moving the position.
+
+        Safe to call from several threads at once, which the parallel uploader relies on.
+        """
+        size = max(0, min(size, self._length - offset))
+        return os.pread(self._fd, size, self._offset + offset) if size else b""
+
+    def close(self):
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
+
+def iter_file_parts(path, part_size):
+    """Yield (index, FilePart) views covering the whole file, in order."""
+    file_size = os.path.getsize(path)
+    base_name, file_ext = os.path.splitext(os.path.basename(path))
+    part_count = max(1, -(-file_size // part_size))
+    for index in range(part_count):
+        offset = index * part_size
+        length = min(part_size, file_size - offset)
+        yield index, FilePart(path, offset, length, name=f"{base_name}.part{str(index).zfill(3)}{file_ext}")
+
+
+async def _ffprobe_float(*args):
+    """First number ffprobe prints for `args`, or None when it fails or prints nothing."""
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await process.communicate()
+    for token in stdout.decode(errors="ignore").replace(",", " ").split():
+        try:
+            return float(token)
+        except ValueError:
+            continue
+    return None
+
+
+async def keyframe_before(src, t):
+    """Time of the video keyframe at or before `t`: where an input seek to `t` really starts."""
+    # The packet budget covers interleaved audio; the first video packet after the seek is the keyframe
+    return await _ffprobe_float(
+        "-select_streams", "v:0", "-read_intervals", f"{t:.3f}%+#32",
+        "-show_entries", "packet=pts_time", "-of", "csv=p=0", src
+    )
+
+
+async def media_duration(path):
+    return await _ffprobe_float("-show_entries", "format=duration", "-of", "csv=p=0", path)
+
+
+async def cut_segment(src, start, length, dest):
+    """Stream-copy [start, start + length) of `src` into `dest`; cuts land on keyframes."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-ss", f"{start:.3f}", "-i", src, "-t", f"{length:.3f}",
+        "-map", "0:v:0?", "-map", "0:a?", "-c", "copy",
+        "-avoid_negative_ts", "make_zero", "-movflags", "+faststart",
+        dest, "-y"
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0 or not os.path.exists(dest):
+        raise RuntimeError(f"ffmpeg segment failed: {stderr.decode(errors='ignore').strip()}")
+    return dest
+
+
+async def _cut_fitting(src, start, length, dest, max_bytes, attempts=4):
+    """Cut a segment, shortening it until the output fits under `max_bytes`.
+
+    `start` is a keyframe, and the cut stops just before the keyframe the next
+    part will seek to, so consecutive parts neither overlap nor leave gaps.
+    Returns the part and its measured duration.
+    """
+    for _ in range(attempts):
+        end = await keyframe_before(src, start + length)
+        cut_length = end - start if end and end > start + 1 else length
+        await cut_segment(src, start, cut_length, dest)
+        size = os.path.getsize(dest)
+        if size <= max_bytes:
+            return dest, await media_duration(dest) or cut_length
+        length = cut_length * max_bytes / size * 0.95
+    os.remove(dest)
+    raise RuntimeError(f"could not fit segment at {start:.1f}s under {max_bytes} bytes")
+
+
+async def _cut_limited(slot, prepare, *args):
+    async with slot() if slot is not None else contextlib.nullcontext():
+        part_path, part_length = await _cut_fitting(*args)
+        prepared = await prepare(part_path, part_length) if prepare is not None else None
+    return part_path, part_length, prepared
+
+
+async def iter_video_parts(path, max_bytes, duration, safety=0.92, slot=None, prepare=None):
+    """Async-yield (index, part_path, start, length, prepared) playable parts of a video.
+
+    The next part is cut in the background while the caller handles the
+    current one, and each part file is deleted once the caller moves on.
+    Consume it under contextlib.aclosing() so an early exit cleans up at once.
+    Each part starts where the previous one actually ended, per its measured duration.
+    `slot()`, if given, returns an async context manager held around each cut
+    (such as a job queue's ffmpeg stage). `prepare(part_path, length)`, if given,
+    runs on each part right after its cut and inside the same slot, and its result
+    is yielded as `prepared`: probing or thumbnailing part N there means the caller
+    never waits on the slot that cut N+1 holds while part N uploads.
+    """
+    file_size = os.path.getsize(path)
+    length = max(1.0, duration * max_bytes / file_size * safety)
+    base_name, _ = os.path.splitext(path)
+
+    def dest(index):
+        return f"{base_name}.part{str(index).zfill(3)}.mp4"
+
+    index, start = 0, 0.0
+    pending_path = dest(index)
+    pending = asyncio.create_task(_cut_limited(slot, prepare, path, start, length, pending_path, max_bytes))
+    try:
+        while pending is not None:
+            part_path, part_length, prepared = await pending
+            part_start = start
+            start += part_length
+            length = part_length
+            pending = None
+            if start < duration - 0.5:
+                pending_path = dest(index + 1)
+                pending = asyncio.create_task(_cut_limited(slot, prepare, path, start, length, pending_path, max_bytes))
+            try:
+                yield index, part_path, part_start, part_length, prepared
+            finally:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+            index += 1
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except BaseException:
+                pass
+            if os.path.exists(pending_path):
+                os.remove(pending_path)
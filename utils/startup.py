@@ -0,0 +1,34 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import time
+from contextlib import contextmanager
+from utils.metrics import REGISTRY
+
+STARTUP_SECONDS = REGISTRY.gauge("spybot_startup_seconds", "Seconds spent in each startup phase.", ["phase"])
+
+_phases = []
+
+
+def record(name, seconds):
+    _phases.append((name, seconds))
+    STARTUP_SECONDS.set(seconds, phase=name)
+
+
+@contextmanager
+def phase(name):
+    """Time one startup phase; phases may overlap when they run concurrently."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def report(total):
+    """Print every recorded phase and the wall-clock total."""
+    record("total", total)
+    width = max(len(name) for name, _ in _phases)
+    lines = [f"  {name:<{width}}  {seconds:6.2f}s" for name, seconds in _phases]
+    print("Startup timings:\n" + "\n".join(lines))
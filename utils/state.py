@@ -0,0 +1,257 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""Bounded per-user state that cleans up after itself.
+
+Each namespace is a dict-like mapping with its own TTL (refreshed whenever an
+entry is read or written) and size cap (least recently used entries go first).
+Entry counts, approximate memory and evictions are exported as metrics, and a
+namespace can optionally be written through to MongoDB so it survives restarts.
+"""
+
+import asyncio
+import inspect
+import logging
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta, timezone
+from config import STATE_PERSIST, STATE_SWEEP_INTERVAL
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+STATE_ENTRIES = REGISTRY.gauge("spybot_state_entries", "Entries held per state namespace.", ["namespace"])
+STATE_BYTES = REGISTRY.gauge("spybot_state_bytes", "Approximate memory held per state namespace.", ["namespace"])
+STATE_EVICTIONS = REGISTRY.counter(
+    "spybot_state_evictions_total", "State entries dropped before being removed by their owner.", ["namespace", "reason"]
+)
+
+_MISSING = object()
+
+
+def _approx_size(value, depth=2):
+    """Shallow size plus one or two levels of containers; cheap enough to run on every sweep."""
+    size = sys.getsizeof(value)
+    if depth and isinstance(value, dict):
+        size += sum(_approx_size(k, 0) + _approx_size(v, depth - 1) for k, v in value.items())
+    elif depth and isinstance(value, (list, tuple, set)):
+        size += sum(_approx_size(v, depth - 1) for v in value)
+    return size
+
+
+class Namespace(MutableMapping):
+    """A dict whose entries expire after `ttl` idle seconds and are capped at `max_size`.
+
+    `on_evict(key, value, reason)` runs (or is scheduled, if it is a coroutine
+    function) when an entry expires or is pushed out by the cap, not when it is
+    deleted normally. Values are stored by reference, so in-place changes are
+    seen immediately; call touch() to persist them. `persist` may also be a
+    predicate `persist(value)`: values it rejects are kept in memory only.
+    """
+
+    def __init__(self, store, name, ttl=None, max_size=0, on_evict=None, persist=False):
+        self.store = store
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.persist = persist if STATE_PERSIST else False
+        self._data = OrderedDict()
+
+    def _expiry(self):
+        return time.monotonic() + self.ttl if self.ttl else None
+
+    def _live(self, key):
+        """(value, expires) for a live key, evicting it first if it has expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            self._evict(key, "expired")
+            return None
+        return entry
+
+    def _evict(self, key, reason):
+        value, _ = self._data.pop(key)
+        STATE_EVICTIONS.inc(namespace=self.name, reason=reason)
+        self.store._forget(self, key)
+        if self.on_evict:
+            try:
+                result = self.on_evict(key, value, reason)
+                if inspect.isawaitable(result):
+                    self.store._spawn(result)
+            except Exception as e:
+                logger.warning(f"on_evict for {self.name}:{key} failed: {e}")
+
+    def __getitem__(self, key):
+        entry = self._live(key)
+        if entry is None:
+            raise KeyError(key)
+        self._data[key] = (entry[0], self._expiry())
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        self._data[key] = (value, self._expiry())
+        self._data.move_to_end(key)
+        while self.max_size and len(self._data) > self.max_size:
+            self._evict(next(iter(self._data)), "size")
+        self.store._started()
+        self.store._save(self, key, value)
+
+    def __delitem__(self, key):
+        del self._data[key]
+        self.store._forget(self, key)
+
+    def __contains__(self, key):
+        return self._live(key) is not None
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, default=_MISSING):
+        entry = self._live(key)
+        if entry is None:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        del self[key]
+        return entry[0]
+
+    def clear(self):
+        for key in list(self._data):
+            self.store._forget(self, key)
+        self._data.clear()
+
+    def touch(self, key):
+        """Refresh the TTL of `key` and re-persist its (possibly mutated) value."""
+        entry = self._live(key)
+        if entry is not None:
+            self[key] = entry[0]
+
+    def sweep(self):
+        """Evict every expired entry and refresh this namespace's gauges."""
+        now = time.monotonic()
+        for key in [k for k, (_, expires) in self._data.items() if expires is not None and expires <= now]:
+            self._evict(key, "expired")
+        STATE_ENTRIES.set(len(self._data), namespace=self.name)
+        STATE_BYTES.set(sum(_approx_size(k, 0) + _approx_size(v) for k, (v, _) in self._data.items()), namespace=self.name)
+
+
+class StateStore:
+    def __init__(self):
+        self.namespaces = {}
+        self._sweeper = None
+        self._tasks = set()
+        self._collection = None
+
+    def namespace(self, name, ttl=None, max_size=0, on_evict=None, persist=False):
+        if name in self.namespaces:
+            raise ValueError(f"State namespace {name!r} already exists")
+        ns = self.namespaces[name] = Namespace(self, name, ttl, max_size, on_evict, persist)
+        return ns
+
+    @staticmethod
+    def _persists(ns, value):
+        return ns.persist is True or (bool(ns.persist) and ns.persist(value))
+
+    def _started(self):
+        # The sweeper needs a running loop, so it starts with the first write rather than at import
+        if self._sweeper is None:
+            try:
+                self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever())
+            except RuntimeError:
+                pass
+
+    def _spawn(self, coro):
+        try:
+            task = asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            coro.close()
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(STATE_SWEEP_INTERVAL)
+            for ns in list(self.namespaces.values()):
+                try:
+                    ns.sweep()
+                except Exception as e:
+                    logger.error(f"Sweeping state namespace {ns.name} failed: {e}")
+
+    def sweep(self):
+        for ns in self.namespaces.values():
+            ns.sweep()
+
+    def _store(self):
+        if self._collection is None:
+            from utils.func import db
+            self._collection = db["state"]
+        return self._collection
+
+    def _save(self, ns, key, value):
+        if not ns.persist:
+            return
+        if not self._persists(ns, value):
+            # A value that must not outlive the process replaces whatever copy was saved
+            self._forget(ns, key)
+            return
+        expire_at = datetime.now(timezone.utc) + timedelta(seconds=ns.ttl) if ns.ttl else None
+        self._spawn(self._write(
+            {"_id": f"{ns.name}:{key}"},
+            # A copy: the write runs later, and the live value may have moved on by then
+            {"$set": {"ns": ns.name, "key": key, "value": dict(value) if isinstance(value, dict) else value,
+                      "expireAt": expire_at, "restorable": True}},
+        ))
+
+    def _forget(self, ns, key):
+        if ns.persist:
+            self._spawn(self._delete(f"{ns.name}:{key}"))
+
+    async def _write(self, query, update):
+        try:
+            await self._store().update_one(query, update, upsert=True)
+        except Exception as e:
+            logger.warning(f"Could not persist state {query['_id']}: {e}")
+
+    async def _delete(self, doc_id):
+        try:
+            await self._store().delete_one({"_id": doc_id})
+        except Exception as e:
+            logger.warning(f"Could not remove persisted state {doc_id}: {e}")
+
+    async def load(self):
+        """Restore persisted namespaces; call once at startup before handling updates."""
+        persisted = {name: ns for name, ns in self.namespaces.items() if ns.persist}
+        if not persisted:
+            return 0
+        collection = self._store()
+        await collection.create_index("expireAt", expireAfterSeconds=0)
+        loaded = 0
+        async for doc in collection.find({"ns": {"$in": list(persisted)}}):
+            ns = persisted[doc["ns"]]
+            # Anything written since startup is newer than the saved copy. A predicate was
+            # checked when the doc was written (it may depend on registrations made after
+            # load()); docs saved before that check existed carry no flag and are dropped
+            if doc["key"] in ns._data or (ns.persist is not True and not doc.get("restorable")):
+                continue
+            ns._data[doc["key"]] = (doc["value"], ns._expiry())
+            loaded += 1
+        return loaded
+
+
+store = StateStore()
@@ -0,0 +1,114 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from config import TRACE_STAGES, TRACE_LOG_FILE, TRACE_SAMPLES
+from utils.metrics import REGISTRY, STAGE_SECONDS
+
+trace_logger = logging.getLogger("spybot.trace")
+if TRACE_STAGES and TRACE_LOG_FILE:
+    _handler = logging.FileHandler(TRACE_LOG_FILE)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_handler)
+    trace_logger.propagate = False
+
+QUANTILES = (0.5, 0.9, 0.99)
+STAGE_QUANTILES = REGISTRY.gauge(
+    "spybot_stage_quantile_seconds", "Recent per-stage latency percentiles (tracing only).", ["stage", "quantile"]
+)
+
+_samples = {}
+_lock = threading.Lock()
+
+
+def new_job_id() -> str:
+    """Short correlation ID shared by every span of one delivery."""
+    return uuid.uuid4().hex[:12]
+
+
+class Span:
+    """Times one stage of a job; usable as a sync or async context manager."""
+    __slots__ = ("stage", "job", "user", "fields", "start")
+
+    def __init__(self, stage, job=None, user=None, fields=None):
+        self.stage = stage
+        self.job = job
+        self.user = user
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        if TRACE_STAGES:
+            _record(self, elapsed, exc_type)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def set(self, **fields):
+        """Attach extra fields (e.g. bytes) to the log record; ignored when tracing is off."""
+        if TRACE_STAGES:
+            if self.fields is None:
+                self.fields = {}
+            self.fields.update(fields)
+
+
+def span(stage, job=None, user=None, **fields):
+    return Span(stage, job, user, fields or None)
+
+
+def _record(s, elapsed, exc_type):
+    with _lock:
+        bucket = _samples.get(s.stage)
+        if bucket is None:
+            bucket = _samples[s.stage] = deque(maxlen=TRACE_SAMPLES)
+        bucket.append(elapsed)
+    record = {
+        "ts": round(time.time(), 3),
+        "stage": s.stage,
+        "job": s.job,
+        "user": s.user,
+        "ms": round(elapsed * 1000, 2),
+        "ok": exc_type is None,
+    }
+    if s.fields:
+        record.update(s.fields)
+    trace_logger.info(json.dumps(record, default=str))
+
+
+def percentiles(stage, quantiles=QUANTILES) -> dict:
+    """Nearest-rank percentiles over the most recent samples of a stage."""
+    with _lock:
+        values = sorted(_samples.get(stage, ()))
+    if not values:
+        return {}
+    return {q: values[min(len(values) - 1, int(q * len(values)))] for q in quantiles}
+
+
+def stage_report() -> dict:
+    with _lock:
+        stages = list(_samples)
+    return {stage: percentiles(stage) for stage in stages}
+
+
+def _collect_quantiles():
+    for stage, values in stage_report().items():
+        for q, seconds in values.items():
+            STAGE_QUANTILES.set(round(seconds, 6), stage=stage, quantile=q)
+
+
+REGISTRY.add_collector(_collect_quantiles)
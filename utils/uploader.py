@@ -0,0 +1,291 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""Parallel part uploader shared by the Telethon and Pyrogram clients.
+
+Both libraries upload a file as numbered parts (upload.saveFilePart /
+upload.saveBigFilePart) and then reference it by a random file id. This module
+owns that loop: part sizing, how many parallel connections to use for a given
+size, and per-part retries, so every upload path has the same throughput.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import random
+import threading
+import time
+from config import UPLOAD_MAX_WORKERS, UPLOAD_MB_PER_WORKER, UPLOAD_PART_RETRIES
+from utils.metrics import REGISTRY, count_flood_wait
+from utils.splitter import FilePart
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PART_RETRIES_TOTAL = REGISTRY.counter("spybot_upload_part_retries_total", "Upload parts sent again after a failure.", ["client"])
+UPLOAD_SECONDS = REGISTRY.histogram("spybot_upload_seconds", "Time to upload all parts of a file.", ["client"])
+
+PART_SIZE = 512 * 1024  # the largest part Telegram accepts
+SMALL_PART_SIZE = 128 * 1024
+BIG_FILE_SIZE = 10 * 1024 * 1024  # files above this must use saveBigFilePart
+# Telegram's file size limit in parts: 2000 MiB, or 4000 MiB for Premium accounts
+MAX_PARTS = 4000
+PREMIUM_MAX_PARTS = 8000
+
+
+def part_size_for(size):
+    return SMALL_PART_SIZE if size <= BIG_FILE_SIZE else PART_SIZE
+
+
+def max_parts_for(user):
+    """Part limit for uploads by `user` (a Pyrogram or Telethon User, or None when unknown)."""
+    premium = getattr(user, "is_premium", None) or getattr(user, "premium", None)
+    return PREMIUM_MAX_PARTS if premium else MAX_PARTS
+
+
+def workers_for(size):
+    """One connection per UPLOAD_MB_PER_WORKER MB, capped at UPLOAD_MAX_WORKERS."""
+    return max(1, min(UPLOAD_MAX_WORKERS, -(-size // (UPLOAD_MB_PER_WORKER * 1024 * 1024))))
+
+
+class _StreamReader:
+    """pread() over an arbitrary seekable file object, serialised with a lock."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.name = getattr(stream, "name", None)
+
+    def pread(self, size, offset):
+        with self.lock:
+            self.stream.seek(offset)
+            return self.stream.read(size)
+
+    def close(self):
+        pass
+
+
+def _open_source(source):
+    """(reader with pread(), size, name, owned) for a path, FilePart or seekable file object."""
+    if isinstance(source, (str, os.PathLike)):
+        size = os.path.getsize(source)
+        return FilePart(source, 0, size), size, os.path.basename(source), True
+    if isinstance(source, FilePart):
+        return source, len(source), source.name, False
+    current = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(current)
+    return _StreamReader(source), size, os.path.basename(getattr(source, "name", "") or "file"), False
+
+
+def _flood_wait_seconds(error):
+    if "FloodWait" in type(error).__name__ or "FloodPremiumWait" in type(error).__name__:
+        return getattr(error, "seconds", None) or getattr(error, "value", None) or 0
+    return None
+
+
+async def _report(progress, done, total, progress_args):
+    """Call the progress callback; a failing callback must not fail the upload.
+
+    Pyrogram's StopTransmission is the exception: raised from a callback, it
+    is how a caller cancels the upload, so it goes through.
+    """
+    if progress is None:
+        return
+    try:
+        result = progress(done, total, *progress_args)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        if type(e).__name__ == "StopTransmission":
+            raise
+        logger.warning(f"Upload progress callback failed: {e}")
+
+
+async def upload_parts(open_transport, source, progress=None, progress_args=(), file_id=None, start_part=0):
+    """Upload `source` and return (file_id, total_parts, is_big, name).
+
+    `open_transport(workers)` returns an async context manager whose
+    `send_part(worker, file_id, index, total, data, is_big)` sends one part on
+    that worker's connection. Failed parts are retried up to UPLOAD_PART_RETRIES
+    times (sleeping through flood waits) before the upload fails.
+    """
+    reader, size, name, owned = _open_source(source)
+    try:
+        async with open_transport(workers_for(size)) as transport:
+            return await _upload(transport, reader, size, name, progress, progress_args, file_id, start_part)
+    finally:
+        if owned:
+            reader.close()
+
+
+async def _upload(transport, reader, size, name, progress, progress_args, file_id, start_part):
+    part_size = part_size_for(size)
+    total = max(1, -(-size // part_size))
+    if total > transport.max_parts:
+        raise ValueError(f"{name} is too large to upload ({size} bytes)")
+    is_big = size > BIG_FILE_SIZE
+    file_id = file_id or random.getrandbits(63)
+    parts = asyncio.Queue()
+    for index in range(start_part, total):
+        parts.put_nowait(index)
+    state = {"done": start_part * part_size}
+    started = time.perf_counter()
+
+    async def worker(n):
+        while True:
+            try:
+                index = parts.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            data = await asyncio.to_thread(reader.pread, part_size, index * part_size)
+            for attempt in range(UPLOAD_PART_RETRIES + 1):
+                try:
+                    await transport.send_part(n, file_id, index, total, data, is_big)
+                    break
+                except Exception as e:
+                    if attempt == UPLOAD_PART_RETRIES:
+                        raise
+                    wait = _flood_wait_seconds(e)
+                    if wait is not None:
+                        count_flood_wait(e, transport.label)
+                    UPLOAD_PART_RETRIES_TOTAL.inc(client=transport.label)
+                    logger.warning(f"Part {index}/{total} of {name} failed ({e}); retry {attempt + 1}")
+                    await asyncio.sleep(wait if wait is not None else min(2 ** attempt, 10))
+            state["done"] = min(size, state["done"] + len(data))
+            await _report(progress, state["done"], size, progress_args)
+
+    workers = [asyncio.create_task(worker(n)) for n in range(min(transport.workers, total - start_part) or 1)]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    UPLOAD_SECONDS.observe(time.perf_counter() - started, client=transport.label)
+    return file_id, total, is_big, name
+
+
+class TelethonTransport:
+    """Extra MTProto senders to the client's own DC, one per upload worker."""
+
+    label = "telethon"
+
+    def __init__(self, client, workers):
+        self.client = client
+        self.workers = workers
+        self.senders = []
+        self.max_parts = MAX_PARTS
+
+    async def __aenter__(self):
+        from telethon.network import MTProtoSender
+        client = self.client
+        # Bots are never Premium; is_bot() is cached after the first call
+        if not await client.is_bot():
+            self.max_parts = max_parts_for(await client.get_me())
+        dc = await client._get_dc(client.session.dc_id)
+
+        async def connect():
+            sender = MTProtoSender(client.session.auth_key, loggers=client._log)
+            await sender.connect(client._connection(
+                dc.ip_address, dc.port, dc.id, loggers=client._log, proxy=client._proxy
+            ))
+            return sender
+
+        # The main connection counts as one worker; the rest get their own sender
+        results = await asyncio.gather(*(connect() for _ in range(self.workers - 1)), return_exceptions=True)
+        self.senders = [r for r in results if not isinstance(r, BaseException)]
+        if len(self.senders) < len(results):
+            logger.warning(f"Only {len(self.senders) + 1}/{self.workers} upload connections opened")
+        return self
+
+    async def send_part(self, worker, file_id, index, total, data, is_big):
+        from telethon.tl.functions.upload import SaveBigFilePartRequest, SaveFilePartRequest
+        if is_big:
+            request = SaveBigFilePartRequest(file_id, index, total, data)
+        else:
+            request = SaveFilePartRequest(file_id, index, data)
+        if worker == 0 or not self.senders:
+            return await self.client(request)
+        return await self.senders[(worker - 1) % len(self.senders)].send(request)
+
+    async def __aexit__(self, *exc):
+        await asyncio.gather(*(s.disconnect() for s in self.senders), return_exceptions=True)
+
+
+class PyrogramTransport:
+    """Media sessions to the client's DC, as Pyrogram's own save_file opens them."""
+
+    def __init__(self, client, workers):
+        self.client = client
+        self.workers = workers
+        self.sessions = []
+        self.label = "userbot" if getattr(client, "bot_token", None) is None else "bot"
+        # Set by Client.start(), as Pyrogram's own size check relies on
+        self.max_parts = max_parts_for(getattr(client, "me", None))
+
+    async def __aenter__(self):
+        from pyrogram.session import Session
+        client = self.client
+        dc_id = await client.storage.dc_id()
+        auth_key = await client.storage.auth_key()
+        test_mode = await client.storage.test_mode()
+
+        async def connect():
+            session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+            await session.start()
+            return session
+
+        results = await asyncio.gather(*(connect() for _ in range(self.workers)), return_exceptions=True)
+        self.sessions = [r for r in results if not isinstance(r, BaseException)]
+        if not self.sessions:
+            raise results[0]
+        return self
+
+    async def send_part(self, worker, file_id, index, total, data, is_big):
+        from pyrogram import raw
+        if is_big:
+            query = raw.functions.upload.SaveBigFilePart(
+                file_id=file_id, file_part=index, file_total_parts=total, bytes=data
+            )
+        else:
+            query = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=index, bytes=data)
+        return await self.sessions[worker % len(self.sessions)].invoke(query)
+
+    async def __aexit__(self, *exc):
+        await asyncio.gather(*(s.stop() for s in self.sessions), return_exceptions=True)
+
+
+async def telethon_upload(client, path, progress=None, name=None):
+    """Drop-in for client.upload_file: returns InputFile / InputFileBig for send_file."""
+    from telethon.tl.types import InputFile, InputFileBig
+    file_id, total, is_big, file_name = await upload_parts(
+        functools.partial(TelethonTransport, client), path, progress
+    )
+    file_name = name or file_name
+    if is_big:
+        return InputFileBig(file_id, total, file_name)
+    return InputFile(file_id, total, file_name, "")
+
+
+async def pyrogram_save_file(client, path, file_id=None, file_part=0, progress=None, progress_args=()):
+    """Replacement for pyrogram.Client.save_file with the same signature and return types."""
+    from pyrogram import raw
+    if path is None:
+        return None
+    file_id, total, is_big, name = await upload_parts(
+        functools.partial(PyrogramTransport, client), path, progress, progress_args,
+        file_id=file_id, start_part=file_part
+    )
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=total, name=name)
+    return raw.types.InputFile(id=file_id, parts=total, name=name, md5_checksum="")
+
+
+def install_pyrogram_uploader(client):
+    """Route every Pyrogram send_* upload of `client` through pyrogram_save_file."""
+    client.save_file = functools.partial(pyrogram_save_file, client)
+    return client
@@ -0,0 +1,158 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+"""Pool of premium userbot sessions shared by every job that needs one.
+
+Work goes to the least loaded healthy session, preferring one homed on the DC
+that stores the media. Sessions in a FloodWait cool down, sessions with repeated
+network failures are rested with a growing backoff, and sessions whose
+authorization is gone are dropped for good.
+"""
+
+import logging
+import time
+from config import USERBOT_FAIL_LIMIT, USERBOT_BACKOFF
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+USERBOT_JOBS = REGISTRY.gauge("spybot_userbot_jobs", "Jobs currently using each userbot session.", ["session"])
+USERBOT_AVAILABLE = REGISTRY.gauge("spybot_userbot_available", "Userbot sessions currently in rotation.")
+USERBOT_ERRORS = REGISTRY.counter("spybot_userbot_errors_total", "Userbot session errors by kind.", ["session", "kind"])
+
+MAX_BACKOFF = 1800
+NETWORK_ERRORS = (OSError, TimeoutError, ConnectionError)
+
+
+def media_dc(media):
+    """DC id stored in a Pyrogram media object's file_id, or None."""
+    file_id = getattr(media, "file_id", None)
+    if not file_id:
+        return None
+    try:
+        from pyrogram.file_id import FileId
+        return FileId.decode(file_id).dc_id
+    except Exception:
+        return None
+
+
+def _flood_seconds(error):
+    if "FloodWait" in type(error).__name__ or "FloodPremiumWait" in type(error).__name__:
+        seconds = getattr(error, "value", None) or getattr(error, "seconds", None) or 0
+        return seconds if isinstance(seconds, (int, float)) else 0
+    return None
+
+
+class Member:
+    __slots__ = ("client", "name", "dc_id", "jobs", "last_used", "cooldown_until", "failures", "strikes",
+                 "rested_until", "dead")
+
+    def __init__(self, client, name, dc_id):
+        self.client = client
+        self.name = name
+        self.dc_id = dc_id
+        self.jobs = 0
+        self.last_used = 0.0
+        self.cooldown_until = 0.0
+        self.failures = 0
+        self.strikes = 0
+        self.rested_until = 0.0
+        self.dead = False
+
+    def in_rotation(self, now):
+        return not self.dead and self.rested_until <= now
+
+
+class UserbotPool:
+    def __init__(self):
+        self.members = []
+        self._by_client = {}
+
+    def __len__(self):
+        return len(self.members)
+
+    def __bool__(self):
+        return bool(self.members)
+
+    async def add(self, client):
+        """Put a started Pyrogram client into rotation and watch its requests for errors."""
+        try:
+            dc_id = await client.storage.dc_id()
+        except Exception:
+            dc_id = None
+        member = Member(client, f"userbot{len(self.members) + 1}", dc_id)
+        self.members.append(member)
+        self._by_client[id(client)] = member
+        original = client.invoke
+
+        async def invoke(*args, **kwargs):
+            try:
+                result = await original(*args, **kwargs)
+            except Exception as e:
+                self._failed(member, e)
+                raise
+            member.failures = 0
+            member.strikes = 0
+            return result
+
+        client.invoke = invoke
+        self._publish()
+        return member
+
+    def member(self, client):
+        return self._by_client.get(id(client))
+
+    def acquire(self, dc_id=None):
+        """Least loaded usable client (or None); hand it back with release().
+
+        Sessions in a FloodWait are only used when every session is cooling
+        down, and then the one that frees up first is taken.
+        """
+        now = time.monotonic()
+        candidates = [m for m in self.members if m.in_rotation(now)]
+        if not candidates:
+            return None
+        member = min(candidates, key=lambda m: (
+            max(m.cooldown_until - now, 0), dc_id is not None and m.dc_id != dc_id, m.jobs, m.last_used
+        ))
+        member.jobs += 1
+        member.last_used = now
+        USERBOT_JOBS.set(member.jobs, session=member.name)
+        return member.client
+
+    def release(self, client):
+        """Return a client from acquire(); clients that are not pool members are ignored."""
+        member = self.member(client) if client is not None else None
+        if member is None or member.jobs == 0:
+            return
+        member.jobs -= 1
+        USERBOT_JOBS.set(member.jobs, session=member.name)
+
+    def _failed(self, member, error):
+        now = time.monotonic()
+        seconds = _flood_seconds(error)
+        if seconds is not None:
+            member.cooldown_until = max(member.cooldown_until, now + seconds)
+            USERBOT_ERRORS.inc(session=member.name, kind="flood_wait")
+            logger.warning(f"{member.name} is in a {seconds}s FloodWait")
+        elif getattr(error, "CODE", None) == 401:
+            # AUTH_KEY_UNREGISTERED, SESSION_REVOKED, USER_DEACTIVATED...: the session will not come back
+            member.dead = True
+            USERBOT_ERRORS.inc(session=member.name, kind="unauthorized")
+            logger.error(f"{member.name} lost its authorization and was removed from rotation: {error}")
+        elif isinstance(error, NETWORK_ERRORS):
+            member.failures += 1
+            USERBOT_ERRORS.inc(session=member.name, kind="network")
+            if member.failures >= USERBOT_FAIL_LIMIT:
+                rest = min(USERBOT_BACKOFF * 2 ** member.strikes, MAX_BACKOFF)
+                member.strikes += 1
+                member.failures = 0
+                member.rested_until = now + rest
+                logger.warning(f"{member.name} failed {USERBOT_FAIL_LIMIT} times in a row; resting it for {rest}s")
+        # Other RPC errors (bad peer, missing message...) say nothing about the session itself
+        self._publish()
+
+    def _publish(self):
+        now = time.monotonic()
+        USERBOT_AVAILABLE.set(sum(1 for m in self.members if m.in_rotation(now)))
@@ -0,0 +1,112 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from config import INFO_CACHE_TTL, INFO_CACHE_SIZE
+from utils.metrics import cache_result
+
+YOUTUBE_ID = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/|youtube-nocookie\.com/embed/)'
+    r'([A-Za-z0-9_-]{11})'
+)
+INSTAGRAM_ID = re.compile(r'instagram\.com/(?:[^/?#]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)')
+TRACKING_PARAMS = {'si', 'feature', 'igshid', 'igsh', 'fbclid', 'gclid', 'pp', 'ref', 'ref_src'}
+EXPIRE_IN_URL = re.compile(r'(?:[?&]expire=|/expire/)(\d{9,})')
+EXPIRY_MARGIN = 120
+
+
+def canonical_key(url: str) -> tuple:
+    """(extractor, id) for known sites; otherwise the URL minus tracking noise."""
+    match = YOUTUBE_ID.search(url)
+    if match:
+        return 'youtube', match.group(1)
+    match = INSTAGRAM_ID.search(url)
+    if match:
+        return 'instagram', match.group(1)
+
+    parts = urlsplit(url.strip() if '://' in url else f'https://{url.strip()}')
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith('utm_')
+    ]
+    normalized = urlunsplit(('https', host, parts.path.rstrip('/'), urlencode(sorted(query)), ''))
+    return 'generic', normalized
+
+
+def _earliest_expiry(info: dict):
+    """Smallest `expire` timestamp embedded in the selected format URLs, if any."""
+    formats = info.get('requested_formats') or [info]
+    expiries = []
+    for fmt in formats:
+        match = EXPIRE_IN_URL.search(fmt.get('url') or '')
+        if match:
+            expiries.append(int(match.group(1)))
+    return min(expiries) if expiries else None
+
+
+class InfoCache:
+    """Short-lived LRU of extracted info dicts keyed by canonical_key()."""
+
+    def __init__(self, ttl=INFO_CACHE_TTL, max_size=INFO_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            stored_at, info = entry
+            expiry = _earliest_expiry(info)
+            if now - stored_at > self.ttl or (expiry and expiry - EXPIRY_MARGIN < now):
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+        # yt-dlp mutates the dict it downloads, so every caller gets its own copy
+        return copy.deepcopy(info)
+
+    def put(self, key, info):
+        if not self.ttl or not info or info.get('_type', 'video') != 'video':
+            return
+        try:
+            snapshot = copy.deepcopy(info)
+        except TypeError:
+            # Some extractors leave generators in the info (lazy fragments); not reusable
+            return
+        with self._lock:
+            self._items[key] = (time.time(), snapshot)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+info_cache = InfoCache()
+
+
+async def extract_cached(session, url):
+    """Return the info for `url`, reusing a fresh cached extraction when possible."""
+    key = canonical_key(url)
+    info = info_cache.get(key)
+    cache_result('ytdl_info', info is not None)
+    if info is not None:
+        return info
+    info = await session.extract(url)
+    info_cache.put(key, info)
+    return info
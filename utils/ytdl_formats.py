@@ -0,0 +1,106 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+# Used when the extractor reports no usable sizes: prefer streamable H.264/AAC MP4 and let yt-dlp decide
+FALLBACK_FORMAT = "bv*[vcodec^=avc1]+ba[ext=m4a]/b[ext=mp4]/bv*+ba/b"
+SIZE_MARGIN = 0.97
+
+
+class FormatPlan:
+    __slots__ = ("spec", "size", "height", "streamable")
+
+    def __init__(self, spec, size=0, height=None, streamable=False):
+        self.spec = spec
+        self.size = size
+        self.height = height
+        self.streamable = streamable
+
+    def __repr__(self):
+        return f"FormatPlan({self.spec!r}, size={self.size}, height={self.height}, streamable={self.streamable})"
+
+
+def _size(fmt, duration):
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return size
+    if fmt.get("tbr") and duration:
+        return int(fmt["tbr"] * 1000 / 8 * duration)
+    return 0
+
+
+def _video_rank(fmt):
+    """Telegram streams H.264 best; HEVC/AV1/VP9 play in most clients once in MP4."""
+    vcodec = (fmt.get("vcodec") or "").lower()
+    if vcodec.startswith(("avc1", "h264")):
+        return 2
+    if vcodec.startswith(("hvc1", "hev1", "h265", "av01", "vp9", "vp09")):
+        return 1
+    return 0
+
+
+def _audio_rank(fmt):
+    acodec = (fmt.get("acodec") or "").lower()
+    if acodec.startswith(("mp4a", "aac")):
+        return 2
+    if acodec.startswith(("opus", "mp3")):
+        return 1
+    return 0
+
+
+def _has_video(fmt):
+    # Unknown codecs (None) are common for generic extractors' muxed files
+    return fmt.get("vcodec") != "none"
+
+
+def _has_audio(fmt):
+    return fmt.get("acodec") != "none"
+
+
+def plan_format(info, max_bytes):
+    """Pick the best video+audio combination that fits in `max_bytes`, favouring streamable codecs.
+
+    Candidates are ordered by codec compatibility, then resolution, fps and bitrate,
+    so an oversized top quality falls back to the next one down instead of failing.
+    Returns a FormatPlan; its spec is FALLBACK_FORMAT when sizes are unknown.
+    """
+    formats = [f for f in info.get("formats") or () if f.get("format_id") and f.get("protocol") != "mhtml"]
+    duration = info.get("duration") or 0
+    limit = max_bytes * SIZE_MARGIN
+
+    videos = [f for f in formats if _has_video(f) and not _has_audio(f)]
+    audios = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    muxed = [f for f in formats if _has_video(f) and _has_audio(f)]
+
+    candidates = []
+    for video in videos:
+        vsize = _size(video, duration)
+        for audio in audios:
+            asize = _size(audio, duration)
+            if not vsize or not asize:
+                continue
+            rank = min(_video_rank(video), _audio_rank(audio))
+            candidates.append((
+                (rank, video.get("height") or 0, video.get("fps") or 0, video.get("tbr") or 0, _audio_rank(audio),
+                 audio.get("abr") or audio.get("tbr") or 0),
+                vsize + asize, f"{video['format_id']}+{audio['format_id']}", video.get("height"),
+            ))
+    for fmt in muxed:
+        size = _size(fmt, duration)
+        if not size:
+            continue
+        rank = min(_video_rank(fmt), _audio_rank(fmt))
+        candidates.append((
+            (rank, fmt.get("height") or 0, fmt.get("fps") or 0, fmt.get("tbr") or 0, _audio_rank(fmt), 0),
+            size, fmt["format_id"], fmt.get("height"),
+        ))
+
+    fitting = [c for c in candidates if c[1] <= limit]
+    if not fitting:
+        if candidates:
+            # Everything known is too big: take the smallest so the caller can still split it
+            key, size, spec, height = min(candidates, key=lambda c: c[1])
+            return FormatPlan(spec, size, height, key[0] == 2)
+        return FormatPlan(FALLBACK_FORMAT)
+    key, size, spec, height = max(fitting, key=lambda c: c[0])
+    return FormatPlan(spec, size, height, key[0] == 2)
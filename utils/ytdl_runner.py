@@ -0,0 +1,276 @@
+# Copyright (c) 2025 devgagan : https://github.com/devgaganin.
+# Licensed under the GNU General Public License v3.0.
+# See LICENSE file in the repository root for full license text.
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    YTDL_PROCESS_POOL, YTDL_EXTRACT_TIMEOUT, YTDL_DOWNLOAD_TIMEOUT, YTDL_MEMORY_LIMIT_MB,
+    YTDL_WORKERS, YTDL_EXTRACT_LIMIT
+)
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+YTDL_KILLED = REGISTRY.counter("spybot_ytdl_killed_total", "yt-dlp worker processes killed by reason.", ["reason"])
+
+PROGRESS_KEYS = (
+    "status", "downloaded_bytes", "total_bytes", "total_bytes_estimate",
+    "speed", "eta", "elapsed", "filename", "fragment_index", "fragment_count",
+)
+PROGRESS_INTERVAL = 0.5
+
+thread_pool = ThreadPoolExecutor(max_workers=max(YTDL_EXTRACT_LIMIT, YTDL_WORKERS) + 1)
+
+
+class YtdlError(Exception):
+    pass
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run blocking yt-dlp work on the bounded ytdl pool instead of the default executor."""
+    return await asyncio.get_running_loop().run_in_executor(thread_pool, lambda: func(*args, **kwargs))
+
+
+def _progress_subset(d):
+    return {k: d.get(k) for k in PROGRESS_KEYS if d.get(k) is not None}
+
+
+class ThreadSession:
+    """One YoutubeDL instance driven from the bounded thread pool."""
+
+    def __init__(self, opts, progress=None):
+        import yt_dlp
+        self._loop = asyncio.get_running_loop()
+        opts = dict(opts)
+        if progress:
+            opts['progress_hooks'] = list(opts.get('progress_hooks') or []) + [self._hook]
+        self._progress = progress
+        self.ydl = yt_dlp.YoutubeDL(opts)
+
+    def _hook(self, d):
+        # Called on the worker thread; hand a plain dict to the loop
+        self._loop.call_soon_threadsafe(self._progress, _progress_subset(d))
+
+    async def extract(self, url):
+        return await run_blocking(self.ydl.extract_info, url, download=False)
+
+    async def download(self, info, format_spec=None):
+        if format_spec:
+            # The selector is built once in YoutubeDL.__init__, so swap it rather than params['format']
+            self.ydl.format_selector = self.ydl.build_format_selector(format_spec)
+        return await run_blocking(self.ydl.process_ie_result, info, download=True)
+
+    async def close(self):
+        self.ydl.close()
+
+
+def _child_main(conn, memory_limit_mb):
+    """Entry point of a long-lived yt-dlp worker process; serves one session after another."""
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            pass
+    import yt_dlp
+
+    while True:
+        try:
+            command, payload = conn.recv()
+        except (EOFError, OSError):
+            return
+        if command != "open" or not _serve_session(conn, yt_dlp, payload):
+            return
+
+
+def _serve_session(conn, yt_dlp, opts):
+    """Serve one YoutubeDL session; False once the parent has closed its end of the pipe."""
+    last = {"t": 0.0, "status": None}
+
+    def hook(d):
+        now = time.monotonic()
+        if d.get("status") == last["status"] and now - last["t"] < PROGRESS_INTERVAL:
+            return
+        last["t"], last["status"] = now, d.get("status")
+        conn.send(("progress", _progress_subset(d)))
+
+    opts = dict(opts)
+    opts["progress_hooks"] = [hook]
+    info = None
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        while True:
+            try:
+                command, payload = conn.recv()
+            except (EOFError, OSError):
+                return False
+            try:
+                if command == "extract":
+                    info = ydl.extract_info(payload, download=False)
+                    conn.send(("result", ydl.sanitize_info(info)))
+                elif command == "download":
+                    # A cached extraction from the parent replaces the info this child never extracted
+                    cached_info, format_spec = payload
+                    if format_spec:
+                        ydl.format_selector = ydl.build_format_selector(format_spec)
+                    result = ydl.process_ie_result(cached_info if cached_info is not None else info, download=True)
+                    conn.send(("result", ydl.sanitize_info(result)))
+                else:
+                    return True
+            except BaseException as e:
+                try:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+                except OSError:
+                    return False
+
+
+class _Worker:
+    """One spawned yt-dlp process and the parent's end of its pipe."""
+
+    _ctx = multiprocessing.get_context("spawn")
+
+    def __init__(self):
+        self.conn, child_conn = self._ctx.Pipe()
+        self.process = self._ctx.Process(target=_child_main, args=(child_conn, YTDL_MEMORY_LIMIT_MB), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.sessions = 0
+
+    async def shutdown(self):
+        if self.process.is_alive():
+            try:
+                self.conn.send(("exit", None))
+            except OSError:
+                pass
+            await asyncio.get_running_loop().run_in_executor(thread_pool, self.process.join, 5)
+            if self.process.is_alive():
+                self.process.kill()
+        self.conn.close()
+
+
+class WorkerPool:
+    """Keeps up to `size` idle worker processes for reuse.
+
+    Spawning a Python interpreter and importing yt-dlp costs far more than most
+    extractions, so a session borrows an idle worker and hands it back when it
+    closes. Workers are retired after `max_sessions` sessions to cap memory growth.
+    """
+
+    def __init__(self, size, max_sessions=50):
+        self.size = size
+        self.max_sessions = max_sessions
+        self.idle = []
+
+    def acquire(self):
+        while self.idle:
+            worker = self.idle.pop()
+            if worker.process.is_alive():
+                return worker
+            worker.conn.close()
+        return _Worker()
+
+    async def release(self, worker, reusable):
+        worker.sessions += 1
+        if reusable and worker.process.is_alive() and worker.sessions < self.max_sessions and len(self.idle) < self.size:
+            self.idle.append(worker)
+        else:
+            await worker.shutdown()
+
+
+workers = WorkerPool(max(YTDL_EXTRACT_LIMIT, YTDL_WORKERS))
+
+
+class ProcessSession:
+    """Same interface as ThreadSession, backed by a killable worker process.
+
+    Extraction and download happen in the same worker, so the extractor still
+    runs once; hard timeouts and an address-space limit keep a hung or runaway
+    extractor from affecting the bot. A worker goes back to the pool only if
+    no call was left unanswered, so a late reply can never reach the next session.
+    """
+
+    def __init__(self, opts, progress=None):
+        self._progress = progress
+        self._extracted = False
+        self._busy = False
+        self._worker = workers.acquire()
+        self._process = self._worker.process
+        self._conn = self._worker.conn
+        opts = {k: v for k, v in opts.items() if k != 'progress_hooks'}
+        self._conn.send(("open", opts))
+
+    async def _wait_readable(self, timeout):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self._conn.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, timeout)
+        finally:
+            loop.remove_reader(fd)
+
+    async def _call(self, command, payload, timeout):
+        self._busy = True
+        self._conn.send((command, payload))
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await self._wait_readable(remaining)
+                kind, data = self._conn.recv()
+            except asyncio.TimeoutError:
+                self.kill("timeout")
+                raise YtdlError(f"yt-dlp {command} timed out after {timeout}s")
+            except (EOFError, OSError):
+                self.kill("crash")
+                raise YtdlError(f"yt-dlp worker exited during {command} (exit code {self._process.exitcode})")
+            if kind == "progress":
+                if self._progress:
+                    self._progress(data)
+                continue
+            self._busy = False
+            if kind == "error":
+                if data.startswith("MemoryError"):
+                    self.kill("memory")
+                raise YtdlError(data)
+            return data
+
+    async def extract(self, url):
+        info = await self._call("extract", url, YTDL_EXTRACT_TIMEOUT)
+        self._extracted = True
+        return info
+
+    async def download(self, info, format_spec=None):
+        # After extract() the worker already holds the full info; only ship it when it came from the cache
+        payload = (None if self._extracted else info, format_spec)
+        return await self._call("download", payload, YTDL_DOWNLOAD_TIMEOUT)
+
+    def kill(self, reason):
+        if self._process.is_alive():
+            YTDL_KILLED.inc(reason=reason)
+            self._process.kill()
+
+    async def close(self):
+        worker, self._worker = self._worker, None
+        if worker is None:
+            return
+        reusable = not self._busy and self._process.is_alive()
+        if reusable:
+            try:
+                self._conn.send(("stop", None))
+            except OSError:
+                reusable = False
+        await workers.release(worker, reusable)
+
+
+def open_session(opts, progress=None):
+    """Thread- or process-backed yt-dlp session depending on YTDL_PROCESS_POOL."""
+    if YTDL_PROCESS_POOL:
+        return ProcessSession(opts, progress)
+    return ThreadSession(opts, progress)